@@ -0,0 +1,178 @@
+import queue
+import shlex
+import subprocess
+import threading
+import uuid
+from collections import namedtuple
+
+
+class CommandResult(namedtuple('CommandResult', ['command', 'returncode', 'output'])):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+# First API level with `cmd locale set-app-locales`
+APP_LOCALES_SDK = 33
+
+# Settings that can be part of a device profile: key -> (namespace, settings key)
+SETTINGS_KEYS = {
+    'font_scale': ('system', 'font_scale'),
+    'ui_night_mode': ('secure', 'ui_night_mode'),
+    'user_rotation': ('system', 'user_rotation'),
+}
+
+
+class AdbSession:
+    """
+    One long-lived `adb shell` per device. Commands are written to the shell's stdin and framed with a
+    unique marker that carries their exit status, so many commands can be pipelined over a single
+    connection and each gets a structured CommandResult instead of stdout string matching.
+    """
+
+    def __init__(self, device_id, adb='adb'):
+        self.device_id = device_id
+        self.adb = adb
+        self._process = None
+        self._lines = None
+        self._lock = threading.Lock()
+        self._marker = f"__SUD_{uuid.uuid4().hex}__"
+        self._sdk = None
+
+    def _start(self):
+        self._process = subprocess.Popen([self.adb, '-s', self.device_id, 'shell'],
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT, text=True, bufsize=1)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_lines, args=(self._process, self._lines), daemon=True).start()
+        # Keep stderr ordered with stdout on the device side
+        self._process.stdin.write("exec 2>&1\n")
+        self._process.stdin.flush()
+
+    @staticmethod
+    def _read_lines(process, lines):
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def close(self):
+        if self._process is not None:
+            try:
+                self._process.stdin.write("exit\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=5)
+            except Exception:
+                self._process.kill()
+            self._process = None
+
+    def _send(self, commands):
+        payload = []
+        for command in commands:
+            # The extra echo guarantees the marker starts on its own line; it is stripped again in _receive
+            payload.append(f"{command}\n__sud_rc=$?\necho ''\necho \"{self._marker} $__sud_rc\"\n")
+        self._process.stdin.write(''.join(payload))
+        self._process.stdin.flush()
+
+    def _receive(self, command, timeout):
+        output = []
+        while True:
+            line = self._lines.get(timeout=timeout)
+            if line is None:
+                raise ConnectionError(f"adb shell on {self.device_id} exited")
+            if line.startswith(self._marker):
+                text = ''.join(output)
+                return CommandResult(command, int(line.split()[-1]), text[:-1] if text.endswith('\n') else text)
+            output.append(line)
+
+    def run_batch(self, commands, timeout=60):
+        """
+        Pipeline several shell commands over the session in one round trip.
+
+        :param commands: Shell command strings.
+        :param timeout: Seconds to wait for each command's result.
+        :return: List of CommandResult, returncode -1 when the session broke or timed out.
+        """
+        commands = list(commands)
+        with self._lock:
+            for attempt in range(2):
+                results = []
+                try:
+                    if not self._alive():
+                        self._start()
+                    self._send(commands)
+                    for command in commands:
+                        results.append(self._receive(command, timeout))
+                    return results
+                except (OSError, ConnectionError, queue.Empty) as e:
+                    print(f"adb shell session on {self.device_id} failed: {e}")
+                    if self._process is not None:
+                        self._process.kill()
+                    self._process = None
+                    # Reconnect and retry only when the shell was gone before anything ran
+                    if results or attempt == 1 or isinstance(e, queue.Empty):
+                        break
+            return results + [CommandResult(command, -1, '') for command in commands[len(results):]]
+
+    def run(self, command, timeout=60):
+        return self.run_batch([command], timeout)[0]
+
+    def sdk_level(self):
+        # API level of the device, read once per session object (0 when it cannot be read)
+        if self._sdk is None:
+            result = self.run("getprop ro.build.version.sdk")
+            self._sdk = int(result.output.strip()) if result.ok and result.output.strip().isdigit() else 0
+        return self._sdk
+
+    def supports_app_locales(self):
+        return self.sdk_level() >= APP_LOCALES_SDK
+
+    def apply_settings(self, profile, package_name=None):
+        """
+        Apply a whole settings profile (font_scale, ui_night_mode, user_rotation, locale) in one round trip.
+
+        The locale is applied per app (`cmd locale set-app-locales`, API 33+), so it needs package_name.
+        Older devices keep their system locale, which is how locale modes were captured before.
+
+        :return: True when every setting was applied.
+        """
+        commands = []
+        for key, value in profile.items():
+            if key in SETTINGS_KEYS:
+                namespace, name = SETTINGS_KEYS[key]
+                commands.append(f"cmd settings put {namespace} {name} {shlex.quote(str(value))}")
+            elif key == 'locale':
+                if package_name and not self.supports_app_locales():
+                    print(f"Device {self.device_id} has no per-app locales (API < {APP_LOCALES_SDK}), "
+                          f"keeping its system locale instead of {value}.")
+                elif package_name:
+                    commands.append(f"cmd locale set-app-locales {package_name} --locales {shlex.quote(str(value))}")
+            else:
+                print(f"Unknown setting {key} ignored.")
+        results = self.run_batch(commands)
+        for result in results:
+            if not result.ok:
+                print(f"Failed on device {self.device_id}: {result.command} -> {result.returncode} {result.output}")
+        return all(result.ok for result in results)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(device_id):
+    with _sessions_lock:
+        if device_id not in _sessions:
+            _sessions[device_id] = AdbSession(device_id)
+        return _sessions[device_id]
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
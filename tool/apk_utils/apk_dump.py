@@ -1,7 +1,48 @@
+import argparse
 import subprocess
-import time
 import os
 import csv
+import hashlib
+import shlex
+import tarfile
+
+from adb_session import close_sessions, get_session
+from app_lifecycle import AppLifecycle
+from build_cache import file_digest
+from device_pool import run_device_pool
+from readiness import LATENCIES, wait_for_activity_resumed, wait_for_stable_files
+from run_ledger import RunLedger
+
+# Intent extra read by the SetDiffActivity of a layout-switch APK (see apk_gen.LAYOUT_SWITCH_EXTRA)
+LAYOUT_SWITCH_EXTRA = "sud_layout"
+
+# Files written by SetDiffActivity into /data/data/{package}/files/
+ARTIFACT_NAMES = ['view_tree.txt', 'font.txt', 'screenshot.png']
+# Artifacts every capture writes; font.txt is optional for some layouts and is pulled when it is there
+REQUIRED_ARTIFACTS = ['view_tree.txt', 'screenshot.png']
+# Device-side checksum list sent ahead of the artifacts in a bulk transfer
+CHECKSUM_FILE = '.sud_checksums'
+# SQLite run ledger kept in the generated data directory (job state and artifact checksums)
+LEDGER_FILE = '.sud_ledger.sqlite'
+
+# Upper bounds for the readiness polls that replace the fixed sleeps (seconds)
+UNINSTALL_TIMEOUT = 10
+LAUNCH_TIMEOUT = 20
+ARTIFACT_TIMEOUT = 30
+# A live configuration change that has not produced a new dump by then falls back to a restart
+LIVE_SWITCH_TIMEOUT = 10
+
+# Joins the modes of a single-session job into one device-pool job name, e.g. "1+2.5+rot+ara"
+MULTI_MODE_SEPARATOR = '+'
+
+# Device settings of each capture mode, applied in one round trip over the device's adb shell session
+MODE_PROFILES = {
+    "1": {'font_scale': 1.0, 'ui_night_mode': 1, 'user_rotation': 0},
+    "2.5": {'font_scale': 2.0, 'ui_night_mode': 1, 'user_rotation': 0},
+    "rot": {'user_rotation': 1, 'ui_night_mode': 1, 'font_scale': 1.0},
+    "ara": {'font_scale': 1.0, 'ui_night_mode': 1, 'user_rotation': 0, 'locale': 'ar'},
+    "night": {'font_scale': 1.0, 'ui_night_mode': 2, 'user_rotation': 0},
+}
 
 def list_devices():
     try:
@@ -27,6 +68,8 @@ def adb_root(device_id):
         print(f"Stderr:\n{result.stderr}")
 
         if 'adbd is already running as root' in result.stdout or 'restarting adbd as root' in result.stdout:
+            # Restarting adbd drops any open shell; the next command reconnects
+            get_session(device_id).close()
             return True
         else:
             print(f"Failed to elevate device {device_id} to root.")
@@ -37,13 +80,10 @@ def adb_root(device_id):
 
 def adb_uninstall(device_id, package_name):
     try:
-        uninstall_cmd = ['adb', '-s', device_id, 'uninstall', package_name]
-        print(f"Executing command: {' '.join(uninstall_cmd)}")
-        result = subprocess.run(uninstall_cmd, capture_output=True, text=True)
-        print(f"Stdout:\n{result.stdout}")
-        print(f"Stderr:\n{result.stderr}")
+        result = get_session(device_id).run(f"pm uninstall {package_name}")
+        print(f"Executed: {result.command} -> {result.returncode}\n{result.output}")
 
-        if 'Success' in result.stdout:
+        if result.ok:
             print(f"Successfully uninstalled {package_name} on device {device_id}.")
             return True
         else:
@@ -53,9 +93,10 @@ def adb_uninstall(device_id, package_name):
         print(f"Exception occurred on device {device_id}: {e}")
         return False
 
-def adb_install(device_id, apk_path):
+def adb_install(device_id, apk_path, replace=False):
     try:
-        install_cmd = ['adb', '-s', device_id, 'install', apk_path]
+        # -r replaces an installed package in place, keeping its data
+        install_cmd = ['adb', '-s', device_id, 'install'] + (['-r'] if replace else []) + [apk_path]
         print(f"Executing command: {' '.join(install_cmd)}")
         result = subprocess.run(install_cmd, capture_output=True, text=True)
         print(f"Stdout:\n{result.stdout}")
@@ -91,15 +132,74 @@ def adb_pull(device_id, remote_path, local_path):
         print(f"Exception occurred on device {device_id}: {e}")
         return False
 
-def adb_start_app(device_id, package_name, activity_name):
+def adb_pull_bundle(device_id, remote_dir, names, local_paths):
+    """
+    Stream several files of one directory in a single round trip as a tar over `adb exec-out`,
+    together with their device-side SHA-256 sums, and unpack them straight to local_paths.
+
+    :return: {name: sha256} of the files that arrived intact; missing or corrupt ones are left out.
+    """
+    quoted = ' '.join(shlex.quote(name) for name in names)
+    # stderr is discarded on the device: exec-out has no separate channel and it would corrupt the tar
+    cmd = (f"cd {shlex.quote(remote_dir)} 2>/dev/null && {{ sha256sum {quoted} > {CHECKSUM_FILE} 2>/dev/null; "
+           f"tar -cf - {CHECKSUM_FILE} {quoted} 2>/dev/null; rm -f {CHECKSUM_FILE}; }}")
+    received = {}
+    expected = {}
     try:
-        start_cmd = ['adb', '-s', device_id, 'shell', 'am', 'start', '-n', f"{package_name}/{activity_name}"]
-        print(f"Executing command: {' '.join(start_cmd)}")
-        result = subprocess.run(start_cmd, capture_output=True, text=True)
-        print(f"Stdout:\n{result.stdout}")
-        print(f"Stderr:\n{result.stderr}")
+        print(f"Executing command: adb -s {device_id} exec-out {cmd}")
+        process = subprocess.Popen(['adb', '-s', device_id, 'exec-out', cmd],
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            with tarfile.open(fileobj=process.stdout, mode='r|') as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    source = tar.extractfile(member)
+                    if member.name == CHECKSUM_FILE:
+                        for line in source.read().decode().splitlines():
+                            digest, _, name = line.partition('  ')
+                            expected[os.path.basename(name.strip())] = digest
+                        continue
+                    name = os.path.basename(member.name)
+                    if name not in local_paths:
+                        continue
+                    sha = hashlib.sha256()
+                    tmp_path = local_paths[name] + '.part'
+                    with open(tmp_path, 'wb') as f:
+                        for block in iter(lambda: source.read(1 << 20), b''):
+                            sha.update(block)
+                            f.write(block)
+                    received[name] = (tmp_path, sha.hexdigest())
+        finally:
+            process.stdout.close()
+            process.wait()
+    except (OSError, tarfile.TarError) as e:
+        print(f"Bulk transfer from {device_id}:{remote_dir} failed: {e}")
+
+    verified = {}
+    for name, (tmp_path, digest) in received.items():
+        if expected.get(name) == digest:
+            os.replace(tmp_path, local_paths[name])
+            verified[name] = digest
+        else:
+            print(f"Checksum mismatch for {remote_dir}/{name} from device {device_id}.")
+            os.remove(tmp_path)
+    return verified
 
-        if 'Starting' in result.stdout:
+def adb_start_app(device_id, package_name, activity_name, layout_name=None, restart=False):
+    try:
+        start_cmd = f"am start -n {package_name}/{activity_name}"
+        if restart:
+            # Force-stop the app first so the activity is created (and dumps) again
+            start_cmd = f"am start -S -n {package_name}/{activity_name}"
+        if layout_name:
+            # Layout-switch APK: restart the activity and select the layout through the intent extra
+            start_cmd = f"am start -S -n {package_name}/{activity_name} --es {LAYOUT_SWITCH_EXTRA} {layout_name}"
+        result = get_session(device_id).run(start_cmd)
+        print(f"Executed: {result.command} -> {result.returncode}\n{result.output}")
+
+        # am reports a missing activity or a failed start as "Error: ..." with exit status 0 on older releases
+        if result.ok and 'Error' not in result.output:
             print(f"Successfully started app {package_name} on device {device_id}.")
             return True
         else:
@@ -109,87 +209,107 @@ def adb_start_app(device_id, package_name, activity_name):
         print(f"Exception occurred on device {device_id}: {e}")
         return False
 
-def adb_set_text_scale(device_id, scale):
+def adb_apply_profile(device_id, profile, package_name=None):
     try:
-        # Set text scale
-        scale_cmd = ['adb', '-s', device_id, 'shell', 'cmd', 'settings', 'put', 'system', 'font_scale', str(scale)]
-        print(f"Executing command: {' '.join(scale_cmd)}")
-        scale_result = subprocess.run(scale_cmd, capture_output=True, text=True)
-        print(f"Stdout:\n{scale_result.stdout}")
-        print(f"Stderr:\n{scale_result.stderr}")
-
-        if scale_result.returncode != 0:
-            print(f"Failed to set text scale on device {device_id}.")
-            return False
-
-        # Disable night mode
-        night_mode_cmd = ['adb', '-s', device_id, 'shell', 'cmd', 'settings', 'put', 'secure', 'ui_night_mode', '1']
-        print(f"Executing command: {' '.join(night_mode_cmd)}")
-        night_mode_result = subprocess.run(night_mode_cmd, capture_output=True, text=True)
-        print(f"Stdout:\n{night_mode_result.stdout}")
-        print(f"Stderr:\n{night_mode_result.stderr}")
-
-        if night_mode_result.returncode != 0:
-            print(f"Failed to disable night mode on device {device_id}.")
-            return False
-
-        # Disable auto-rotation
-        rotation_cmd = ['adb', '-s', device_id, 'shell', 'cmd', 'settings', 'put', 'system', 'user_rotation', '0']
-        print(f"Executing command: {' '.join(rotation_cmd)}")
-        rotation_result = subprocess.run(rotation_cmd, capture_output=True, text=True)
-        print(f"Stdout:\n{rotation_result.stdout}")
-        print(f"Stderr:\n{rotation_result.stderr}")
-
-        if rotation_result.returncode != 0:
-            print(f"Failed to disable auto-rotation on device {device_id}.")
-            return False
-
-        print(f"Successfully set text scale to {scale}, disabled night mode, and disabled screen rotation on device {device_id}.")
-        return True
+        if get_session(device_id).apply_settings(profile, package_name):
+            print(f"Successfully applied {profile} on device {device_id}.")
+            return True
+        print(f"Failed to apply {profile} on device {device_id}.")
+        return False
     except Exception as e:
         print(f"Exception occurred on device {device_id}: {e}")
         return False
 
-def adb_set_landscape_mode(device_id):
-    try:
-        # Set device to landscape mode
-        landscape_cmd = ['adb', '-s', device_id, 'shell', 'cmd', 'settings', 'put', 'system', 'user_rotation', '1']
-        print(f"Executing command: {' '.join(landscape_cmd)}")
-        landscape_result = subprocess.run(landscape_cmd, capture_output=True, text=True)
-        print(f"Stdout:\n{landscape_result.stdout}")
-        print(f"Stderr:\n{landscape_result.stderr}")
-
-        if landscape_result.returncode != 0:
-            print(f"Failed to set landscape mode on device {device_id}.")
-            return False
-
-        # Disable night mode
-        night_mode_cmd = ['adb', '-s', device_id, 'shell', 'cmd', 'settings', 'put', 'secure', 'ui_night_mode', '1']
-        print(f"Executing command: {' '.join(night_mode_cmd)}")
-        night_mode_result = subprocess.run(night_mode_cmd, capture_output=True, text=True)
-        print(f"Stdout:\n{night_mode_result.stdout}")
-        print(f"Stderr:\n{night_mode_result.stderr}")
-
-        if night_mode_result.returncode != 0:
-            print(f"Failed to disable night mode on device {device_id}.")
-            return False
-
-        # Set text scale to 1.0
-        scale_cmd = ['adb', '-s', device_id, 'shell', 'cmd', 'settings', 'put', 'system', 'font_scale', '1.0']
-        print(f"Executing command: {' '.join(scale_cmd)}")
-        scale_result = subprocess.run(scale_cmd, capture_output=True, text=True)
-        print(f"Stdout:\n{scale_result.stdout}")
-        print(f"Stderr:\n{scale_result.stderr}")
-
-        if scale_result.returncode != 0:
-            print(f"Failed to set text scale on device {device_id}.")
-            return False
+def adb_set_text_scale(device_id, scale):
+    # Set text scale, disable night mode and disable auto-rotation in one round trip
+    return adb_apply_profile(device_id, {'font_scale': scale, 'ui_night_mode': 1, 'user_rotation': 0})
 
-        print(f"Successfully set landscape mode, disabled night mode, and set text scale to 1.0 on device {device_id}.")
-        return True
-    except Exception as e:
-        print(f"Exception occurred on device {device_id}: {e}")
+def adb_set_landscape_mode(device_id):
+    # Set landscape mode, disable night mode and set text scale to 1.0 in one round trip
+    return adb_apply_profile(device_id, {'user_rotation': 1, 'ui_night_mode': 1, 'font_scale': 1.0})
+
+# Installed-APK bookkeeping shared by all device workers
+APPS = AppLifecycle(adb_install, adb_uninstall, uninstall_timeout=UNINSTALL_TIMEOUT)
+
+def read_switch_layouts(apk_path):
+    """
+    Return the layout names of a layout-switch APK (listed in the .txt written next to it by apk_gen),
+    or None for a regular per-layout APK.
+    """
+    layouts_file = os.path.splitext(apk_path)[0] + '.txt'
+    if not os.path.exists(layouts_file):
+        return None
+    with open(layouts_file) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def apk_captures(apk_path):
+    """
+    :return: [(capture_name, layout_name)] of an APK: one per layout of a layout-switch APK, otherwise
+             just (apk_name, None). The capture name is what artifacts and ledger entries are keyed on.
+    """
+    apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+    switch_layouts = read_switch_layouts(apk_path)
+    if switch_layouts is None:
+        return [(apk_name, None)]
+    project_name = apk_name[:-len('_switch')] if apk_name.endswith('_switch') else apk_name
+    return [(f"{project_name}_{layout}", layout) for layout in switch_layouts]
+
+def remote_artifact_paths(package_name, names=ARTIFACT_NAMES):
+    return [f'/data/data/{package_name}/files/{name}' for name in names]
+
+def wait_for_artifacts(device_id, package_name, timeout=ARTIFACT_TIMEOUT):
+    return wait_for_stable_files(get_session(device_id), remote_artifact_paths(package_name, REQUIRED_ARTIFACTS),
+                                 timeout)
+
+def launch_and_wait(device_id, package_name, activity_name, layout_name=None, restart=False):
+    """
+    Start SetDiffActivity and poll until it is resumed and has written its view tree and screenshot.
+    Stale artifacts of a previous launch are removed first so they cannot satisfy the poll.
+
+    :return: True when the app was started; the waits only log a message when they time out.
+    """
+    session = get_session(device_id)
+    session.run("rm -f " + ' '.join(remote_artifact_paths(package_name)))
+    if not adb_start_app(device_id, package_name, activity_name, layout_name, restart):
         return False
+    wait_for_activity_resumed(session, package_name, activity_name, LAUNCH_TIMEOUT)
+    wait_for_artifacts(device_id, package_name)
+    return True
+
+def switch_mode_live(device_id, mode, package_name, activity_name, layout_name=None):
+    """
+    Move a running SetDiffActivity to another mode without reinstalling or relaunching it: the settings
+    are applied as a configuration change, which recreates the activity so it dumps again. When no new
+    dump shows up within LIVE_SWITCH_TIMEOUT the activity is restarted instead.
+
+    :return: True when fresh artifacts of the new mode were written.
+    """
+    session = get_session(device_id)
+    session.run("rm -f " + ' '.join(remote_artifact_paths(package_name)))
+    if not (apply_mode(device_id, mode) and
+            APPS.set_locale(device_id, package_name, MODE_PROFILES.get(mode, {}).get('locale'))):
+        return False
+    if wait_for_artifacts(device_id, package_name, LIVE_SWITCH_TIMEOUT):
+        return True
+    print(f"No dump after switching {package_name} to mode {mode} on device {device_id}, restarting it.")
+    return launch_and_wait(device_id, package_name, activity_name, layout_name, restart=True)
+
+def pull_artifacts(device_id, package_name, local_prefix):
+    """
+    Pull the artifacts of one capture to {local_prefix}_{filename}: one bulk transfer, with individual
+    pulls for any file that did not arrive intact.
+
+    :return: {filename: (local_path, sha256)}, empty when any of REQUIRED_ARTIFACTS is missing.
+    """
+    remote_dir = f'/data/data/{package_name}/files'
+    local_paths = {name: f"{local_prefix}_{name}" for name in ARTIFACT_NAMES}
+    checksums = adb_pull_bundle(device_id, remote_dir, ARTIFACT_NAMES, local_paths)
+
+    pulled = {name: (local_paths[name], digest) for name, digest in checksums.items()}
+    for name in ARTIFACT_NAMES:
+        if name not in pulled and adb_pull(device_id, f"{remote_dir}/{name}", local_paths[name]):
+            pulled[name] = (local_paths[name], file_digest(local_paths[name]))
+    return pulled if all(name in pulled for name in REQUIRED_ARTIFACTS) else {}
 
 def read_app_info(csv_file):
     try:
@@ -201,7 +321,156 @@ def read_app_info(csv_file):
         print(f"Exception occurred while reading CSV file: {e}")
         return []
 
-def main():
+def capture_switch_apk(device_id, mode, apk_path, layouts, app_info_list, generated_data_dir, ledger):
+    """
+    Install a layout-switch APK once and capture every layout by restarting SetDiffActivity with
+    a different intent extra. Artifacts use the same {mode}_{project}_{layout}_{device}_ naming as
+    the per-layout APKs.
+    """
+    apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+    project_name = apk_name[:-len('_switch')] if apk_name.endswith('_switch') else apk_name
+
+    pending = [layout for layout in layouts if not ledger.is_done(mode, f"{project_name}_{layout}")]
+    if not pending:
+        print(f"Skipping {apk_name} as data already exists.")
+        return True
+
+    captured = False
+    for app_info in app_info_list:
+        package_name = app_info['package_name']
+        activity_name = app_info['activity_name']
+
+        # Skip APK files that do not contain the app_name
+        if app_info['app_name'] not in apk_name:
+            continue
+
+        if not prepare_app(device_id, mode, package_name, apk_path):
+            continue
+        captured = True
+        for layout in pending:
+            capture_name = f"{project_name}_{layout}"
+            ledger.start(mode, capture_name, device_id)
+            if launch_and_wait(device_id, package_name, activity_name, layout):
+                artifacts = pull_artifacts(device_id, package_name,
+                                           os.path.join(generated_data_dir, f"{mode}_{capture_name}_{device_id}"))
+                captured = ledger.finish(mode, capture_name, device_id, artifacts) and captured
+            else:
+                ledger.fail(mode, capture_name, device_id, 'launch failed')
+                captured = False
+    return captured
+
+def apply_mode(device_id, mode):
+    # The per-app locale is applied after install (see capture_apk)
+    profile = {key: value for key, value in MODE_PROFILES.get(mode, {}).items() if key != 'locale'}
+    return adb_apply_profile(device_id, profile) if profile else True
+
+def prepare_app(device_id, mode, package_name, apk_path):
+    # Install only when the APK changed, otherwise just reset the app; then apply the mode's app locale
+    return APPS.prepare(device_id, package_name, apk_path, MODE_PROFILES.get(mode, {}).get('locale'))
+
+def capture_apk(device_id, mode, apk_path, app_info_list, generated_data_dir, ledger):
+    """
+    Install one APK, launch its SetDiffActivity and pull the artifacts of the current mode.
+
+    :param ledger: RunLedger the job state and artifact checksums are recorded in.
+    :return: True when the artifacts were captured (or already existed).
+    """
+    apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+
+    switch_layouts = read_switch_layouts(apk_path)
+    if switch_layouts is not None:
+        return capture_switch_apk(device_id, mode, apk_path, switch_layouts, app_info_list, generated_data_dir, ledger)
+
+    if ledger.is_done(mode, apk_name):
+        return True
+
+    captured = False
+    for app_info in app_info_list:
+        package_name = app_info['package_name']
+        activity_name = app_info['activity_name']
+        app_name = app_info['app_name']
+
+        # Skip APK files that do not contain the app_name
+        if app_name not in apk_name:
+            continue
+
+        ledger.start(mode, apk_name, device_id)
+        if not prepare_app(device_id, mode, package_name, apk_path):
+            ledger.fail(mode, apk_name, device_id, 'install failed')
+        elif not launch_and_wait(device_id, package_name, activity_name):
+            ledger.fail(mode, apk_name, device_id, 'launch failed')
+        else:
+            artifacts = pull_artifacts(device_id, package_name,
+                                       os.path.join(generated_data_dir, f"{mode}_{apk_name}_{device_id}"))
+            captured = ledger.finish(mode, apk_name, device_id, artifacts)
+    return captured
+
+def capture_modes(device_id, modes, package_name, activity_name, capture_name, generated_data_dir, ledger,
+                  layout_name=None):
+    """
+    Capture one screen in several modes from a single app session: launch once in the first pending
+    mode, then switch the remaining modes live. Each mode gets its own {mode}_{capture}_{device}_ artifacts
+    and ledger entry.
+    """
+    captured = True
+    launched = False
+    for mode in modes:
+        if ledger.is_done(mode, capture_name):
+            continue
+        ledger.start(mode, capture_name, device_id)
+        if launched:
+            ready = switch_mode_live(device_id, mode, package_name, activity_name, layout_name)
+        else:
+            ready = apply_mode(device_id, mode) and \
+                APPS.set_locale(device_id, package_name, MODE_PROFILES.get(mode, {}).get('locale')) and \
+                launch_and_wait(device_id, package_name, activity_name, layout_name, restart=True)
+        if not ready:
+            ledger.fail(mode, capture_name, device_id, 'launch failed')
+            captured = False
+            continue
+        launched = True
+        artifacts = pull_artifacts(device_id, package_name,
+                                   os.path.join(generated_data_dir, f"{mode}_{capture_name}_{device_id}"))
+        captured = ledger.finish(mode, capture_name, device_id, artifacts) and captured
+    return captured
+
+def capture_apk_modes(device_id, modes, apk_path, app_info_list, generated_data_dir, ledger):
+    """
+    Single-session variant of capture_apk: install the APK once and capture all modes for it
+    (all layouts of it for a layout-switch APK).
+
+    :return: True when every mode was captured (or already existed).
+    """
+    apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+    captures = [(capture_name, layout) for capture_name, layout in apk_captures(apk_path)
+                if not all(ledger.is_done(mode, capture_name) for mode in modes)]
+    if not captures:
+        print(f"Skipping {apk_name} as data already exists.")
+        return True
+
+    captured = False
+    for app_info in app_info_list:
+        package_name = app_info['package_name']
+        activity_name = app_info['activity_name']
+
+        # Skip APK files that do not contain the app_name
+        if app_info['app_name'] not in apk_name:
+            continue
+
+        # The locale of each mode is set per capture, install with the system locale
+        if not APPS.prepare(device_id, package_name, apk_path):
+            continue
+        captured = True
+        for capture_name, layout in captures:
+            captured = capture_modes(device_id, modes, package_name, activity_name, capture_name,
+                                     generated_data_dir, ledger, layout) and captured
+    return captured
+
+def main(single_session=False):
+    """
+    :param single_session: Capture all modes of an APK in one app session (install and launch once, switch
+                           settings live) instead of one job per mode.
+    """
     # modes = ["1", "2.5", "rot"]  # Modes to run in sequence
     modes = ["ara"]  # Modes to run in sequence
     devices = list_devices()
@@ -225,49 +494,53 @@ def main():
         print("No APK files found in the directory.")
         return
 
-    for device_id in devices:
-        if adb_root(device_id):
-            for mode in modes:
-                if mode == "1":
-                    adb_set_text_scale(device_id, 1.0)
-                elif mode == "2.5":
-                    adb_set_text_scale(device_id, 2.0)
-                elif mode == "rot":
-                    adb_set_landscape_mode(device_id)
-
-                for apk_file in apk_files:
-                    apk_path = os.path.join(apk_directory, apk_file)
-                    apk_name = os.path.splitext(apk_file)[0]
-
-                    # Check if any file in generated_data_dir starts with {mode}_{apk_name}
-                    if any(f.startswith(f"{mode}_{apk_name}") for f in os.listdir(generated_data_dir)):
-                        print(f"Skipping {apk_file} as data already exists.")
-                        continue
-
-                    for app_info in app_info_list:
-                        package_name = app_info['package_name']
-                        activity_name = app_info['activity_name']
-                        app_name = app_info['app_name']
-
-                        # Skip APK files that do not contain the app_name
-                        if app_name not in apk_name:
-                            continue
-
-                        adb_uninstall(device_id, package_name)
-                        time.sleep(4)
-                        if adb_install(device_id, apk_path):
-                            if adb_start_app(device_id, package_name, activity_name):
-                                # Wait for 15 seconds to let the app run
-                                time.sleep(10)
-                                remote_paths = [
-                                    f'/data/data/{package_name}/files/view_tree.txt',
-                                    f'/data/data/{package_name}/files/font.txt',
-                                    f'/data/data/{package_name}/files/screenshot.png'
-                                ]
-                                for remote_path in remote_paths:
-                                    filename = remote_path.split('/')[-1]
-                                    local_path = os.path.join(generated_data_dir, f"{mode}_{apk_name}_{device_id}_{filename}")
-                                    adb_pull(device_id, remote_path, local_path)
+    ledger = RunLedger(os.path.join(generated_data_dir, LEDGER_FILE), ARTIFACT_NAMES, required_names=REQUIRED_ARTIFACTS)
+
+    # One (mode, apk) job per capture; all devices share the queue
+    jobs = []
+    expected = []  # every (mode, capture) of this run, for the pending report
+    for mode in modes:
+        for apk_file in apk_files:
+            apk_path = os.path.join(apk_directory, apk_file)
+            apk_name = os.path.splitext(apk_file)[0]
+
+            # Skip APK files that do not contain any app_name
+            if not any(app_info['app_name'] in apk_name for app_info in app_info_list):
+                continue
+
+            # Layout-switch APKs are checked per layout in capture_switch_apk
+            expected.extend((mode, capture_name) for capture_name, _ in apk_captures(apk_path))
+            if read_switch_layouts(apk_path) is None and ledger.is_done(mode, apk_name):
+                print(f"Skipping {apk_file} as data already exists.")
+                continue
+            jobs.append((mode, apk_path))
+
+    if single_session:
+        # One job per APK covering every mode; the mode settings are applied inside the job
+        apk_paths = list(dict.fromkeys(apk_path for _, apk_path in jobs))
+        run_device_pool(
+            devices, [(MULTI_MODE_SEPARATOR.join(modes), apk_path) for apk_path in apk_paths],
+            run_job=lambda device_id, mode, apk_path: capture_apk_modes(
+                device_id, mode.split(MULTI_MODE_SEPARATOR), apk_path, app_info_list, generated_data_dir, ledger),
+            prepare_device=adb_root)
+    else:
+        run_device_pool(
+            devices, jobs,
+            run_job=lambda device_id, mode, apk_path: capture_apk(device_id, mode, apk_path, app_info_list,
+                                                                  generated_data_dir, ledger),
+            set_mode=apply_mode,
+            prepare_device=adb_root)
+    close_sessions()
+    print(LATENCIES.summary())
+    pending = ledger.pending(expected)
+    print(f"Run ledger: {ledger.summary()}, still pending: {len(pending)}")
+    for mode, capture_name in pending:
+        print(f"  pending: {mode} {capture_name}")
+    ledger.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Capture the view tree and screenshot of every APK in every mode.")
+    parser.add_argument('-single_session', action='store_true',
+                        help="capture all modes of an APK in one app session, switching settings live")
+    args = parser.parse_args()
+    main(single_session=args.single_session)
\ No newline at end of file
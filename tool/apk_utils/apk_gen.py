@@ -1,39 +1,40 @@
+import argparse
 import subprocess
 import os
 import shutil
 import sys
 
-def build_apk(project_directory):
+from build_cache import BuildCache
+from project_index import get_project_index
+
+def build_apk(project_directory, log_path=None):
     """
     在指定的 Android 项目目录中运行 ./gradlew assembleDebug 生成 APK，并输出生成的 APK 文件路径。
 
     :param project_directory: Android 项目根目录的路径
+    :param log_path: 可选，Gradle 输出的日志文件路径
     """
-    # 保存当前工作目录
-    current_dir = os.getcwd()
-
     try:
-        # 切换到 Android 项目目录
-        os.chdir(project_directory)
+        # 在 Android 项目目录中执行 Gradle（不切换进程工作目录，便于多个构建并发执行）
         print(project_directory)
 
         result = subprocess.run(
             ['./gradlew', 'assembleDebug'],
+            cwd=project_directory,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             text=True
         )
 
+        if log_path:
+            with open(log_path, 'w') as log_file:
+                log_file.write(result.stdout)
+
         # 检查命令是否成功执行
         if result.returncode == 0:
             print("APK build succeeded!")
-            # 查找生成的 APK 文件
-            apk_files = []
-            for root, dirs, files in os.walk(project_directory):
-                for file in files:
-                    if file.endswith('.apk') and str(file).__contains__('v8a'):
-                    # if file.endswith('.apk'):
-                        apk_files.append(os.path.join(root, file))
+            # 通过 Gradle 的 output-metadata.json 查找生成的 APK 文件，而不是遍历整个项目
+            apk_files = get_project_index(project_directory).apk_outputs('v8a')
 
             if apk_files:
                 for apk_path in apk_files:
@@ -47,44 +48,18 @@ def build_apk(project_directory):
     except Exception as e:
         print(f"An error occurred: {e}")
 
-    finally:
-        # 切换回原来的工作目录
-        os.chdir(current_dir)
-
 
 def get_layout_files_as_r_layout(project_directory):
     """
     获取指定 Android 项目 res 文件夹下所有 layout 文件，以 R.layout 形式返回。
 
     :param project_directory: Android 项目根目录的路径
-    :return: R.layout 形式的 layout 文件名列表
+    :return: R.layout 形式的 layout 文件名列表（同名的 layout 变体只返回一次）
     """
-    r_layout_files = []
-    res_directory = ''
-
-    # for dirpath, dirnames, _ in os.walk(project_directory):
-    #     for dirname in dirnames:
-    #         print(os.path.join(dirpath, dirname))
-
-    # 在指定目录中找到 res 文件夹
-    for root, dirs, files in os.walk(project_directory):
-        for dir in dirs:
-            dirname = os.path.join(root, dir)
-            if dirname.endswith('/res') and dirname.__contains__('main') and \
-                    res_directory.__contains__("/generated/") == False:
-                res_directory = dirname
-                for root, dirs, files in os.walk(res_directory):
-                    for dir_name in dirs:
-                        if dir_name.startswith('layout') and dir_name.__contains__("menu") == False:
-                            layout_directory = os.path.join(root, dir_name)
-
-                            print(layout_directory)
-                            for file in os.listdir(layout_directory):
-                                if file.endswith('.xml'):
-                                    layout_name = os.path.splitext(file)[0]
-                                    r_layout_files.append(f"R.layout.{layout_name}")
-
-    return r_layout_files
+    index = get_project_index(project_directory)
+    for layout_directory in index.layout_dirs:
+        print(layout_directory)
+    return [f"R.layout.{layout_name}" for layout_name in index.layout_names()]
 
 
 def find_file(project_directory, filename):
@@ -95,10 +70,7 @@ def find_file(project_directory, filename):
     :param filename: 要查找的文件名
     :return: 文件的完整路径，如果未找到则返回 None
     """
-    for root, dirs, files in os.walk(project_directory):
-        if filename in files:
-            return os.path.join(root, filename)
-    return None
+    return get_project_index(project_directory).find_file(filename)
 
 
 def replace_set_content_view_line(file_path, new_set_content_view_line):
@@ -126,36 +98,129 @@ def replace_set_content_view_line(file_path, new_set_content_view_line):
         print(f"An error occurred while modifying {file_path}: {e}")
 
 
-def rename_and_move_apk(apk_path, project_name, layout_name):
+# SetDiffActivity 通过该 intent extra 选择要 inflate 的 layout（layout 切换模式）
+LAYOUT_SWITCH_EXTRA = "sud_layout"
+LAYOUT_SWITCH_BEGIN = "    // BEGIN SetDiff layout switch (generated)"
+LAYOUT_SWITCH_END = "    // END SetDiff layout switch (generated)"
+
+
+def inject_layout_switch(file_path, r_layout_files):
+    """
+    将 SetDiffActivity 改写为根据 intent extra 选择 layout：替换 setContentView 那一行，
+    并在类末尾插入 layout 名称到 R.layout 的映射方法。重复调用时会先移除上一次生成的代码。
+
+    :param file_path: SetDiffActivity.java 的完整路径
+    :param r_layout_files: R.layout 形式的 layout 列表，第一个作为默认 layout
+    :return: 成功时返回 True
+    """
+    try:
+        with open(file_path, 'r') as file:
+            lines = file.readlines()
+
+        # 移除上一次生成的映射方法
+        if any(line.rstrip('\n') == LAYOUT_SWITCH_BEGIN for line in lines):
+            begin = [line.rstrip('\n') for line in lines].index(LAYOUT_SWITCH_BEGIN)
+            end = [line.rstrip('\n') for line in lines].index(LAYOUT_SWITCH_END)
+            lines = lines[:begin] + lines[end + 1:]
+
+        r_layout_files = list(dict.fromkeys(r_layout_files))
+        method = [LAYOUT_SWITCH_BEGIN,
+                  "    private static int setDiffLayout(String name) {",
+                  f"        if (name == null) return {r_layout_files[0]};",
+                  "        switch (name) {"]
+        for r_layout_file in r_layout_files:
+            method.append(f"            case \"{r_layout_file.split('.')[-1]}\": return {r_layout_file};")
+        method += [f"            default: return {r_layout_files[0]};",
+                   "        }",
+                   "    }",
+                   LAYOUT_SWITCH_END]
+
+        # 在类的最后一个右括号之前插入映射方法
+        class_end = max(i for i, line in enumerate(lines) if line.strip().endswith('}'))
+        before_brace = lines[class_end].rstrip()[:-1]
+        lines[class_end:class_end + 1] = ([before_brace + '\n'] if before_brace.strip() else []) + \
+            [line + '\n' for line in method] + ['}\n']
+
+        with open(file_path, 'w') as file:
+            for line in lines:
+                if 'setContentView' in line:
+                    file.write(f"setContentView(setDiffLayout(getIntent().getStringExtra(\"{LAYOUT_SWITCH_EXTRA}\")));\n")
+                else:
+                    file.write(line)
+
+        print(f"Injected layout switch for {len(r_layout_files)} layouts into {file_path}.")
+        return True
+
+    except Exception as e:
+        print(f"An error occurred while modifying {file_path}: {e}")
+        return False
+
+
+def generate_layout_switch_apk(project_directory, file_path, r_layout_files, temp_directory=None):
+    """
+    只构建一次 APK：SetDiffActivity 根据 intent extra 选择 layout，并在 APK 旁写出 layout 列表，
+    供 apk_dump 通过 am start --es 逐个启动。
+
+    :param project_directory: Android 项目根目录的路径
+    :param file_path: SetDiffActivity.java 的完整路径
+    :param r_layout_files: R.layout 形式的 layout 列表
+    :param temp_directory: 可选，APK 输出文件夹
+    :return: 生成的 APK 路径，失败时返回 None
+    """
+    project_name = os.path.basename(os.path.normpath(project_directory))
+    if temp_directory is None:
+        temp_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
+
+    if not inject_layout_switch(file_path, r_layout_files):
+        return None
+    apk_path = build_apk(project_directory)
+    if not apk_path:
+        return None
+    new_apk_path = rename_and_move_apk(apk_path, project_name, 'switch', temp_directory)
+    if new_apk_path:
+        layout_names = dict.fromkeys(r_layout_file.split('.')[-1] for r_layout_file in r_layout_files)
+        with open(os.path.splitext(new_apk_path)[0] + '.txt', 'w') as layouts_file:
+            for layout_name in layout_names:
+                layouts_file.write(layout_name + '\n')
+    return new_apk_path
+
+
+def rename_and_move_apk(apk_path, project_name, layout_name, temp_directory=None):
     """
     重命名 APK 文件为项目名称和 layout 名称的组合，并将其移动到 Python 根目录下的 temp 文件夹。
 
     :param apk_path: 原始 APK 文件路径
     :param project_name: 项目名称
     :param layout_name: layout 名称
+    :param temp_directory: 可选，目标文件夹，默认为 Python 根目录下的 temp 文件夹
+    :return: 新的 APK 文件路径，失败时返回 None
     """
     try:
-        # 获取项目名称
-        project_name = os.path.basename(os.path.normpath(project_dir))
+        if temp_directory is None:
+            # 获取 Python 根目录
+            python_root_directory = os.path.dirname(os.path.abspath(__file__))
 
-        # 获取 Python 根目录
-        python_root_directory = os.path.dirname(os.path.abspath(__file__))
-
-        # temp 文件夹路径
-        temp_directory = os.path.join(python_root_directory, 'temp')
+            # temp 文件夹路径
+            temp_directory = os.path.join(python_root_directory, 'temp')
 
         # 新的 APK 文件名和路径
         new_apk_name = f"{project_name}_{layout_name}.apk"
         new_apk_path = os.path.join(temp_directory, new_apk_name)
 
-        # 移动并重命名 APK 文件
-        os.rename(apk_path, new_apk_path)
+        # 移动并重命名 APK 文件（工作副本可能位于其他文件系统上）
+        shutil.move(apk_path, new_apk_path)
 
         print(f"APK renamed and moved to: {new_apk_path}")
+        return new_apk_path
     except Exception as e:
         print(f"An error occurred while renaming and moving APK: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the APKs of every layout of an app project.")
+    parser.add_argument('-layout_switch', action='store_true',
+                        help="build one APK that switches layouts through an intent extra")
+    args = parser.parse_args()
+
     project_dir = "/Users/h/Documents/GitHub/setdiff_dataset/LibreTube"
 
     # 获取项目名称
@@ -183,17 +248,32 @@ if __name__ == "__main__":
     # 查找 SetDiffActivity.java 文件
     target_file = "SetDiffActivity.java"
     file_path = find_file(project_dir, target_file)
-    if file_path:
+    # -layout_switch：只构建一个通过 intent extra 切换 layout 的 APK，而不是每个 layout 构建一次
+    if file_path and args.layout_switch:
+        generate_layout_switch_apk(project_dir, file_path, r_layout_files, temp_directory)
+    elif file_path:
+        # 项目、layout 和 setContentView 都没有变化时直接复用缓存的 APK
+        build_cache = BuildCache()
+        tree_digest, file_digests = build_cache.project_digests(project_dir, file_path)
+
         # 替换 setContentView 的那一行
         for set_content_view_line in set_content_view_lines:
             layout_name = set_content_view_line.split('(')[1].split(')')[0].split('.')[-1]
+            cache_key = BuildCache.make_key(tree_digest, file_digests, layout_name, set_content_view_line)
+            if build_cache.fetch(cache_key, os.path.join(temp_directory, f"{project_name}_{layout_name}.apk")):
+                continue
             replace_set_content_view_line(file_path, set_content_view_line)
             print(f"Found {target_file} at: {file_path}")
             # 生成 APK
             apk_path = build_apk(project_dir)
             if apk_path:
                 # 重命名 APK 文件
-                rename_and_move_apk(apk_path, project_name, layout_name)
+                new_apk_path = rename_and_move_apk(apk_path, project_name, layout_name)
+                if new_apk_path:
+                    build_cache.store(cache_key, new_apk_path, layout_name)
                 # exit(0)
+
+        build_cache.save()
+        print(build_cache.summary())
     else:
         print(f"{target_file} not found in the project.")
\ No newline at end of file
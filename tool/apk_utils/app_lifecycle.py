@@ -0,0 +1,121 @@
+import os
+import shlex
+import threading
+
+from adb_session import get_session
+from build_cache import file_digest
+from readiness import wait_for_uninstalled
+
+
+class AppLifecycle:
+    """
+    Keeps track of which APK (by SHA-256) is installed for each (device, package) so repeated captures
+    reuse the installation: identical APKs are only reset, changed ones are replaced in place and a full
+    uninstall is the fallback when the in-place replacement is refused (e.g. a signature change).
+    """
+
+    def __init__(self, install, uninstall, reset='clear', uninstall_timeout=10):
+        """
+        :param install: Callable(device_id, apk_path, replace) -> bool.
+        :param uninstall: Callable(device_id, package_name) -> bool.
+        :param reset: 'clear' (pm clear, wipes app data) or 'force-stop' (am force-stop) between captures.
+        """
+        self.install = install
+        self.uninstall = uninstall
+        self.reset = reset
+        self.uninstall_timeout = uninstall_timeout
+        self._installed = {}   # (device_id, package_name) -> apk digest
+        self._locales = {}     # (device_id, package_name) -> app locale set by us
+        self._digests = {}     # apk_path -> (size, mtime_ns, digest)
+        self._lock = threading.Lock()
+
+    def apk_digest(self, apk_path):
+        st = os.stat(apk_path)
+        with self._lock:
+            known = self._digests.get(apk_path)
+            if known and known[:2] == (st.st_size, st.st_mtime_ns):
+                return known[2]
+        digest = file_digest(apk_path)
+        with self._lock:
+            self._digests[apk_path] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def _device_digest(self, device_id, package_name):
+        # The installed base.apk is a byte-for-byte copy of the APK that was installed. When the package is
+        # not installed the path is empty, and a bare sha256sum would read (and swallow) the session's stdin.
+        result = get_session(device_id).run(
+            f"p=$(pm path {package_name} | head -n 1 | cut -d: -f2); "
+            f"[ -n \"$p\" ] && sha256sum \"$p\" </dev/null 2>/dev/null")
+        return result.output.split()[0] if result.ok and result.output.strip() else None
+
+    def _reset_app(self, device_id, package_name):
+        command = f"pm clear {package_name}" if self.reset == 'clear' else f"am force-stop {package_name}"
+        result = get_session(device_id).run(command)
+        if not result.ok:
+            print(f"Failed to reset {package_name} on device {device_id}: {result.output}")
+        return result.ok
+
+    def _apply_locale(self, device_id, package_name, locale):
+        key = (device_id, package_name)
+        # Always set a requested locale; only reset when we changed it earlier
+        if locale is None and self._locales.get(key) is None:
+            return True
+        session = get_session(device_id)
+        if not session.supports_app_locales():
+            # Before API 33 there are no per-app locales: capture with the device's system locale, as before
+            if locale is not None:
+                print(f"Device {device_id} has no per-app locales, capturing {package_name} "
+                      f"with its system locale instead of {locale}.")
+            return True
+        result = session.run(
+            f"cmd locale set-app-locales {package_name} --locales {shlex.quote(locale or '')}")
+        if not result.ok:
+            print(f"Failed to set locale {locale} for {package_name} on device {device_id}: {result.output}")
+            return False
+        self._locales[key] = locale
+        return True
+
+    def prepare(self, device_id, package_name, apk_path, locale=None):
+        """
+        Make sure apk_path is installed on the device with fresh app state.
+
+        :param locale: Per-app locale for this capture, None for the system locale.
+        :return: True when the app is ready to be launched.
+        """
+        key = (device_id, package_name)
+        digest = self.apk_digest(apk_path)
+
+        if key not in self._installed:
+            self._installed[key] = self._device_digest(device_id, package_name)
+
+        if self._installed[key] == digest:
+            print(f"{apk_path} already installed on device {device_id}, resetting {package_name}.")
+        else:
+            self._installed.pop(key, None)
+            if not self.install(device_id, apk_path, replace=True):
+                # In-place replacement refused, start from a clean install
+                if self.uninstall(device_id, package_name):
+                    wait_for_uninstalled(get_session(device_id), package_name, self.uninstall_timeout)
+                self._locales.pop(key, None)
+                if not self.install(device_id, apk_path, replace=False):
+                    return False
+            self._installed[key] = digest
+
+        # A replaced APK keeps the data of the previous one, so reset in both cases
+        if not self._reset_app(device_id, package_name):
+            return False
+        return self._apply_locale(device_id, package_name, locale)
+
+    def set_locale(self, device_id, package_name, locale):
+        """
+        Switch the per-app locale of an installed app, e.g. between the modes of one app session.
+        """
+        return self._apply_locale(device_id, package_name, locale)
+
+    def forget(self, device_id):
+        """
+        Drop what is known about a device, e.g. after it was restarted or wiped.
+        """
+        for key in [key for key in self._installed if key[0] == device_id]:
+            self._installed.pop(key, None)
+            self._locales.pop(key, None)
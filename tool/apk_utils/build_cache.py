@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from project_index import get_project_index
+
+
+def file_digest(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class BuildCache:
+    """
+    Content-addressed cache of per-layout APKs.
+
+    An APK is keyed on the hash of the project tree (without the mutated activity source), the
+    target layout files and the generated setContentView line. Entries are evicted least recently
+    used first once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_directory=None, max_bytes=20 * 1024 ** 3):
+        if cache_directory is None:
+            cache_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+        self.cache_directory = cache_directory
+        self.objects_directory = os.path.join(cache_directory, 'objects')
+        self.index_path = os.path.join(cache_directory, 'index.json')
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_directory, exist_ok=True)
+
+        self.entries = {}
+        self.file_digests = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path) as f:
+                    index = json.load(f)
+                self.entries = index.get('entries', {})
+                self.file_digests = index.get('file_digests', {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable build cache index {self.index_path}: {e}")
+
+    def _cached_digest(self, file_path):
+        # Re-hash a file only when its size or mtime changed since the last run
+        st = os.stat(file_path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        known = self.file_digests.get(file_path)
+        if known and known[:2] == stamp:
+            return known[2]
+        digest = file_digest(file_path)
+        self.file_digests[file_path] = stamp + [digest]
+        return digest
+
+    def project_digests(self, project_directory, excluded_file=None):
+        """
+        Hash the project tree once per run.
+
+        :param project_directory: Path to the Android project root.
+        :param excluded_file: The activity source that is rewritten for every layout.
+        :return: (tree digest, {relative path: file digest})
+        """
+        digests = {}
+        for rel_path in get_project_index(project_directory).files:
+            file_path = os.path.join(project_directory, rel_path)
+            if excluded_file and os.path.abspath(file_path) == os.path.abspath(excluded_file):
+                continue
+            if not os.path.isfile(file_path):
+                continue
+            digests[rel_path] = self._cached_digest(file_path)
+
+        sha = hashlib.sha256()
+        for rel_path in sorted(digests):
+            sha.update(f"{rel_path}\0{digests[rel_path]}\n".encode())
+
+        if excluded_file:
+            # Everything but the setContentView line, which is part of the key on its own
+            with open(excluded_file) as f:
+                for line in f:
+                    if 'setContentView' not in line:
+                        sha.update(line.encode())
+        return sha.hexdigest(), digests
+
+    @staticmethod
+    def make_key(tree_digest, file_digests, layout_name, set_content_view_line):
+        sha = hashlib.sha256()
+        sha.update(tree_digest.encode())
+        for rel_path in sorted(file_digests):
+            parent, name = os.path.split(rel_path)
+            if name == f"{layout_name}.xml" and os.path.basename(parent).startswith('layout'):
+                sha.update(f"{rel_path}\0{file_digests[rel_path]}\n".encode())
+        sha.update(set_content_view_line.encode())
+        return sha.hexdigest()
+
+    def fetch(self, key, destination):
+        """
+        Copy a cached APK to destination.
+
+        :return: destination on a hit, None on a miss
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            object_path = os.path.join(self.objects_directory, f"{key}.apk")
+            if entry is None or not os.path.exists(object_path):
+                self.entries.pop(key, None)
+                self.stats['misses'] += 1
+                return None
+            entry['last_used'] = time.time()
+        try:
+            shutil.copy2(object_path, destination)
+        except OSError:
+            # Evicted by another worker between the check and the copy
+            with self._lock:
+                self.stats['misses'] += 1
+            return None
+        with self._lock:
+            self.stats['hits'] += 1
+        print(f"Build cache hit: {destination}")
+        return destination
+
+    def store(self, key, apk_path, layout_name=None):
+        object_path = os.path.join(self.objects_directory, f"{key}.apk")
+        tmp_path = f"{object_path}.{threading.get_ident()}.tmp"
+        shutil.copy2(apk_path, tmp_path)
+        os.replace(tmp_path, object_path)
+        with self._lock:
+            self.entries[key] = {'layout': layout_name, 'size': os.path.getsize(object_path),
+                                 'last_used': time.time()}
+            self.stats['stored'] += 1
+            self._evict()
+
+    def _evict(self):
+        total = sum(entry['size'] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries.pop(key)['size']
+            try:
+                os.remove(os.path.join(self.objects_directory, f"{key}.apk"))
+            except FileNotFoundError:
+                pass
+            self.stats['evicted'] += 1
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'entries': self.entries, 'file_digests': self.file_digests}, f)
+            os.replace(tmp_path, self.index_path)
+
+    def summary(self):
+        with self._lock:
+            size = sum(entry['size'] for entry in self.entries.values())
+            lookups = self.stats['hits'] + self.stats['misses']
+            hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+            return (f"Build cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+                    f"({hit_rate:.0%} hit rate), {self.stats['stored']} stored, {self.stats['evicted']} evicted, "
+                    f"{len(self.entries)} entries / {size / 1024 ** 2:.1f} MiB of {self.max_bytes / 1024 ** 2:.0f} MiB")
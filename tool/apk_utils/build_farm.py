@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import queue
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from apk_gen import (build_apk, find_file, get_layout_files_as_r_layout,
+                     rename_and_move_apk, replace_set_content_view_line)
+from build_cache import BuildCache
+from project_index import PRUNED_DIRS
+
+# linux/fs.h: FICLONE = _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def _reflink_or_copy(src, dst):
+    """
+    Copy a file as a copy-on-write clone when the filesystem supports it (btrfs, xfs, ...),
+    otherwise fall back to a regular copy.
+    """
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            shutil.copystat(src, dst)
+            return dst
+        except OSError:
+            pass
+    return shutil.copy2(src, dst)
+
+
+def _link_or_copy(src, dst):
+    """
+    Hardlink a file into the working copy, falling back to a regular copy across filesystems.
+    """
+    try:
+        os.link(src, dst)
+        return dst
+    except OSError:
+        return shutil.copy2(src, dst)
+
+
+CLONE_FUNCTIONS = {
+    'hardlink': _link_or_copy,
+    'reflink': _reflink_or_copy,
+    'copy': shutil.copy2,
+}
+
+
+def clone_project(project_directory, clone_directory, clone_mode='hardlink'):
+    """
+    Create an isolated working copy of an Android project, skipping build outputs and VCS metadata.
+
+    :param project_directory: Path to the Android project root.
+    :param clone_directory: Destination of the working copy, recreated if it exists.
+    :param clone_mode: One of 'hardlink', 'reflink' or 'copy'.
+    """
+    if os.path.exists(clone_directory):
+        shutil.rmtree(clone_directory)
+    shutil.copytree(project_directory, clone_directory, symlinks=True,
+                    ignore=shutil.ignore_patterns(*PRUNED_DIRS),
+                    copy_function=CLONE_FUNCTIONS[clone_mode])
+    print(f"Cloned {project_directory} to {clone_directory} ({clone_mode})")
+
+
+def break_hardlink(file_path):
+    """
+    Give a hardlinked file its own inode so that in-place edits do not leak into the original project.
+    """
+    if os.stat(file_path).st_nlink > 1:
+        private_path = file_path + '.setdiff_tmp'
+        shutil.copy2(file_path, private_path)
+        os.replace(private_path, file_path)
+
+
+def layout_name_of(set_content_view_line):
+    return set_content_view_line.split('(')[1].split(')')[0].split('.')[-1]
+
+
+def _build_job(set_content_view_line, workspaces, relative_target, project_name, temp_directory, log_directory,
+               build_cache=None, cache_digests=None):
+    layout_name = layout_name_of(set_content_view_line)
+    start = time.time()
+    entry = {'layout': layout_name, 'workspace': None, 'status': 'failed', 'apk': None,
+             'log': os.path.join(log_directory, f"{project_name}_{layout_name}.log")}
+
+    cache_key = None
+    if build_cache is not None:
+        cache_key = BuildCache.make_key(cache_digests[0], cache_digests[1], layout_name, set_content_view_line)
+        try:
+            apk_path = build_cache.fetch(cache_key, os.path.join(temp_directory, f"{project_name}_{layout_name}.apk"))
+        except Exception as e:
+            # Any failure to read the cache is a miss: build the layout instead
+            print(f"Build cache lookup failed for {layout_name}, rebuilding: {e}")
+            apk_path = None
+        if apk_path:
+            entry.update(status='cached', apk=apk_path, log=None, seconds=round(time.time() - start, 2))
+            return entry
+
+    workspace = workspaces.get()
+    entry['workspace'] = workspace
+    try:
+        file_path = os.path.join(workspace, relative_target)
+        break_hardlink(file_path)
+        replace_set_content_view_line(file_path, set_content_view_line)
+        apk_path = build_apk(workspace, log_path=entry['log'])
+        if apk_path:
+            entry['apk'] = rename_and_move_apk(apk_path, project_name, layout_name, temp_directory)
+            if entry['apk']:
+                entry['status'] = 'ok'
+                if build_cache is not None:
+                    build_cache.store(cache_key, entry['apk'], layout_name)
+    except Exception as e:
+        print(f"An error occurred while building {layout_name} in {workspace}: {e}")
+    finally:
+        entry['seconds'] = round(time.time() - start, 2)
+        workspaces.put(workspace)
+    return entry
+
+
+def run_build_farm(project_directory, workers=None, work_directory=None, temp_directory=None,
+                   clone_mode='hardlink', target_file="SetDiffActivity.java", build_cache=None):
+    """
+    Build one APK per layout concurrently, each job running in one of `workers` isolated working copies.
+
+    :param project_directory: Path to the Android project root.
+    :param workers: Number of working copies / concurrent Gradle builds, defaults to half the CPU cores.
+    :param work_directory: Where the working copies are created, defaults to `farm/` next to this file.
+    :param temp_directory: Where the renamed APKs, logs and manifest go, defaults to `temp/` next to this file.
+    :param clone_mode: How working copies are created: 'hardlink', 'reflink' or 'copy'.
+    :param target_file: Name of the activity source whose setContentView line is rewritten.
+    :param build_cache: Optional BuildCache; layouts whose inputs did not change are copied instead of built.
+    :return: List of per-layout result entries, in layout order.
+    """
+    project_directory = os.path.abspath(project_directory)
+    project_name = os.path.basename(os.path.normpath(project_directory))
+    python_root_directory = os.path.dirname(os.path.abspath(__file__))
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // 2)
+    if work_directory is None:
+        work_directory = os.path.join(python_root_directory, 'farm')
+    if temp_directory is None:
+        temp_directory = os.path.join(python_root_directory, 'temp')
+    log_directory = os.path.join(temp_directory, 'logs')
+    os.makedirs(log_directory, exist_ok=True)
+
+    file_path = find_file(project_directory, target_file)
+    if not file_path:
+        print(f"{target_file} not found in the project.")
+        return []
+    relative_target = os.path.relpath(file_path, project_directory)
+
+    r_layout_files = get_layout_files_as_r_layout(project_directory)
+    set_content_view_lines = [f"setContentView({r_layout_file});" for r_layout_file in r_layout_files]
+    workers = max(1, min(workers, len(set_content_view_lines)))
+
+    cache_digests = None
+    if build_cache is not None:
+        cache_digests = build_cache.project_digests(project_directory, file_path)
+
+    workspaces = queue.Queue()
+    for i in range(workers):
+        clone_directory = os.path.join(work_directory, f"{project_name}_{i}")
+        clone_project(project_directory, clone_directory, clone_mode)
+        workspaces.put(clone_directory)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_build_job, line, workspaces, relative_target, project_name,
+                                   temp_directory, log_directory, build_cache, cache_digests)
+                   for line in set_content_view_lines]
+        results = [future.result() for future in futures]
+
+    if build_cache is not None:
+        build_cache.save()
+        print(build_cache.summary())
+
+    manifest_path = os.path.join(temp_directory, f"{project_name}_build_manifest.json")
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump({'project': project_directory, 'workers': workers, 'clone_mode': clone_mode,
+                   'seconds': round(time.time() - start, 2), 'results': results}, manifest_file, indent=2)
+
+    succeeded = sum(1 for entry in results if entry['status'] in ('ok', 'cached'))
+    print(f"Built {succeeded}/{len(results)} layouts with {workers} workers. Manifest: {manifest_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build one APK per layout in parallel working copies.")
+    parser.add_argument('-project_path', required=True, help="the source code of the app project under test")
+    parser.add_argument('-workers', type=int, default=None, help="number of concurrent builds")
+    parser.add_argument('-work_dir', default=None, help="where the working copies are created")
+    parser.add_argument('-clone_mode', default='hardlink', choices=sorted(CLONE_FUNCTIONS))
+    parser.add_argument('-no_cache', action='store_true', help="always rebuild every layout")
+    parser.add_argument('-cache_max_mb', type=int, default=20 * 1024, help="size bound of the APK build cache")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else BuildCache(max_bytes=args.cache_max_mb * 1024 ** 2)
+    run_build_farm(args.project_path, workers=args.workers, work_directory=args.work_dir,
+                   clone_mode=args.clone_mode, build_cache=cache)
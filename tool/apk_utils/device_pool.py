@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class Job:
+    def __init__(self, mode, apk):
+        self.mode = mode
+        self.apk = apk
+        self.attempts = 0
+        self.failed_devices = set()
+
+    def __repr__(self):
+        return f"Job(mode={self.mode}, apk={self.apk}, attempts={self.attempts})"
+
+
+class JobQueue:
+    """
+    Shared queue of (mode, apk) jobs for a pool of devices.
+
+    Jobs are kept in one deque per mode. A device first takes another mode of the APK it just ran,
+    so the installed APK can be reused, then keeps draining the deque of the mode it is currently
+    configured for, so settings are only switched when that mode runs dry; it then steals from the
+    mode with the most work left. A failed job is requeued for a device that has not failed it yet,
+    up to max_attempts.
+    """
+
+    def __init__(self, jobs, devices, max_attempts=2):
+        self.max_attempts = max_attempts
+        self._pending = OrderedDict()
+        for job in jobs:
+            self._pending.setdefault(job.mode, deque()).append(job)
+        self._active_devices = set(devices)
+        self._outstanding = len(jobs)
+        self._cond = threading.Condition()
+        self.results = []
+
+    def _eligible(self, job, device_id):
+        return device_id not in job.failed_devices
+
+    def _pick(self, device_id, preferred_mode, preferred_apk):
+        modes = sorted(self._pending, key=lambda mode: (mode != preferred_mode, -len(self._pending[mode])))
+        candidates = []
+        if preferred_apk is not None:
+            candidates = [(mode, lambda job: job.apk == preferred_apk) for mode in modes]
+        candidates += [(mode, lambda job: True) for mode in modes]
+        for mode, wanted in candidates:
+            jobs = self._pending[mode]
+            for i, job in enumerate(jobs):
+                if wanted(job) and self._eligible(job, device_id):
+                    del jobs[i]
+                    if not jobs:
+                        del self._pending[mode]
+                    return job
+        return None
+
+    def take(self, device_id, preferred_mode=None, preferred_apk=None):
+        """
+        Block until a job is available for this device; return None once all work is finished.
+        """
+        with self._cond:
+            while True:
+                job = self._pick(device_id, preferred_mode, preferred_apk)
+                if job is not None:
+                    job.attempts += 1
+                    return job
+                if self._outstanding == 0:
+                    return None
+                # Remaining jobs are in flight elsewhere or already failed on this device
+                self._cond.wait()
+
+    def _abandon_if_hopeless(self, job, device_id=None):
+        if job.attempts >= self.max_attempts or not (self._active_devices - job.failed_devices):
+            self._outstanding -= 1
+            self.results.append((job, device_id, 'failed'))
+            print(f"Giving up on {job} after failures on {sorted(job.failed_devices)}.")
+            return True
+        return False
+
+    def finish(self, job, device_id, succeeded):
+        with self._cond:
+            if succeeded:
+                self._outstanding -= 1
+                self.results.append((job, device_id, 'ok'))
+            else:
+                job.failed_devices.add(device_id)
+                if not self._abandon_if_hopeless(job, device_id):
+                    self._pending.setdefault(job.mode, deque()).append(job)
+            self._cond.notify_all()
+
+    def retire(self, device_id):
+        with self._cond:
+            self._active_devices.discard(device_id)
+            # Drop queued jobs that no remaining device is allowed to run
+            for mode in list(self._pending):
+                kept = deque(job for job in self._pending[mode] if not self._abandon_if_hopeless(job))
+                if kept:
+                    self._pending[mode] = kept
+                else:
+                    del self._pending[mode]
+            self._cond.notify_all()
+
+
+def _device_worker(device_id, job_queue, run_job, set_mode, prepare_device, max_consecutive_failures):
+    try:
+        if prepare_device is not None and not prepare_device(device_id):
+            print(f"Device {device_id} could not be prepared, leaving the pool.")
+            return
+
+        current_mode = None
+        last_apk = None
+        consecutive_failures = 0
+        while True:
+            job = job_queue.take(device_id, current_mode, last_apk)
+            if job is None:
+                break
+            last_apk = job.apk
+            try:
+                if job.mode != current_mode:
+                    current_mode = None
+                    if set_mode is not None and not set_mode(device_id, job.mode):
+                        raise RuntimeError(f"failed to switch to mode {job.mode}")
+                    current_mode = job.mode
+                succeeded = bool(run_job(device_id, job.mode, job.apk))
+            except Exception as e:
+                print(f"Exception occurred on device {device_id} while running {job}: {e}")
+                succeeded = False
+            job_queue.finish(job, device_id, succeeded)
+
+            consecutive_failures = 0 if succeeded else consecutive_failures + 1
+            if consecutive_failures >= max_consecutive_failures:
+                print(f"Device {device_id} failed {consecutive_failures} jobs in a row, leaving the pool.")
+                break
+    finally:
+        job_queue.retire(device_id)
+
+
+def run_device_pool(devices, jobs, run_job, set_mode=None, prepare_device=None, max_attempts=2,
+                    max_consecutive_failures=3):
+    """
+    Run (mode, apk) jobs on all devices concurrently, one worker thread per device.
+
+    :param devices: Device serials, e.g. from list_devices().
+    :param jobs: Iterable of (mode, apk) tuples.
+    :param run_job: Callable(device_id, mode, apk) -> bool, True when the capture succeeded.
+    :param set_mode: Callable(device_id, mode) -> bool, applies the device settings of a mode.
+    :param prepare_device: Callable(device_id) -> bool, run once per device before its first job.
+    :param max_attempts: How many devices may try a job before it is given up.
+    :param max_consecutive_failures: A device leaves the pool after this many failures in a row.
+    :return: List of (Job, device_id, 'ok' | 'failed').
+    """
+    job_queue = JobQueue([Job(mode, apk) for mode, apk in jobs], devices, max_attempts)
+    start = time.time()
+    threads = [threading.Thread(target=_device_worker, name=f"device-{device_id}",
+                                args=(device_id, job_queue, run_job, set_mode, prepare_device,
+                                      max_consecutive_failures))
+               for device_id in devices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    succeeded = sum(1 for _, _, status in job_queue.results if status == 'ok')
+    print(f"Finished {succeeded}/{len(job_queue.results)} jobs on {len(devices)} devices "
+          f"in {time.time() - start:.1f}s.")
+    return job_queue.results
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from adb_session import close_sessions
+from apk_dump import (ARTIFACT_NAMES, LEDGER_FILE, REQUIRED_ARTIFACTS, adb_root, apk_captures, apply_mode,
+                      launch_and_wait, prepare_app, pull_artifacts, read_app_info)
+from readiness import LATENCIES
+from run_ledger import RunLedger
+
+# Matched baseline/variant artifact pairs, one JSON object per line
+PAIRS_FILE = 'pairs.jsonl'
+
+
+class PairWriter:
+    """
+    Appends matched pairs to the manifest as soon as both sides of a capture are pulled, so the
+    detectors can start on them while the executor is still running.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+
+    def write(self, capture_name, baseline, variant):
+        record = {'capture': capture_name, 'baseline': baseline, 'variant': variant}
+        with self._lock, open(self.manifest_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+def _side_record(mode, device_id, artifacts):
+    # {"mode": ..., "device": ..., "view_tree.txt": path, ..., "sha256": {name: digest}}; absolute paths, so the
+    # manifest can be read from another working directory (the analyzers run from tool/)
+    record = {'mode': mode, 'device': device_id}
+    record.update({name: os.path.abspath(path) for name, (path, _) in artifacts.items()})
+    record['sha256'] = {name: digest for name, (_, digest) in artifacts.items()}
+    return record
+
+
+def _capture_side(device_id, mode, package_name, activity_name, capture_name, layout_name, generated_data_dir,
+                  ledger):
+    if ledger.is_done(mode, capture_name):
+        return ledger.artifacts(mode, capture_name)
+    ledger.start(mode, capture_name, device_id)
+    if not launch_and_wait(device_id, package_name, activity_name, layout_name):
+        ledger.fail(mode, capture_name, device_id, 'launch failed')
+        return {}
+    artifacts = pull_artifacts(device_id, package_name,
+                               os.path.join(generated_data_dir, f"{mode}_{capture_name}_{device_id}"))
+    return artifacts if ledger.finish(mode, capture_name, device_id, artifacts) else {}
+
+
+def run_paired(baseline, variant, apk_paths, app_info_list, generated_data_dir, ledger, pair_writer):
+    """
+    Differential execution on two devices in lock step: the baseline device stays in the baseline mode,
+    the variant device in the variant mode, and every layout is installed and launched on both at the
+    same time. A pair costs the wall-clock time of one capture instead of two passes.
+
+    :param baseline: (device_id, mode) of the reference side, e.g. ("emulator-5554", "1").
+    :param variant: (device_id, mode) of the side under test, e.g. ("emulator-5556", "ara").
+    :return: Number of pairs written to the manifest.
+    """
+    sides = [baseline, variant]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        def both(function, *args):
+            return list(pool.map(lambda side: function(side[0], side[1], *args), sides))
+
+        if not all(both(lambda device_id, mode: adb_root(device_id) and apply_mode(device_id, mode))):
+            print(f"Could not set up {baseline} and {variant} for paired execution.")
+            return 0
+
+        pairs = 0
+        start = time.time()
+        for apk_path in apk_paths:
+            apk_name = os.path.splitext(os.path.basename(apk_path))[0]
+            captures = [(capture_name, layout) for capture_name, layout in apk_captures(apk_path)
+                        if not (ledger.is_done(baseline[1], capture_name) and ledger.is_done(variant[1], capture_name))]
+            if not captures:
+                print(f"Skipping {apk_name} as data already exists.")
+                continue
+
+            for app_info in app_info_list:
+                package_name = app_info['package_name']
+                activity_name = app_info['activity_name']
+
+                # Skip APK files that do not contain the app_name
+                if app_info['app_name'] not in apk_name:
+                    continue
+
+                if not all(both(prepare_app, package_name, apk_path)):
+                    print(f"Failed to prepare {apk_name} on both devices, skipping it.")
+                    continue
+                for capture_name, layout in captures:
+                    baseline_artifacts, variant_artifacts = both(
+                        _capture_side, package_name, activity_name, capture_name, layout, generated_data_dir, ledger)
+                    if baseline_artifacts and variant_artifacts:
+                        pair_writer.write(capture_name, _side_record(*baseline, baseline_artifacts),
+                                          _side_record(*variant, variant_artifacts))
+                        pairs += 1
+                    else:
+                        print(f"No complete pair for {capture_name}.")
+    print(f"Wrote {pairs} pairs to {pair_writer.manifest_path} in {time.time() - start:.1f}s.")
+    return pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture baseline/variant pairs on two devices in lock step.")
+    parser.add_argument('-baseline_device', default='emulator-5554')
+    parser.add_argument('-variant_device', default='emulator-5556')
+    parser.add_argument('-baseline_mode', default='1', help="mode of apk_dump.MODE_PROFILES used as reference")
+    parser.add_argument('-variant_mode', default='ara', help="mode of apk_dump.MODE_PROFILES under test")
+    parser.add_argument('-apk_dir', default='./temp/', help="directory with the generated APKs")
+    parser.add_argument('-csv', default='app_info.csv', help="package_name, activity_name and app_name per app")
+    parser.add_argument('-out', default='./generated_data/', help="generated data directory")
+    parser.add_argument('-manifest', default=None, help=f"pair manifest, default {PAIRS_FILE} in -out")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    run_ledger = RunLedger(os.path.join(args.out, LEDGER_FILE), ARTIFACT_NAMES, required_names=REQUIRED_ARTIFACTS)
+    apks = sorted(os.path.join(args.apk_dir, f) for f in os.listdir(args.apk_dir) if f.endswith('.apk'))
+    run_paired((args.baseline_device, args.baseline_mode), (args.variant_device, args.variant_mode), apks,
+               read_app_info(args.csv), args.out, run_ledger,
+               PairWriter(args.manifest or os.path.join(args.out, PAIRS_FILE)))
+    close_sessions()
+    print(LATENCIES.summary())
+    run_ledger.close()
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+
+# Build outputs, IDE and VCS metadata: never part of the sources and often the bulk of the tree
+PRUNED_DIRS = frozenset({'build', '.gradle', '.git', '.idea', '.cxx', '.externalNativeBuild'})
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+class ProjectIndex:
+    """
+    Single-pass index of an Android project: res directories, layouts, source files by name and Gradle
+    modules. Built with one pruned os.walk and invalidated when the mtime of any indexed directory changes.
+    """
+
+    def __init__(self, project_directory):
+        self.project_directory = os.path.abspath(project_directory)
+        self.refresh()
+
+    def refresh(self):
+        self.res_dirs = []
+        self.layout_dirs = []
+        self.layouts = {}          # layout name -> [xml paths]
+        self.files_by_name = {}    # file name -> first path in walk order
+        self.files = []            # every indexed file, relative to the project root
+        self.module_dirs = []      # directories containing a build.gradle(.kts)
+        self.dir_mtimes = {}
+
+        res_dirs = set()
+        for root, dirs, files in os.walk(self.project_directory):
+            dirs[:] = sorted(d for d in dirs if d not in PRUNED_DIRS)
+            self.dir_mtimes[root] = os.stat(root).st_mtime_ns
+            rel_root = os.path.relpath(root, self.project_directory)
+
+            if os.path.basename(root) == 'res' and 'main' in rel_root and '/generated/' not in root:
+                res_dirs.add(root)
+                self.res_dirs.append(root)
+
+            dir_name = os.path.basename(root)
+            if dir_name.startswith('layout') and 'menu' not in dir_name and self._under_res(root, res_dirs):
+                self.layout_dirs.append(root)
+                for file in sorted(files):
+                    if file.endswith('.xml'):
+                        self.layouts.setdefault(os.path.splitext(file)[0], []).append(os.path.join(root, file))
+
+            if 'build.gradle' in files or 'build.gradle.kts' in files:
+                self.module_dirs.append(root)
+
+            for file in sorted(files):
+                self.files_by_name.setdefault(file, os.path.join(root, file))
+                self.files.append(os.path.join(rel_root, file) if rel_root != '.' else file)
+
+    @staticmethod
+    def _under_res(directory, res_dirs):
+        parent = os.path.dirname(directory)
+        while parent and parent != os.path.dirname(parent):
+            if parent in res_dirs:
+                return True
+            parent = os.path.dirname(parent)
+        return False
+
+    def is_stale(self):
+        for directory, mtime in self.dir_mtimes.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def find_file(self, filename):
+        return self.files_by_name.get(filename)
+
+    def layout_names(self):
+        return list(self.layouts)
+
+    def apk_outputs(self, marker='v8a'):
+        """
+        List the APKs of the last Gradle build by reading the output-metadata.json files under
+        <module>/build/outputs/apk instead of walking the whole tree.
+
+        :param marker: Substring the APK file name must contain (e.g. the ABI split).
+        """
+        apk_files = []
+        for module_dir in self.module_dirs:
+            outputs_dir = os.path.join(module_dir, 'build', 'outputs', 'apk')
+            if not os.path.isdir(outputs_dir):
+                continue
+            for root, dirs, files in os.walk(outputs_dir):
+                dirs.sort()
+                names = []
+                if 'output-metadata.json' in files:
+                    try:
+                        with open(os.path.join(root, 'output-metadata.json')) as f:
+                            names = [element['outputFile'] for element in json.load(f).get('elements', [])]
+                    except (OSError, ValueError, KeyError):
+                        names = []
+                if not names:
+                    names = sorted(files)
+                for name in names:
+                    if name.endswith('.apk') and marker in name and os.path.exists(os.path.join(root, name)):
+                        apk_files.append(os.path.join(root, name))
+        return apk_files
+
+
+def get_project_index(project_directory):
+    """
+    Return the cached index of a project, rebuilding it when the project tree changed.
+    """
+    key = os.path.abspath(project_directory)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is None:
+            index = _index_cache[key] = ProjectIndex(key)
+        elif index.is_stale():
+            index.refresh()
+        return index
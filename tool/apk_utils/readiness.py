@@ -0,0 +1,105 @@
+import shlex
+import threading
+import time
+from collections import defaultdict
+
+
+class LatencyRecorder:
+    """
+    Collects how long each readiness step actually took, so fixed sleeps can be compared with reality.
+    """
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, step, seconds, ready):
+        with self._lock:
+            self._samples[step].append((seconds, ready))
+
+    def summary(self):
+        lines = []
+        with self._lock:
+            for step, samples in sorted(self._samples.items()):
+                durations = sorted(seconds for seconds, _ in samples)
+                timeouts = sum(1 for _, ready in samples if not ready)
+                median = durations[len(durations) // 2]
+                lines.append(f"{step}: n={len(durations)} median={median:.2f}s max={durations[-1]:.2f}s "
+                             f"timeouts={timeouts}")
+        return '\n'.join(lines)
+
+
+LATENCIES = LatencyRecorder()
+
+
+def poll_until(check, timeout, interval=0.2, max_interval=1.0):
+    """
+    Call check() until it returns True or timeout seconds passed, backing off between polls.
+
+    :return: (ready, elapsed seconds)
+    """
+    start = time.monotonic()
+    while True:
+        if check():
+            return True, time.monotonic() - start
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            return False, elapsed
+        time.sleep(min(interval, timeout - elapsed))
+        interval = min(interval * 1.5, max_interval)
+
+
+def _wait(step, check, timeout, recorder):
+    ready, elapsed = poll_until(check, timeout)
+    (recorder or LATENCIES).record(step, elapsed, ready)
+    if not ready:
+        print(f"Timed out after {elapsed:.1f}s waiting for {step}.")
+    return ready
+
+
+def wait_for_uninstalled(session, package_name, timeout=10, recorder=None):
+    """
+    Wait until the package manager no longer knows the package.
+    """
+    def check():
+        result = session.run(f"pm path {package_name}")
+        return result.returncode > 0 or (result.ok and 'package:' not in result.output)
+    return _wait('uninstall', check, timeout, recorder)
+
+
+def wait_for_activity_resumed(session, package_name, activity_name, timeout=20, recorder=None):
+    """
+    Wait until the activity is the resumed activity and its window has input focus.
+    """
+    short_name = activity_name[len(package_name):] if activity_name.startswith(package_name) else activity_name
+    components = (f"{package_name}/{activity_name}", f"{package_name}/{short_name}")
+
+    def check():
+        resumed, focus = session.run_batch([
+            "dumpsys activity activities | grep -E 'topResumedActivity|mResumedActivity'",
+            "dumpsys window | grep -E 'mCurrentFocus|mFocusedApp'",
+        ])
+        return any(c in resumed.output for c in components) and package_name in focus.output
+    return _wait('activity resumed', check, timeout, recorder)
+
+
+def wait_for_stable_files(session, remote_paths, timeout=30, min_size=1, recorder=None):
+    """
+    Wait until every remote file exists with at least min_size bytes and its size did not change
+    between two consecutive polls.
+    """
+    command = "stat -c '%n %s' " + ' '.join(shlex.quote(path) for path in remote_paths) + " 2>/dev/null"
+    previous = {}
+
+    def check():
+        sizes = {}
+        for line in session.run(command).output.splitlines():
+            name, _, size = line.rpartition(' ')
+            if size.isdigit():
+                sizes[name] = int(size)
+        ready = len(sizes) == len(remote_paths) and all(size >= min_size for size in sizes.values()) \
+            and sizes == previous
+        previous.clear()
+        previous.update(sizes)
+        return ready
+    return _wait('artifacts written', check, timeout, recorder)
@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+
+from build_cache import file_digest
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    mode TEXT NOT NULL,
+    capture TEXT NOT NULL,
+    device TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (mode, capture, device)
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    mode TEXT NOT NULL,
+    capture TEXT NOT NULL,
+    device TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (mode, capture, device, name)
+);
+"""
+
+
+class RunLedger:
+    """
+    Persistent record of capture jobs, keyed on (mode, capture, device), in an SQLite file next to the
+    generated data. A capture is the APK name, or {project}_{layout} for a layout-switch APK.
+
+    A job only counts as done once all of its required artifacts are recorded with their checksums, so a crash
+    half-way through a pull is retried on the next run. Jobs that were still running when the previous
+    run died are reset to pending when the ledger is opened.
+
+    A new, empty ledger is seeded from the artifacts already in its directory, so captures made before
+    the ledger existed are not repeated.
+    """
+
+    def __init__(self, path, artifact_names, seed_directory=None, required_names=None):
+        """
+        :param artifact_names: File names of the artifacts of a capture, e.g. apk_dump.ARTIFACT_NAMES.
+        :param required_names: The artifacts a capture must have to be done, defaults to all of artifact_names.
+        :param seed_directory: Where existing artifacts are looked for when the ledger is empty, defaults to
+                               the directory of the ledger file.
+        """
+        self.path = path
+        self.artifact_names = list(artifact_names)
+        self.required_names = list(required_names) if required_names is not None else self.artifact_names
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Device worker threads share the connection; every access goes through self._lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        with self._db:
+            self._db.execute("UPDATE jobs SET state = ?, error = 'interrupted' WHERE state = ?", (PENDING, RUNNING))
+        if self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0:
+            seeded = self.seed(seed_directory or os.path.dirname(os.path.abspath(path)))
+            if seeded:
+                print(f"Run ledger seeded with {seeded} existing captures.")
+        # (mode, capture) pairs with a complete capture on any device, for constant-time skip checks
+        self._done = set(self._db.execute("SELECT DISTINCT mode, capture FROM jobs WHERE state = ?", (DONE,)))
+
+    def seed(self, directory):
+        """
+        Record the captures whose required artifacts {mode}_{capture}_{device}_{name} are all in directory as
+        done, together with any optional artifacts found next to them.
+
+        :return: Number of captures recorded.
+        """
+        if not os.path.isdir(directory):
+            return 0
+        found = {}
+        for filename in os.listdir(directory):
+            name = next((name for name in self.artifact_names if filename.endswith(f"_{name}")), None)
+            stem = filename[:-len(name) - 1] if name else ''
+            # Modes and device serials have no underscores; the capture name may have some
+            mode, _, rest = stem.partition('_')
+            capture, _, device_id = rest.rpartition('_')
+            if mode and capture and device_id:
+                found.setdefault((mode, capture, device_id), {})[name] = os.path.join(directory, filename)
+
+        now = time.time()
+        jobs, artifacts = [], []
+        for (mode, capture, device_id), paths in found.items():
+            if all(name in paths for name in self.required_names):
+                jobs.append((mode, capture, device_id, DONE, now))
+                artifacts.extend((mode, capture, device_id, name, path, file_digest(path))
+                                 for name, path in paths.items())
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR IGNORE INTO jobs (mode, capture, device, state, updated) "
+                                 "VALUES (?, ?, ?, ?, ?)", jobs)
+            self._db.executemany("INSERT OR IGNORE INTO artifacts (mode, capture, device, name, path, sha256) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", artifacts)
+        return len(jobs)
+
+    def is_done(self, mode, capture):
+        with self._lock:
+            return (mode, capture) in self._done
+
+    def start(self, mode, capture, device_id):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (mode, capture, device, state, attempts, updated) VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (mode, capture, device) DO UPDATE SET state = excluded.state, "
+                "attempts = attempts + 1, error = NULL, updated = excluded.updated",
+                (mode, capture, device_id, RUNNING, time.time()))
+
+    def finish(self, mode, capture, device_id, artifacts):
+        """
+        Record the artifacts of a capture; the job is done only when every required artifact is present.
+
+        :param artifacts: {filename: (local_path, sha256)}, as returned by apk_dump.pull_artifacts.
+        :return: True when the job was marked done.
+        """
+        complete = all(name in artifacts for name in self.required_names)
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM artifacts WHERE mode = ? AND capture = ? AND device = ?",
+                             (mode, capture, device_id))
+            self._db.executemany(
+                "INSERT INTO artifacts (mode, capture, device, name, path, sha256) VALUES (?, ?, ?, ?, ?, ?)",
+                [(mode, capture, device_id, name, path, digest) for name, (path, digest) in artifacts.items()])
+            self._db.execute("UPDATE jobs SET state = ?, error = ?, updated = ? "
+                             "WHERE mode = ? AND capture = ? AND device = ?",
+                             (DONE if complete else FAILED, None if complete else 'incomplete artifacts',
+                              time.time(), mode, capture, device_id))
+            if complete:
+                self._done.add((mode, capture))
+        return complete
+
+    def fail(self, mode, capture, device_id, error):
+        with self._lock, self._db:
+            self._db.execute("UPDATE jobs SET state = ?, error = ?, updated = ? "
+                             "WHERE mode = ? AND capture = ? AND device = ?",
+                             (FAILED, str(error), time.time(), mode, capture, device_id))
+
+    def artifacts(self, mode, capture):
+        """
+        :return: {filename: (local_path, sha256)} of a finished capture, empty when it is not done.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT a.name, a.path, a.sha256 FROM artifacts a JOIN jobs j "
+                "ON a.mode = j.mode AND a.capture = j.capture AND a.device = j.device "
+                "WHERE j.mode = ? AND j.capture = ? AND j.state = ? ORDER BY j.updated DESC",
+                (mode, capture, DONE)).fetchall()
+        found = {}
+        for name, path, digest in rows:
+            found.setdefault(name, (path, digest))
+        return found
+
+    def pending(self, jobs=None):
+        """
+        What is still left to do.
+
+        :param jobs: Optional iterable of (mode, capture) that should exist; without it only jobs the
+                     ledger has seen are considered.
+        :return: Sorted list of (mode, capture) without a complete capture.
+        """
+        with self._lock:
+            if jobs is None:
+                jobs = self._db.execute("SELECT DISTINCT mode, capture FROM jobs").fetchall()
+            return sorted({tuple(job) for job in jobs} - self._done)
+
+    def summary(self):
+        with self._lock:
+            counts = dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+        return ', '.join(f"{state}={counts.get(state, 0)}" for state in (DONE, FAILED, PENDING, RUNNING))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
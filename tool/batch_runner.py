@@ -0,0 +1,94 @@
+import contextlib
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _run_chunk(analyze, chunk, capture_output):
+    """
+    Analyze the items of one chunk in a worker process.
+
+    :return: [(result, error, output)]; output is what analyze printed (None when not captured), error is
+             the message of the exception analyze raised (None when it succeeded).
+    """
+    results = []
+    for item in chunk:
+        buffer = io.StringIO() if capture_output else None
+        with contextlib.redirect_stdout(buffer) if capture_output else contextlib.nullcontext():
+            result, error = None, None
+            try:
+                result = analyze(item)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"An error occurred while analyzing {item}: {error}")
+        results.append((result, error, buffer.getvalue() if capture_output else None))
+    return results
+
+
+def _chunks(items, chunksize):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(analyze, items, processes=None, chunksize=16, max_pending=None, echo=True):
+    """
+    Analyze screen pairs across a process pool and yield the results in input order.
+
+    Items are dispatched in chunks of `chunksize`, and at most `max_pending` chunks are in flight or
+    waiting to be consumed, so memory stays bounded however long `items` is. Each worker captures what
+    analyze prints for an item; the output is replayed in input order, so the log of a batch run is the
+    same as a sequential one.
+
+    :param analyze: Module-level function taking one item (it is pickled to the workers).
+    :param items: Iterable of items, e.g. (baseline_view_tree, variant_view_tree, baseline_image, variant_image).
+    :param processes: Number of worker processes, defaults to the CPU count; 1 runs in this process.
+    :param max_pending: Chunks in flight, defaults to twice the number of processes.
+    :param echo: Print the captured output of each item before yielding its result.
+    :return: Generator of (item, result, error); error is None on success, else the message of the
+             exception (and result is None). See report_failures.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1:
+        for item in items:
+            (result, error, _), = _run_chunk(analyze, [item], capture_output=False)
+            yield item, result, error
+        return
+
+    if max_pending is None:
+        max_pending = 2 * processes
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        def drain(limit):
+            while len(pending) > limit:
+                chunk, future = pending.popleft()
+                for item, (result, error, output) in zip(chunk, future.result()):
+                    if echo and output:
+                        print(output, end='')
+                    yield item, result, error
+
+        for chunk in _chunks(items, chunksize):
+            pending.append((chunk, executor.submit(_run_chunk, analyze, chunk, True)))
+            yield from drain(max_pending - 1)
+        yield from drain(0)
+
+
+def report_failures(failures, total):
+    """
+    Print the items whose analysis failed.
+
+    :param failures: [(item, error)] collected from run_batch.
+    :return: Number of failed items, e.g. for the exit status.
+    """
+    if failures:
+        print(f"\nAnalysis failed for {len(failures)} of {total} pairs:")
+        for item, error in failures:
+            print(f"  {item}: {error}")
+    return len(failures)
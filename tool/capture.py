@@ -0,0 +1,77 @@
+import io
+import json
+import os
+import subprocess
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+# view tree lines + decoded RGB screenshot of one screen, ready for the process_mode functions
+Capture = namedtuple('Capture', ['view_tree_lines', 'screenshot'])
+
+
+def exec_out(device_id, command):
+    """
+    Run a shell command on the device and return its raw stdout bytes (no pty, no newline mangling).
+    """
+    result = subprocess.run(['adb', '-s', device_id, 'exec-out', command], capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"adb exec-out '{command}' failed on {device_id}: {result.stderr.decode(errors='replace')}")
+    return result.stdout
+
+
+def decode_png(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def capture_screenshot(device_id):
+    """
+    Grab the current screen with screencap and decode it in memory.
+
+    :return: (H, W, 3) uint8 RGB array
+    """
+    return decode_png(exec_out(device_id, 'screencap -p'))
+
+
+def capture(device_id, package_name, source='app', archive_prefix=None):
+    """
+    Read the view tree and screenshot of the screen under test straight into memory.
+
+    :param device_id: Device serial.
+    :param package_name: Package whose SetDiffActivity wrote files/view_tree.txt (and files/screenshot.png).
+    :param source: 'app' for the screenshot written by SetDiffActivity, 'screen' for a fresh screencap.
+    :param archive_prefix: Optional; also write the raw bytes to {archive_prefix}_view_tree.txt and
+                           {archive_prefix}_screenshot.png, the same names apk_dump uses.
+    :return: Capture(view_tree_lines, screenshot)
+    """
+    files_dir = f'/data/data/{package_name}/files'
+    view_tree_bytes = exec_out(device_id, f'cat {files_dir}/view_tree.txt')
+    png_bytes = exec_out(device_id, 'screencap -p' if source == 'screen' else f'cat {files_dir}/screenshot.png')
+
+    if archive_prefix:
+        os.makedirs(os.path.dirname(archive_prefix) or '.', exist_ok=True)
+        with open(f"{archive_prefix}_view_tree.txt", 'wb') as f:
+            f.write(view_tree_bytes)
+        with open(f"{archive_prefix}_screenshot.png", 'wb') as f:
+            f.write(png_bytes)
+
+    view_tree_lines = [line.strip() for line in view_tree_bytes.decode('utf-8').splitlines()]
+    return Capture(view_tree_lines, decode_png(png_bytes))
+
+
+def read_pairs(manifest_path):
+    """
+    Read the baseline/variant pairs written by apk_utils/paired_executor.py.
+
+    :return: List of (capture_name, baseline, variant); baseline and variant map 'mode', 'device' and the
+             artifact file names (view_tree.txt, screenshot.png, ...) to their values / local paths.
+    """
+    pairs = []
+    with open(manifest_path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                pairs.append((record['capture'], record['baseline'], record['variant']))
+    return pairs
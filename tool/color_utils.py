@@ -0,0 +1,149 @@
+import numpy as np
+
+import cv_utils
+import label_features
+
+
+def to_rgb_array(image):
+    """
+    Accept a file path, a PIL image or a numpy array and return an (H, W, 3) uint8 RGB array.
+    RGB arrays are returned as they are, without a copy.
+    """
+    if isinstance(image, np.ndarray) and image.ndim == 3 and image.shape[2] == 3:
+        return image
+    return np.asarray(cv_utils.open_image(image).convert('RGB'))
+
+
+def pack_rgb(rgb):
+    # (..., 3) uint8 -> (...) uint32 0xRRGGBB
+    rgb = rgb.astype(np.uint32)
+    return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+
+def unpack_rgb(packed):
+    packed = int(packed)
+    return (packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF
+
+
+def quantize(rgb, bits):
+    """
+    Keep the top `bits` bits of every channel, e.g. bits=5 merges colors that differ by less than 8
+    per channel. A merged color is reported as the lowest color of its bucket.
+    """
+    mask = (0xFF << (8 - bits)) & 0xFF
+    return rgb & np.uint8(mask)
+
+
+def _prepare(rgb, quantize_bits, step):
+    if step > 1:
+        rgb = rgb[::step, ::step]
+    if quantize_bits is not None:
+        rgb = quantize(rgb, quantize_bits)
+    return rgb
+
+
+def top_colors(image, num_colors=2, quantize_bits=None, step=1):
+    """
+    Most frequent colors of an image with their pixel counts, the same result as
+    Counter(image.getdata()).most_common(num_colors): most frequent first, ties in order of first
+    appearance (row by row).
+
+    :param image: Path, PIL image or numpy array.
+    :param quantize_bits: Optional; count colors per bucket of this many bits per channel (see quantize).
+    :param step: Optional; only count every step-th pixel in both directions.
+    :return: [((r, g, b), count)]
+    """
+    rgb = _prepare(to_rgb_array(image), quantize_bits, step)
+    packed = pack_rgb(rgb).ravel()
+    if packed.size == 0:
+        return []
+    return top_colors_by_label(packed, np.zeros(packed.size, dtype=np.int64), 1, num_colors)[0]
+
+
+def top_colors_by_label(packed, labels, num_labels, num_colors=2):
+    """
+    top_colors of many pixel groups in one pass, e.g. the nodes of a label map.
+
+    :param packed: 1-D array of packed colors (see pack_rgb), in pixel order.
+    :param labels: Group of each pixel, 0 <= label < num_labels.
+    :return: One [((r, g, b), count)] list per label: most frequent first, ties in order of first appearance.
+    """
+    keys = (np.asarray(labels, dtype=np.int64) << 24) | np.asarray(packed, dtype=np.int64)
+    unique_keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    owner = unique_keys >> 24
+    order = np.lexsort((first, -counts, owner))
+    owner, colors, counts = owner[order], unique_keys[order] & 0xFFFFFF, counts[order]
+    # Rank of each color within its group
+    rank = np.arange(len(owner)) - np.searchsorted(owner, owner)
+    keep = rank < num_colors
+
+    result = [[] for _ in range(num_labels)]
+    for label, color, count in zip(owner[keep].tolist(), colors[keep].tolist(), counts[keep].tolist()):
+        result[label].append((unpack_rgb(color), count))
+    return result
+
+
+def top_colors_batch(image, boxes, num_colors=2, quantize_bits=None, step=1):
+    """
+    top_colors for many regions (x1, y1, x2, y2) of one screenshot in one call. Without subsampling the
+    regions are counted together on a label map (see label_features); regions past the frame are
+    zero-padded like PIL's crop.
+
+    :return: One [((r, g, b), count)] list per box.
+    """
+    rgb = to_rgb_array(image)
+    boxes = [tuple(box) for box in boxes]
+    if step > 1:
+        return [top_colors(cv_utils.crop_region(rgb, box), num_colors, quantize_bits, step) for box in boxes]
+    if quantize_bits is not None:
+        rgb = quantize(rgb, quantize_bits)
+    return label_features.extract_top_colors(
+        rgb, boxes, num_colors, fallback=lambda box: top_colors(cv_utils.crop_region(rgb, box), num_colors))
+
+
+def stack_colors(color_lists, num_colors=2):
+    """
+    Stack per-node top-color lists into arrays.
+
+    :param color_lists: One list of (r, g, b) (or ((r, g, b), count)) per node.
+    :return: (colors, present): (N, num_colors, 3) int array and (N, num_colors) bool mask of the slots
+             that hold a color (nodes with fewer colors are padded with zeros).
+    """
+    colors = np.zeros((len(color_lists), num_colors, 3), dtype=np.int64)
+    present = np.zeros((len(color_lists), num_colors), dtype=bool)
+    for i, top in enumerate(color_lists):
+        for j, color in enumerate(top[:num_colors]):
+            if len(color) == 2:
+                color = color[0]
+            colors[i, j] = color
+            present[i, j] = True
+    return colors, present
+
+
+def rgb_to_lab(rgb):
+    """
+    sRGB (0-255, any shape (..., 3)) to CIE L*a*b* under D65.
+    """
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([[0.4124564, 0.2126729, 0.0193339],
+                             [0.3575761, 0.7151522, 0.1191920],
+                             [0.1804375, 0.0721750, 0.9503041]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def color_distances(colors1, colors2, metric='rgb'):
+    """
+    Element-wise distance between two stacks of colors, e.g. (N, k, 3) arrays from stack_colors.
+
+    :param metric: 'rgb' for the Euclidean distance in RGB, 'lab' for CIE76 Delta E in L*a*b*.
+    :return: Array of the leading shape, e.g. (N, k).
+    """
+    colors1, colors2 = np.asarray(colors1), np.asarray(colors2)
+    if metric == 'lab':
+        colors1, colors2 = rgb_to_lab(colors1), rgb_to_lab(colors2)
+    elif metric != 'rgb':
+        raise ValueError(f"Unknown color metric: {metric}")
+    return np.sqrt(np.sum((colors1 - colors2) ** 2, axis=-1))
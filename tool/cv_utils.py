@@ -1,99 +1,50 @@
 import numpy as np
-from PIL import Image, ImageOps
+from PIL import Image
 
-def detect_text_alignment(image_path):
-    # 读取图像
-    image = Image.open(image_path).convert("L")
-
-    # 检测背景颜色
-    avg_pixel_value = np.mean(image)
-    is_light_background = avg_pixel_value > 128
-
-    # 二值化图像
-    if is_light_background:
-        binary_image = image.point(lambda p: p > 128 and 255)
-        binary_image = ImageOps.invert(binary_image)
-    else:
-        binary_image = image.point(lambda p: p > 128 and 255)
-
-    # 将图像转换为numpy数组
-    binary_array = np.array(binary_image)
+def open_image(image):
+    """
+    Accept a file path, a PIL image or a numpy array and return a decoded PIL image.
+    Paths are decoded once here so callers can crop many regions without reopening the file.
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    with Image.open(image) as img:
+        img.load()
+        return img
 
-    # 获取每行的非零像素（即文本部分）
-    row_sums = np.sum(binary_array, axis=1)
-    text_rows = np.where(row_sums > 0)[0]
+def to_gray_array(image):
+    """
+    Accept a file path, a PIL image or a numpy array and return a 2-D uint8 grayscale array
+    (the same conversion as Image.convert("L")). 2-D arrays are returned as they are, without a copy.
+    """
+    if isinstance(image, np.ndarray) and image.ndim == 2:
+        return image
+    return np.asarray(open_image(image).convert("L"))
 
-    left_margins = []
-    right_margins = []
-
-    # 计算每行的左边和右边边距
-    for row in text_rows:
-        cols = np.where(binary_array[row] > 0)[0]
-        if len(cols) > 0:
-            left_margins.append(cols[0])
-            right_margins.append(binary_array.shape[1] - 1 - cols[-1])
-
-    # 计算平均左边和右边边距
-    avg_left_margin = np.mean(left_margins) if left_margins else 0
-    avg_right_margin = np.mean(right_margins) if right_margins else 0
+def crop_region(array, box):
+    """
+    Region (x1, y1, x2, y2) of an image array as a view, without copying. Like PIL's crop, the part of a
+    region that lies outside the frame is filled with zeros; only such regions are copied.
+    """
+    x1, y1, x2, y2 = box
+    left, right = min(x1, x2), max(x1, x2)
+    upper, lower = min(y1, y2), max(y1, y2)
+    height, width = array.shape[:2]
+    if right <= width and lower <= height:
+        return array[upper:lower, left:right]
+    region = np.zeros((lower - upper, right - left) + array.shape[2:], dtype=array.dtype)
+    inside = array[upper:min(lower, height), left:min(right, width)]
+    region[:inside.shape[0], :inside.shape[1]] = inside
+    return region
 
+def alignment_from_margins(avg_left_margin, avg_right_margin, width):
     # 确定对齐方式
     alignment = "other"
-    # import numpy as np
-    # from PIL import Image, ImageOps
-    #
-    # def detect_text_alignment(image_path):
-    #     # 读取图像
-    #     image = Image.open(image_path).convert("L")
-    #
-    #     # 检测背景颜色
-    #     avg_pixel_value = np.mean(image)
-    #     is_light_background = avg_pixel_value > 128
-    #
-    #     # 二值化图像
-    #     if is_light_background:
-    #         binary_image = image.point(lambda p: p > 128 and 255)
-    #         binary_image = ImageOps.invert(binary_image)
-    #     else:
-    #         binary_image = image.point(lambda p: p > 128 and 255)
-    #
-    #     # 将图像转换为numpy数组
-    #     binary_array = np.array(binary_image)
-    #
-    #     # 获取每行的非零像素（即文本部分）
-    #     row_sums = np.sum(binary_array, axis=1)
-    #     text_rows = np.where(row_sums > 0)[0]
-    #
-    #     left_margins = []
-    #     right_margins = []
-    #
-    #     # 计算每行的左边和右边边距
-    #     for row in text_rows:
-    #         cols = np.where(binary_array[row] > 0)[0]
-    #         if len(cols) > 0:
-    #             left_margins.append(cols[0])
-    #             right_margins.append(binary_array.shape[1] - 1 - cols[-1])
-    #
-    #     # 计算平均左边和右边边距
-    #     avg_left_margin = np.mean(left_margins) if left_margins else 0
-    #     avg_right_margin = np.mean(right_margins) if right_margins else 0
-    #
-    #     # 确定对齐方式
-    #     alignment = "other"
-    #     if avg_left_margin < binary_array.shape[1] * 0.1 and avg_right_margin < binary_array.shape[1] * 0.1:
-    #         alignment = "justify"
-    #     elif abs(avg_left_margin - avg_right_margin) < binary_array.shape[1] * 0.1:  # 调整后的中间对齐阈值
-    #         alignment = "center"
-    #     elif avg_left_margin < avg_right_margin * 0.5:
-    #         alignment = "left"
-    #     elif avg_right_margin < avg_left_margin * 0.5:
-    #         alignment = "right"
-    #
-    #     return alignment
-
-    if avg_left_margin < binary_array.shape[1] * 0.1 and avg_right_margin < binary_array.shape[1] * 0.1:
+    if avg_left_margin < width * 0.1 and avg_right_margin < width * 0.1:
         alignment = "justify"
-    elif abs(avg_left_margin - avg_right_margin) < binary_array.shape[1] * 0.1:  # 调整后的中间对齐阈值
+    elif abs(avg_left_margin - avg_right_margin) < width * 0.1:  # 调整后的中间对齐阈值
         alignment = "center"
     elif avg_left_margin < avg_right_margin * 0.5:
         alignment = "left"
@@ -102,6 +53,86 @@ def detect_text_alignment(image_path):
 
     return alignment
 
+def region_means(gray, boxes):
+    """
+    Mean gray value of every box (x1, y1, x2, y2) from one summed-area table; the part of a box outside
+    the frame counts as 0, like the zero padding of crop_region.
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    height, width = gray.shape
+    table = np.zeros((height + 1, width + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(gray, axis=0, dtype=np.int64), axis=1, out=table[1:, 1:])
+    left = np.minimum(boxes[:, 0], boxes[:, 2])
+    right = np.maximum(boxes[:, 0], boxes[:, 2])
+    upper = np.minimum(boxes[:, 1], boxes[:, 3])
+    lower = np.maximum(boxes[:, 1], boxes[:, 3])
+    cl, cr = np.minimum(left, width), np.minimum(right, width)
+    cu, cd = np.minimum(upper, height), np.minimum(lower, height)
+    sums = table[cd, cr] - table[cu, cr] - table[cd, cl] + table[cu, cl]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Integer sums are exact, so this is the same value as np.mean of the region
+        return sums / ((right - left) * (lower - upper))
+
+# Pixels stacked per batch in detect_text_alignment_batch, to bound its memory
+BATCH_PIXELS = 1 << 23
+
+def detect_text_alignment_batch(gray, boxes):
+    """
+    Text alignment ('left', 'right', 'center', 'justify' or 'other') of many regions of one grayscale frame
+    in one call; each result is the same as detect_text_alignment on the cropped region.
+
+    Regions of the same size are stacked into one (n, h, w) array and measured together, so a screen of
+    list rows costs a few array operations instead of one pass per region.
+
+    :param gray: 2-D uint8 grayscale array of the whole screenshot (see to_gray_array).
+    :param boxes: Sequence of (x1, y1, x2, y2).
+    """
+    boxes = np.asarray([tuple(box) for box in boxes], dtype=np.int64).reshape(-1, 4)
+    if not len(boxes):
+        return []
+    means = region_means(gray, boxes)
+    left = np.minimum(boxes[:, 0], boxes[:, 2])
+    upper = np.minimum(boxes[:, 1], boxes[:, 3])
+    widths = np.abs(boxes[:, 2] - boxes[:, 0])
+    heights = np.abs(boxes[:, 3] - boxes[:, 1])
+    # Zero padding for the part of a region outside the frame, as in crop_region
+    height, width = gray.shape
+    pad_bottom = max(int((upper + heights).max()) - height, 0)
+    pad_right = max(int((left + widths).max()) - width, 0)
+    frame = np.pad(gray, ((0, pad_bottom), (0, pad_right))) if pad_bottom or pad_right else gray
+
+    margins_left = np.zeros(len(boxes))
+    margins_right = np.zeros(len(boxes))
+    shapes, group = np.unique(np.column_stack((heights, widths)), axis=0, return_inverse=True)
+    group = group.ravel()
+    for g, (h, w) in enumerate(shapes.tolist()):
+        members = np.flatnonzero(group == g)
+        if h == 0 or w == 0:
+            continue
+        step = max(1, BATCH_PIXELS // (h * w))
+        for start in range(0, len(members), step):
+            rows = members[start:start + step]
+            stack = frame[(upper[rows, None, None] + np.arange(h)[None, :, None]),
+                          (left[rows, None, None] + np.arange(w)[None, None, :])]
+            # 浅色背景上 <= 128 的像素是文本，深色背景上 > 128 的像素是文本
+            light = (means[rows] > 128)[:, None, None]
+            ink = np.where(light, stack <= 128, stack > 128)
+            text_rows = ink.any(axis=2)
+            count = text_rows.sum(axis=1)
+            # 每行第一个/最后一个文本像素到左右边界的距离，只在有文本的行上平均
+            first = np.where(text_rows, ink.argmax(axis=2), 0).sum(axis=1)
+            last = np.where(text_rows, ink[:, :, ::-1].argmax(axis=2), 0).sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                margins_left[rows] = np.where(count > 0, first / count, 0)
+                margins_right[rows] = np.where(count > 0, last / count, 0)
+    return [alignment_from_margins(l, r, w)
+            for l, r, w in zip(margins_left.tolist(), margins_right.tolist(), widths.tolist())]
+
+def detect_text_alignment(image_path):
+    # 读取灰度图像（路径、PIL 图像或 numpy 数组；二维数组直接使用，不复制）
+    image = to_gray_array(image_path)
+    return detect_text_alignment_batch(image, [(0, 0, image.shape[1], image.shape[0])])[0]
+
 
 if __name__ == '__main__':
     align = detect_text_alignment('/Users/huanghuaxun/PycharmProjects/setdiff/v2/test/ltr modeleaf_node1_180138312601449.png')
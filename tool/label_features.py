@@ -0,0 +1,157 @@
+import numpy as np
+
+import color_utils
+import cv_utils
+
+
+class LabelMap:
+    """
+    All leaf bounds of a screen rasterized into one integer label image, so per-node statistics come
+    from a few bincount/unique passes over the frame instead of one crop per node.
+
+    A pixel can only carry one label, so only nodes that lie inside the frame and do not overlap any
+    other node are labelled ("exclusive"); statistics of the other nodes are None and have to be taken
+    from their own crop (see extract_alignments / extract_top_colors).
+    """
+
+    def __init__(self, shape, boxes):
+        """
+        :param shape: (height, width) of the screenshot.
+        :param boxes: Sequence of (x1, y1, x2, y2), one per node.
+        """
+        self.height, self.width = shape[:2]
+        boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+        self.left = np.minimum(boxes[:, 0], boxes[:, 2])
+        self.right = np.maximum(boxes[:, 0], boxes[:, 2])
+        self.upper = np.minimum(boxes[:, 1], boxes[:, 3])
+        self.lower = np.maximum(boxes[:, 1], boxes[:, 3])
+        self.area = (self.right - self.left) * (self.lower - self.upper)
+
+        inside = (self.right <= self.width) & (self.lower <= self.height) & (self.area > 0)
+        # How many inside nodes cover each pixel, from a 2-D difference array
+        count = np.count_nonzero(inside)
+        delta = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+        for rows, cols, sign in ((self.upper, self.left, 1), (self.upper, self.right, -1),
+                                 (self.lower, self.left, -1), (self.lower, self.right, 1)):
+            np.add.at(delta, (rows[inside], cols[inside]), np.full(count, sign, dtype=np.int32))
+        coverage = delta.cumsum(axis=0).cumsum(axis=1)[:-1, :-1]
+        # A node is exclusive when no pixel of it is covered twice
+        shared = np.zeros((self.height + 1, self.width + 1), dtype=np.int64)
+        np.cumsum(np.cumsum(coverage > 1, axis=0, dtype=np.int64), axis=1, out=shared[1:, 1:])
+        overlapped = np.zeros(len(boxes), dtype=np.int64)
+        u, d, l, r = self.upper[inside], self.lower[inside], self.left[inside], self.right[inside]
+        overlapped[inside] = shared[d, r] - shared[u, r] - shared[d, l] + shared[u, l]
+        self.exclusive = inside & (overlapped == 0)
+
+        self.labels = np.full((self.height, self.width), -1, dtype=np.int32)
+        for i in np.flatnonzero(self.exclusive).tolist():
+            self.labels[self.upper[i]:self.lower[i], self.left[i]:self.right[i]] = i
+        self._flat = self.labels.ravel()
+        self._pixels = np.flatnonzero(self._flat >= 0)
+
+    def __len__(self):
+        return len(self.exclusive)
+
+    def _per_node(self, values):
+        # None for nodes that are not exclusive
+        return [value if exclusive else None for value, exclusive in zip(values, self.exclusive.tolist())]
+
+    def _sum(self, weights=None, pixels=None):
+        pixels = self._pixels if pixels is None else pixels
+        return np.bincount(self._flat[pixels], weights=weights, minlength=len(self))
+
+    def mean_luminance(self, gray):
+        """
+        Mean gray value per exclusive node (other nodes are not meaningful); sums of integers are exact,
+        so this equals np.mean of the crop.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self._sum(gray.ravel()[self._pixels].astype(np.float64)) / self.area
+
+    def ink(self, gray):
+        """
+        Text pixels of every exclusive node, with the same rule as cv_utils.detect_text_alignment:
+        <= 128 on a light background (mean > 128), > 128 on a dark one.
+
+        :return: Boolean (height, width) mask.
+        """
+        light = self.mean_luminance(gray) > 128
+        owner = np.maximum(self.labels, 0)
+        return (self.labels >= 0) & np.where(light[owner], gray <= 128, gray > 128)
+
+    def ink_counts(self, gray):
+        ink = self.ink(gray).ravel()
+        return self._sum(pixels=np.flatnonzero(ink)).astype(np.int64)
+
+    def row_margins(self, gray):
+        """
+        Average left/right margin of the text rows of every node, as in cv_utils.detect_text_alignment.
+
+        :return: (avg_left_margin, avg_right_margin, text_rows) arrays; margins are 0 without text rows.
+        """
+        ys, xs = np.nonzero(self.ink(gray))
+        labels = self.labels[ys, xs].astype(np.int64)
+        left = np.zeros(len(self))
+        right = np.zeros(len(self))
+        rows = np.zeros(len(self), dtype=np.int64)
+        if len(ys):
+            # Row-major order keeps the ink of one (node, row) contiguous: first and last are the outer columns
+            keys = labels * self.height + ys
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+            ends = np.concatenate((starts[1:], [len(keys)])) - 1
+            owner = labels[starts]
+            rows = np.bincount(owner, minlength=len(self))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                left = np.bincount(owner, weights=xs[starts] - self.left[owner], minlength=len(self)) / rows
+                right = np.bincount(owner, weights=self.right[owner] - 1 - xs[ends], minlength=len(self)) / rows
+            left[rows == 0] = 0
+            right[rows == 0] = 0
+        return left, right, rows
+
+    def alignments(self, gray):
+        """
+        :return: Alignment per node ('left', 'right', 'center', 'justify', 'other'), None when not exclusive.
+        """
+        left, right, _ = self.row_margins(gray)
+        widths = (self.right - self.left).tolist()
+        return self._per_node(cv_utils.alignment_from_margins(l, r, w)
+                              for l, r, w in zip(left.tolist(), right.tolist(), widths))
+
+    def top_colors(self, rgb, num_colors=2):
+        """
+        Most frequent colors per node, counted in one color_utils.top_colors_by_label pass; the same
+        result as color_utils.top_colors on each crop.
+
+        :param rgb: (height, width, 3) uint8 array.
+        :return: [(color tuple, count)] per node, None when not exclusive.
+        """
+        packed = color_utils.pack_rgb(rgb.reshape(-1, rgb.shape[-1])[self._pixels, :3])
+        return self._per_node(color_utils.top_colors_by_label(packed, self._flat[self._pixels], len(self), num_colors))
+
+
+def extract_alignments(gray, boxes):
+    """
+    Text alignment of every box: label map for the exclusive nodes, cv_utils.detect_text_alignment_batch
+    on their crops for the rest. Same results as classifying every crop separately.
+    """
+    boxes = [tuple(box) for box in boxes]
+    alignments = LabelMap(gray.shape, boxes).alignments(gray)
+    rest = [i for i, alignment in enumerate(alignments) if alignment is None]
+    for i, alignment in zip(rest, cv_utils.detect_text_alignment_batch(gray, [boxes[i] for i in rest])):
+        alignments[i] = alignment
+    return alignments
+
+
+def extract_top_colors(rgb, boxes, num_colors=2, fallback=None):
+    """
+    Top colors with their counts for every box: label map for the exclusive nodes, fallback(box) for the rest.
+
+    :param rgb: (height, width, 3) uint8 array of the screenshot.
+    :param fallback: Callable(box) -> [(color, count)] for nodes that overlap others or leave the frame.
+    """
+    boxes = [tuple(box) for box in boxes]
+    colors = LabelMap(rgb.shape, boxes).top_colors(rgb, num_colors)
+    for i, top in enumerate(colors):
+        if top is None:
+            colors[i] = fallback(boxes[i])
+    return colors
@@ -0,0 +1,182 @@
+import numpy as np
+
+from view_tree import iter_leaves
+
+
+class LeafTable:
+    """
+    Column view of the leaves of one screen: parallel arrays of bounds, depth, class id and view id index,
+    so per-screen geometry queries are array operations instead of loops over Node objects.
+
+    nodes[i] is the Node of row i; class_names[class_id[i]] and view_ids[view_index[i]] give its class
+    name and view id (None when it has none).
+    """
+
+    COLUMNS = ('x1', 'y1', 'x2', 'y2', 'depth', 'class_id', 'view_index')
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        count = len(self.nodes)
+        self.x1 = np.fromiter((node.x1 for node in self.nodes), dtype=np.int64, count=count)
+        self.y1 = np.fromiter((node.y1 for node in self.nodes), dtype=np.int64, count=count)
+        self.x2 = np.fromiter((node.x2 for node in self.nodes), dtype=np.int64, count=count)
+        self.y2 = np.fromiter((node.y2 for node in self.nodes), dtype=np.int64, count=count)
+        self.depth = np.fromiter((node.indent for node in self.nodes), dtype=np.int32, count=count)
+
+        # Interned in order of first occurrence
+        classes = {}
+        view_ids = {}
+        self.class_id = np.fromiter((classes.setdefault(node.className, len(classes)) for node in self.nodes),
+                                    dtype=np.int32, count=count)
+        self.view_index = np.fromiter((view_ids.setdefault(node.view_id, len(view_ids)) for node in self.nodes),
+                                      dtype=np.int32, count=count)
+        self.class_names = list(classes)
+        self.view_ids = list(view_ids)
+
+    @classmethod
+    def from_tree(cls, root, keep_empty=False):
+        """
+        Table of the leaves of a tree in document order. Zero-area leaves are dropped unless keep_empty,
+        the same selection as view_tree.find_leaf_nodes; leaves without bounds are always dropped.
+        """
+        table = cls([] if root is None else (node for node in iter_leaves(root) if node.x1 is not None))
+        return table if keep_empty else table.select(table.nonzero_area())
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def select(self, rows):
+        """
+        Sub-table of the rows picked by a boolean mask or an index array, in the given order.
+        """
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        table = LeafTable.__new__(LeafTable)
+        table.nodes = [self.nodes[i] for i in rows.tolist()]
+        for column in self.COLUMNS:
+            setattr(table, column, getattr(self, column)[rows])
+        # Ids keep pointing into the same interned lists
+        table.class_names = self.class_names
+        table.view_ids = self.view_ids
+        return table
+
+    def width(self):
+        return self.x2 - self.x1
+
+    def height(self):
+        return self.y2 - self.y1
+
+    def nonzero_area(self):
+        return (self.x1 != self.x2) & (self.y1 != self.y2)
+
+    def centers(self):
+        # Float centers, as used for distances
+        return (self.x1 + self.x2) / 2, (self.y1 + self.y2) / 2
+
+    def center_grid(self, cell_size):
+        """
+        Uniform grid over the float centers of the rows, for radius queries (see CenterGrid).
+        """
+        return CenterGrid(*self.centers(), cell_size)
+
+    def center_x(self):
+        # Integer horizontal center, as used for grouping
+        return (self.x1 + self.x2) // 2
+
+    def near_left(self, threshold):
+        return self.x1 <= threshold
+
+    def near_right(self, screen_width, threshold):
+        return self.x2 >= screen_width - threshold
+
+    def size_between(self, min_width=0, min_height=0, max_width=None, max_height=None):
+        mask = (self.width() >= min_width) & (self.height() >= min_height)
+        if max_width is not None:
+            mask &= self.width() <= max_width
+        if max_height is not None:
+            mask &= self.height() <= max_height
+        return mask
+
+    def group_by(self, keys, rows=None):
+        """
+        Group rows by a key column.
+
+        :param keys: Array with one key per row, e.g. table.x1 or table.center_x().
+        :param rows: Optional boolean mask of the rows to group.
+        :return: {key: [nodes]} with plain Python keys; groups and their members keep the order in which
+                 they first occur in the table.
+        """
+        keys = np.asarray(keys)
+        index = np.arange(len(self.nodes)) if rows is None else np.flatnonzero(rows)
+        if index.size == 0:
+            return {}
+        unique_keys, first, inverse = np.unique(keys[index], return_index=True, return_inverse=True)
+        group_order = np.argsort(first, kind='stable')
+        members = np.argsort(inverse.ravel(), kind='stable')
+        bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(unique_keys)))
+        starts = np.concatenate(([0], bounds[:-1]))
+        groups = {}
+        key_list = unique_keys.tolist()
+        for g in group_order.tolist():
+            groups[key_list[g]] = [self.nodes[i] for i in index[members[starts[g]:bounds[g]]].tolist()]
+        return groups
+
+
+class CenterGrid:
+    """
+    Uniform grid over node centers. A radius query only looks at the cells within the radius instead of
+    measuring the distance to every node of the screen.
+    """
+
+    def __init__(self, cx, cy, cell_size):
+        self.cx = np.asarray(cx, dtype=np.float64)
+        self.cy = np.asarray(cy, dtype=np.float64)
+        self.cell_size = max(float(cell_size), 1.0)
+        self.cells = {}
+        keys = np.column_stack((np.floor(self.cx / self.cell_size), np.floor(self.cy / self.cell_size)))
+        for i, key in enumerate(map(tuple, keys.astype(np.int64).tolist())):
+            self.cells.setdefault(key, []).append(i)
+
+    def __len__(self):
+        return len(self.cx)
+
+    def query(self, x, y, radius):
+        """
+        Rows whose center is within radius (inclusive) of the point (x, y), in ascending order.
+        """
+        reach = int(np.ceil(radius / self.cell_size))
+        kx, ky = int(np.floor(x / self.cell_size)), int(np.floor(y / self.cell_size))
+        rows = [i for dx in range(-reach, reach + 1) for dy in range(-reach, reach + 1)
+                for i in self.cells.get((kx + dx, ky + dy), ())]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        rows = np.sort(np.asarray(rows, dtype=np.int64))
+        close = (self.cx[rows] - x) ** 2 + (self.cy[rows] - y) ** 2 <= radius * radius
+        return rows[close]
+
+    def within(self, seeds, radius, transitive=False):
+        """
+        Rows within radius of any seed row, the seeds included.
+
+        :param seeds: Boolean mask or index array of the seed rows.
+        :param transitive: Also take rows within radius of rows already taken, i.e. the whole clusters
+                           (single linkage) that contain the seeds.
+        :return: Boolean mask over the rows.
+        """
+        seeds = np.asarray(seeds)
+        seeds = np.flatnonzero(seeds) if seeds.dtype == bool else seeds.astype(np.int64)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[seeds] = True
+        frontier = seeds.tolist()
+        while frontier:
+            found = []
+            for i in frontier:
+                rows = self.query(self.cx[i], self.cy[i], radius)
+                found.extend(rows[~mask[rows]].tolist())
+                mask[rows] = True
+            frontier = found if transitive else []
+        return mask
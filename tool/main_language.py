@@ -1,53 +1,25 @@
+import argparse
 import os
-import re
+import sys
 from PIL import Image
+import batch_runner
 import cv_utils
+import capture
+import label_features
 import glob
+import view_tree
+from leaf_table import LeafTable
+from view_tree import find_leaf_nodes, load_view_tree, print_tree, read_view_tree_from_file
 
 
-class Node:
-    def __init__(self, line):
-        self.parse_line(line)
-        self.children = []
-
-    def parse_line(self, line):
-        match = re.match(r'(!*)([^{]+){([^}]+)}', line)
-        if match:
-            self.indent = len(match.group(1))
-            self.className = match.group(2).strip()
-            details = match.group(3).split(' ')
-            self.view_id = None
-            self.layout_bounds = None
-            for detail in details:
-                if detail.startswith("app:id/") or detail.startswith("android:id"):
-                    self.view_id = detail
-                elif len(detail) == 7:
-                    self.view_id = detail
-            match_final_numbers = re.findall(r'\d+', line)
-            if len(match_final_numbers) >= 4:
-                self.layout_bounds = ' '.join(match_final_numbers[-4:])
-                self.x1 = int(self.layout_bounds.split(' ')[0])
-                self.y1 = int(self.layout_bounds.split(' ')[1])
-                self.x2 = int(self.layout_bounds.split(' ')[2])
-                self.y2 = int(self.layout_bounds.split(' ')[3])
-            else:
-                pass
-        else:
-            pass
+class Node(view_tree.Node):
+    __slots__ = ()
 
+    RESOURCE_ID_PREFIXES = ("app:id/", "android:id")
 
     def __repr__(self):
         return f"Node(className={self.className}, view_id={self.view_id}, layout_bounds={self.layout_bounds})"
 
-    def get_class_name(self):
-        return self.className
-
-    def get_view_id(self):
-        return self.view_id
-
-    def get_layout_bounds(self):
-        return self.layout_bounds
-
     def __eq__(self, other):
         if isinstance(other, Node):
             return self.view_id == other.view_id
@@ -58,71 +30,40 @@ class Node:
 
 
 def build_tree(lines):
-    if not lines:
-        return None
-
-    def compute_indent(line):
-        return line.count('!')
-
-    root_line = lines[0]
-    root = Node(root_line)
-    stack = [root]
-
-    for line in lines[1:]:
-        node = Node(line)
-        while len(stack) > 1 and stack[-1].indent >= node.indent:
-            stack.pop()
-        if stack[-1].indent < node.indent:
-            stack[-1].children.append(node)
-            stack.append(node)
-        else:
-            raise ValueError("Invalid tree structure: indentation error.")
-
-    return root
-
-
-def print_tree(node, level=0):
-    print('  ' * level + repr(node))
-    for child in node.children:
-        print_tree(child, level + 1)
-
+    return view_tree.build_tree(lines, Node)
 
-def find_leaf_nodes(node):
-    leaf_nodes = []
-    if not node.children:
-        if node.x1 != node.x2 and node.y1 != node.y2:
-            leaf_nodes.append(node)
-    for child in node.children:
-        leaf_nodes.extend(find_leaf_nodes(child))
-    return leaf_nodes
 
-
-def crop_image(image_path, coord1, coord2, output_path, node):
-    with Image.open(image_path) as img:
-        left = min(coord1[0], coord2[0])
-        upper = min(coord1[1], coord2[1])
-        right = max(coord1[0], coord2[0])
-        lower = max(coord1[1], coord2[1])
-        cropped_img = img.crop((left, upper, right, lower))
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        cropped_img.save(output_path)
-        node.imagePath = output_path
-
-
-def read_view_tree_from_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = [line.strip() for line in file.readlines()]
-    return lines
+def crop_image(image, coord1, coord2, output_path, node):
+    # image 可以是路径，也可以是已经解码的截图（避免每个节点重新打开截图）
+    img = cv_utils.open_image(image)
+    left = min(coord1[0], coord2[0])
+    upper = min(coord1[1], coord2[1])
+    right = max(coord1[0], coord2[0])
+    lower = max(coord1[1], coord2[1])
+    cropped_img = img.crop((left, upper, right, lower))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    cropped_img.save(output_path)
+    node.imagePath = output_path
 
 
 def group_views(leaf_nodes, image_path):
+    """
+    :param leaf_nodes: LeafTable（或叶节点列表）
+    :param image_path: 截图路径，或内存中的截图（PIL 图像 / numpy 数组，灰度数组可直接切片）
+    """
+    table = leaf_nodes if isinstance(leaf_nodes, LeafTable) else LeafTable(leaf_nodes)
+    gray = cv_utils.to_gray_array(image_path)
     alignment_groups = {'left': [], 'right': [], 'center': [], 'justify': []}
-    vertical_groups_left = {}
-    vertical_groups_right = {}
-    vertical_groups_center = {}
 
-    for node in leaf_nodes:
-        alignment = cv_utils.detect_text_alignment(node.imagePath)  # 传入必要的参数
+    # 垂直分组：按左边界 x1、右边界 x2、中点 x_center
+    vertical_groups_left = table.group_by(table.x1)
+    vertical_groups_right = table.group_by(table.x2)
+    vertical_groups_center = table.group_by(table.center_x())
+
+    # 在灰度截图的标签图上一次性判断所有叶节点的对齐方式，不再经过磁盘上的裁剪图
+    boxes = list(zip(table.x1.tolist(), table.y1.tolist(), table.x2.tolist(), table.y2.tolist()))
+    alignments = label_features.extract_alignments(gray, boxes)
+    for node, alignment in zip(table, alignments):
         # 先判断居中对齐
         if alignment == 'center':
             alignment_groups['center'].append(node)
@@ -135,49 +76,47 @@ def group_views(leaf_nodes, image_path):
         elif alignment == 'justify':
             alignment_groups['justify'].append(node)
 
-        # 计算中心点
-        x_center = (node.x1 + node.x2) // 2
-
-        # 垂直分组，按左边界 x1
-        if node.x1 not in vertical_groups_left:
-            vertical_groups_left[node.x1] = []
-        vertical_groups_left[node.x1].append(node)
-
-        # 垂直分组，按右边界 x2
-        if node.x2 not in vertical_groups_right:
-            vertical_groups_right[node.x2] = []
-        vertical_groups_right[node.x2].append(node)
-
-        # 垂直分组，按中点 x_center
-        if x_center not in vertical_groups_center:
-            vertical_groups_center[x_center] = []
-        vertical_groups_center[x_center].append(node)
-
     return alignment_groups, vertical_groups_left, vertical_groups_right, vertical_groups_center
 
-def process_mode(view_tree_lines, image_path, mode_name):
+def process_mode(view_tree_lines, image_path, mode_name, save_crops=False):
+    """
+    :param view_tree_lines: view tree 的每一行（来自文件或 capture.capture），或 load_view_tree 得到的根节点
+    :param image_path: 截图路径，或内存中的截图（PIL 图像 / numpy 数组）
+    :param save_crops: 调试用，把每个叶节点的裁剪图保存到 test/ 下（记录在 node.imagePath）
+    """
     root = build_tree(view_tree_lines)
-    leaf_nodes = find_leaf_nodes(root)
-
-    for i, node in enumerate(leaf_nodes):
-        bounds = node.get_layout_bounds()
-        if bounds:
-            x1, y1, x2, y2 = map(int, bounds.split())
-            bounds_str = f"{x1}{y1}{x2}{y2}"
-            output_path = os.path.join("test", f"{mode_name.lower()}leaf_node{i}_{bounds_str}.png")
-            crop_image(image_path, (x1, y1), (x2, y2), output_path, node)
+    table = LeafTable.from_tree(root)
+    leaf_nodes = table.nodes
+
+    # 截图只解码、灰度化一次，之后每个叶节点只取切片
+    image = cv_utils.open_image(image_path)
+    gray = cv_utils.to_gray_array(image)
+    if save_crops:
+        for i, node in enumerate(leaf_nodes):
+            bounds = node.get_layout_bounds()
+            if bounds:
+                x1, y1, x2, y2 = map(int, bounds.split())
+                bounds_str = f"{x1}{y1}{x2}{y2}"
+                output_path = os.path.join("test", f"{mode_name.lower()}leaf_node{i}_{bounds_str}.png")
+                crop_image(image, (x1, y1), (x2, y2), output_path, node)
 
     alignment_groups, vertical_groups_left, vertical_groups_right, vertical_groups_center = group_views(
-        leaf_nodes, image_path
+        table, gray
     )
 
     def groups_are_equal(group1, group2):
         """Helper function to check if two groups contain the same elements."""
         return set(group1) == set(group2)
 
+    # 倒排索引：节点 -> 它所在的对齐方式集合（与 `node in alignment_groups[...]` 一样按 Node.__eq__ 比较），每次判断 O(1)
+    alignments_of = alignment_index(alignment_groups)
+
+    def aligned(node, *alignments):
+        return not alignments_of.get(node, set()).isdisjoint(alignments)
+
     # Filter vertical_groups_center to retain only 'center' and 'justify' alignments
     vertical_groups_center = {
-        key: [node for node in nodes if (node in alignment_groups['center'] or node in alignment_groups['justify'])]
+        key: [node for node in nodes if aligned(node, 'center', 'justify')]
         for key, nodes in vertical_groups_center.items()
     }
 
@@ -186,13 +125,13 @@ def process_mode(view_tree_lines, image_path, mode_name):
 
     # Filter vertical_groups_left to retain only 'left' and 'justify' alignments and exclude center nodes
     vertical_groups_left = {
-        key: [node for node in nodes if (node in alignment_groups['left'] or node in alignment_groups['justify']) and node not in center_nodes]
+        key: [node for node in nodes if aligned(node, 'left', 'justify') and node not in center_nodes]
         for key, nodes in vertical_groups_left.items()
     }
 
     # Filter vertical_groups_right to retain only 'right' and 'justify' alignments and exclude center nodes
     vertical_groups_right = {
-        key: [node for node in nodes if (node in alignment_groups['right'] or node in alignment_groups['justify']) and node not in center_nodes]
+        key: [node for node in nodes if aligned(node, 'right', 'justify') and node not in center_nodes]
         for key, nodes in vertical_groups_right.items()
     }
 
@@ -222,76 +161,98 @@ def process_mode(view_tree_lines, image_path, mode_name):
     return leaf_nodes, alignment_groups, vertical_groups_left, vertical_groups_right, vertical_groups_center
 
 
+def alignment_index(alignment_groups):
+    """
+    :param alignment_groups: {alignment: [nodes]}
+    :return: {node: {alignment}}
+    """
+    index = {}
+    for alignment, nodes in alignment_groups.items():
+        for node in nodes:
+            index.setdefault(node, set()).add(alignment)
+    return index
+
+
+# LTR 中某种对齐的节点在 RTL 中应镜像对齐；依次检查的 RTL 对齐方式
+MIRROR_CHECKS = {
+    'left': ('right', 'center'),
+    'right': ('left', 'center'),
+    'center': ('left', 'right'),
+}
+
+
+NO_BUGS = "No bugs detected."
+
+
 def compare_groups(ltr_vertical_groups_left, rtl_vertical_groups_left, ltr_vertical_groups_right,
                    rtl_vertical_groups_right, ltr_vertical_groups_center, rtl_vertical_groups_center,
-                   ltr_filename, rtl_filename):
+                   ltr_filename, rtl_filename, report_path="bug_reports.txt"):
+    """
+    :param report_path: 写入 bug 报告的文件；None 时不写文件（批量分析时由 main 汇总后统一写入）
+    :return: bug 报告列表
+    """
     def collect_items(group_dict):
         items = []
         for key, nodes in group_dict.items():
             items.append(set(nodes))
         return items
 
-    # Collect items from each group
-    ltr_left_items = collect_items(ltr_vertical_groups_left)
-    rtl_left_items = collect_items(rtl_vertical_groups_left)
-    ltr_right_items = collect_items(ltr_vertical_groups_right)
-    rtl_right_items = collect_items(rtl_vertical_groups_right)
-    ltr_center_items = collect_items(ltr_vertical_groups_center)
-    rtl_center_items = collect_items(rtl_vertical_groups_center)
+    # 每个 RTL 节点所在的对齐方式，建一次，之后每个 LTR 节点只查一次字典
+    rtl_index = alignment_index({
+        alignment: [node for nodes in groups.values() for node in nodes]
+        for alignment, groups in (('left', rtl_vertical_groups_left), ('right', rtl_vertical_groups_right),
+                                  ('center', rtl_vertical_groups_center))
+    })
+
+    name = ltr_filename.split('/')[-1]
+
+    def describe_bug(item, ltr_alignment, rtl_alignment):
+        message = f"Bug detected: {name} Item '{item}' from LTR {ltr_alignment} group found in RTL {rtl_alignment} group."
+        if ltr_alignment == 'left':
+            return message + (")" if rtl_alignment == 'right' else " ")
+        return message + f" (LTR: {ltr_filename}, RTL: {rtl_filename})"
 
     # Initialize a list to collect bug reports
     bug_reports = []
 
-    # Check for bug: if any item in ltr_left_items is found in rtl_right_items or rtl_center_items
-    for ltr_group in ltr_left_items:
-        for item in ltr_group:
-            if any(item in rtl_group for rtl_group in rtl_right_items):
-                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR left group found in RTL right group.)"
-                print(bug_message)
-                bug_reports.append(bug_message)
-            if any(item in rtl_group for rtl_group in rtl_center_items):
-                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR left group found in RTL center group. "
-                print(bug_message)
-                bug_reports.append(bug_message)
-
-    # Check for bug: if any item in ltr_right_items is found in rtl_left_items or rtl_center_items
-    for ltr_group in ltr_right_items:
-        for item in ltr_group:
-            if any(item in rtl_group for rtl_group in rtl_left_items):
-                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR right group found in RTL left group. (LTR: {ltr_filename}, RTL: {rtl_filename})"
-                print(bug_message)
-                bug_reports.append(bug_message)
-            if any(item in rtl_group for rtl_group in rtl_center_items):
-                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR right group found in RTL center group. (LTR: {ltr_filename}, RTL: {rtl_filename})"
-                print(bug_message)
-                bug_reports.append(bug_message)
-
-    # Check for bug: if any item in ltr_center_items is found in rtl_left_items or rtl_right_items
-    for ltr_group in ltr_center_items:
-        for item in ltr_group:
-            if any(item in rtl_group for rtl_group in rtl_left_items):
-                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR center group found in RTL left group. (LTR: {ltr_filename}, RTL: {rtl_filename})"
-                print(bug_message)
-                bug_reports.append(bug_message)
-            if any(item in rtl_group for rtl_group in rtl_right_items):
-                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR center group found in RTL right group. (LTR: {ltr_filename}, RTL: {rtl_filename})"
-                print(bug_message)
-                bug_reports.append(bug_message)
+    # Check for bug: an item of an LTR group is found in an RTL group of a non-mirrored alignment
+    ltr_groups = {'left': ltr_vertical_groups_left, 'right': ltr_vertical_groups_right,
+                  'center': ltr_vertical_groups_center}
+    for ltr_alignment, rtl_alignments in MIRROR_CHECKS.items():
+        for ltr_group in collect_items(ltr_groups[ltr_alignment]):
+            for item in ltr_group:
+                found = rtl_index.get(item)
+                if not found:
+                    continue
+                for rtl_alignment in rtl_alignments:
+                    if rtl_alignment in found:
+                        bug_message = describe_bug(item, ltr_alignment, rtl_alignment)
+                        print(bug_message)
+                        bug_reports.append(bug_message)
 
     if not bug_reports:
-        print("No bugs detected.")
-        bug_reports.append("No bugs detected.")
+        print(NO_BUGS)
+        bug_reports.append(NO_BUGS)
 
     # Save bug reports to a text file
-    with open("bug_reports.txt", "w") as file:
+    if report_path:
+        write_reports(bug_reports, report_path)
+    return bug_reports
+
+
+def write_reports(bug_reports, report_path="bug_reports.txt"):
+    with open(report_path, "w") as file:
         for report in bug_reports:
             file.write(report + "\n")
 
 
-def main(prefix_ltr='1_', prefix_rtl='2.5_'):
-    base_dir = '/Users/huanghuaxun/PycharmProjects/setdiff/v2/apk_utils/generated_data'
-    os.makedirs("test", exist_ok=True)
+def find_pairs(base_dir, prefix_ltr, prefix_rtl):
+    """
+    在 base_dir 中按文件名前缀配对 LTR/RTL 的 view tree 和截图。
 
+    :return: [(ltr_view_tree_file, rtl_view_tree_file, ltr_image_path, rtl_image_path)]
+    """
+    pairs = []
     ltr_view_tree_files = sorted(glob.glob(os.path.join(base_dir, f'{prefix_ltr}*_view_tree.txt')))
 
     for ltr_view_tree_file in ltr_view_tree_files:
@@ -302,20 +263,66 @@ def main(prefix_ltr='1_', prefix_rtl='2.5_'):
         rtl_image_path = os.path.join(base_dir, f'{prefix_rtl}{common_part}_screenshot.png')
 
         if os.path.exists(rtl_view_tree_file) and os.path.exists(ltr_image_path) and os.path.exists(rtl_image_path):
-            ltr_view_tree_lines = read_view_tree_from_file(ltr_view_tree_file)
-            rtl_view_tree_lines = read_view_tree_from_file(rtl_view_tree_file)
+            pairs.append((ltr_view_tree_file, rtl_view_tree_file, ltr_image_path, rtl_image_path))
+    return pairs
+
+def analyze_pair(pair):
+    """
+    分析一对 LTR/RTL 屏幕。
+
+    :param pair: (ltr_view_tree_file, rtl_view_tree_file, ltr_image_path, rtl_image_path)
+    :return: 这一对的 bug 报告列表
+    """
+    ltr_view_tree_file, rtl_view_tree_file, ltr_image_path, rtl_image_path = pair
+    ltr_view_tree = load_view_tree(ltr_view_tree_file, Node)  # 解析结果缓存在 .npz 中
+    rtl_view_tree = load_view_tree(rtl_view_tree_file, Node)
+
+    ltr_leaf_nodes, ltr_alignment_groups, ltr_vertical_groups_left, ltr_vertical_groups_right, ltr_vertical_groups_center = process_mode(
+        ltr_view_tree, ltr_image_path, "LTR Mode")
+    rtl_leaf_nodes, rtl_alignment_groups, rtl_vertical_groups_left, rtl_vertical_groups_right, rtl_vertical_groups_center = process_mode(
+        rtl_view_tree, rtl_image_path, "RTL Mode")
+
+    return compare_groups(
+        ltr_vertical_groups_left, rtl_vertical_groups_left,
+        ltr_vertical_groups_right, rtl_vertical_groups_right,
+        ltr_vertical_groups_center, rtl_vertical_groups_center,
+        ltr_view_tree_file, rtl_view_tree_file, report_path=None
+    )
+
 
-            ltr_leaf_nodes, ltr_alignment_groups, ltr_vertical_groups_left, ltr_vertical_groups_right, ltr_vertical_groups_center = process_mode(
-                ltr_view_tree_lines, ltr_image_path, "LTR Mode")
-            rtl_leaf_nodes, rtl_alignment_groups, rtl_vertical_groups_left, rtl_vertical_groups_right, rtl_vertical_groups_center = process_mode(
-                rtl_view_tree_lines, rtl_image_path, "RTL Mode")
+def main(prefix_ltr='1_', prefix_rtl='2.5_', pairs_manifest=None, processes=1):
+    """
+    :param pairs_manifest: 可选，apk_utils/paired_executor.py 写出的 pairs.jsonl（baseline 为 LTR，variant 为 RTL），
+                           给出时直接使用其中的配对，不再按前缀 glob。
+    :param processes: 并行分析的进程数（None 为 CPU 核数）；各对的输出和 bug 报告按配对顺序合并，与逐对分析相同
+    :return: 分析失败的配对数
+    """
+    base_dir = '/Users/huanghuaxun/PycharmProjects/setdiff/v2/apk_utils/generated_data'
+    os.makedirs("test", exist_ok=True)
+
+    if pairs_manifest:
+        pairs = [(ltr['view_tree.txt'], rtl['view_tree.txt'], ltr['screenshot.png'], rtl['screenshot.png'])
+                 for _, ltr, rtl in capture.read_pairs(pairs_manifest)]
+    else:
+        pairs = find_pairs(base_dir, prefix_ltr, prefix_rtl)
+
+    # 所有配对的 bug 报告汇总到一个文件
+    bug_reports = []
+    failures = []
+    for pair, reports, error in batch_runner.run_batch(analyze_pair, pairs, processes):
+        if error:
+            failures.append((pair, error))
+            continue
+        bug_reports.extend(report for report in reports if report != NO_BUGS)
+    write_reports(bug_reports or [NO_BUGS])
+    return batch_runner.report_failures(failures, len(pairs))
 
-            compare_groups(
-                ltr_vertical_groups_left, rtl_vertical_groups_left,
-                ltr_vertical_groups_right, rtl_vertical_groups_right,
-                ltr_vertical_groups_center, rtl_vertical_groups_center,
-                ltr_view_tree_file, rtl_view_tree_file
-            )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Compare the alignment of LTR and RTL captures.")
+    parser.add_argument('-prefix_ltr', default='1_', help="file name prefix of the LTR captures")
+    parser.add_argument('-prefix_rtl', default='2.5_', help="file name prefix of the RTL captures")
+    parser.add_argument('-pairs', default=None, help="pairs.jsonl written by apk_utils/paired_executor.py")
+    parser.add_argument('-processes', type=int, default=None, help="worker processes, default the CPU count")
+    args = parser.parse_args()
+    sys.exit(1 if main(args.prefix_ltr, args.prefix_rtl, args.pairs, args.processes) else 0)
@@ -1,203 +1,266 @@
+import argparse
 from PIL import Image
-from collections import Counter, defaultdict
-import re
 import os
+import sys
 import numpy as np
+import batch_runner
+import cv_utils
+import capture
+import color_utils
+import node_matcher
+from leaf_table import LeafTable
+from view_tree import Node, build_tree, find_leaf_nodes, load_view_tree, print_tree, read_view_tree_from_file
 
 
-class Node:
-    def __init__(self, line, indent):
-        self.parse_line(line)
-        self.children = []
-        self.indent = indent
-
-    def parse_line(self, line):
-        match = re.match(r'(!*)([^{]+){([^}]+)}', line)
-        self.indent = len(match.group(1))
-        self.className = match.group(2).strip()
-        details = match.group(3).split(' ')
-        self.view_id = None
-        self.layout_bounds = None
-        for detail in details:
-            if len(detail) == 7:
-                self.view_id = detail
-        match_final_numbers = re.findall(r'\d+', line)
-        if len(match_final_numbers) >= 4:
-            self.layout_bounds = ' '.join(match_final_numbers[-4:])
-            self.x1 = self.layout_bounds.split(' ')[0]
-            self.y1 = self.layout_bounds.split(' ')[1]
-            self.x2 = self.layout_bounds.split(' ')[2]
-            self.y2 = self.layout_bounds.split(' ')[3]
-
-    def __repr__(self):
-        return f"{'  ' * self.indent}{self.className} (id: {self.view_id}, bounds: {self.layout_bounds})"
-
-    def get_class_name(self):
-        return self.className
-
-    def get_view_id(self):
-        return self.view_id
-
-    def get_layout_bounds(self):
-        return self.layout_bounds
-
-
-def build_tree(lines):
-    if not lines:
-        return None
-
-    def compute_indent(line):
-        return line.count('!')
-
-    root_line = lines[0]
-    root_indent = compute_indent(root_line)
-    root_value = root_line.replace('!', '').strip()
-    root = Node(root_value, root_indent)
-    stack = [root]
-
-    for line in lines[1:]:
-        indent = compute_indent(line)
-        value = line.replace('!', '').strip()
-        node = Node(value, indent)
-        while len(stack) > 1 and stack[-1].indent >= node.indent:
-            stack.pop()
-        if stack[-1].indent < node.indent:
-            stack[-1].children.append(node)
-            stack.append(node)
-        else:
-            raise ValueError("Invalid tree structure: indentation error.")
-
-    return root
-
-
-def print_tree(node, level=0):
-    print(f"{'  ' * level}{node}")
-    for child in node.children:
-        print_tree(child, level + 1)
-
-
-def find_leaf_nodes(node):
-    leaf_nodes = []
-    if not node.children:
-        if node.x1 != node.x2 and node.y1 != node.y2:
-            leaf_nodes.append(node)
-    for child in node.children:
-        leaf_nodes.extend(find_leaf_nodes(child))
-    return leaf_nodes
+def crop_image(image, coord1, coord2, output_path):
+    # image 可以是路径，也可以是已经解码的截图；返回裁剪后的图像，避免再从磁盘读回
+    img = cv_utils.open_image(image)
+    left = min(coord1[0], coord2[0])
+    upper = min(coord1[1], coord2[1])
+    right = max(coord1[0], coord2[0])
+    lower = max(coord1[1], coord2[1])
+    cropped_img = img.crop((left, upper, right, lower))
+    print(f"Coordinates: {coord1}, {coord2}. Cropped image saved to {output_path}")
+    cropped_img.save(output_path)
+    return cropped_img
 
 
-def crop_image(image_path, coord1, coord2, output_path):
-    with Image.open(image_path) as img:
-        left = min(coord1[0], coord2[0])
-        upper = min(coord1[1], coord2[1])
-        right = max(coord1[0], coord2[0])
-        lower = max(coord1[1], coord2[1])
-        cropped_img = img.crop((left, upper, right, lower))
-        print(f"Coordinates: {coord1}, {coord2}. Cropped image saved to {output_path}")
-        cropped_img.save(output_path)
+def get_top_color_counts(image_path, num_colors=2):
+    # [(颜色, 像素数)]，与 Counter(image.getdata()).most_common 的结果相同
+    return color_utils.top_colors(image_path, num_colors)
 
 
 def get_top_colors(image_path, num_colors=2):
-    image = Image.open(image_path)
-    image = image.convert('RGB')
-    pixels = list(image.getdata())
-    color_counter = Counter(pixels)
-    top_colors = color_counter.most_common(num_colors)
+    top_colors = get_top_color_counts(image_path, num_colors)
     top_colors_only = [color for color, count in top_colors]
     return top_colors_only
 
 
-def read_view_tree_from_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = [line.strip() for line in file.readlines()]
-    return lines
-
-
-def process_mode(view_tree_lines, image_path, mode_name):
+def process_mode(view_tree_lines, image_path, mode_name, save_crops=False):
+    """
+    :param view_tree_lines: view tree 的每一行（来自文件或 capture.capture），或 load_view_tree 得到的根节点
+    :param image_path: 截图路径，或内存中的截图（PIL 图像 / numpy 数组）
+    :param save_crops: 调试用，把每个叶节点的裁剪图保存到 test/ 下
+    """
     root = build_tree(view_tree_lines)
-    leaf_nodes = find_leaf_nodes(root)
+    table = LeafTable.from_tree(root)
+    paths = node_matcher.node_paths(root)
     print(f"\n{mode_name} Leaf Nodes:")
-    for node in leaf_nodes:
+    for node in table:
         print(node)
 
     node_colors = {}  # 用于记录每个节点的颜色
-    for i, node in enumerate(leaf_nodes):
+    image = cv_utils.open_image(image_path)  # 截图只解码一次
+    boxes = list(zip(table.x1.tolist(), table.y1.tolist(), table.x2.tolist(), table.y2.tolist()))
+    # 所有叶节点的颜色统计在整张截图上一次完成（标签图；与其他节点重叠或超出截图的节点单独统计）
+    color_counts = color_utils.top_colors_batch(image, boxes)
+    for i, (node, (x1, y1, x2, y2), counts) in enumerate(zip(table, boxes, color_counts)):
         bounds = node.get_layout_bounds()
         if bounds:
-            x1, y1, x2, y2 = map(int, bounds.split())
-            output_path = os.path.join("test", f"{mode_name.lower()}_leaf_node_{i}.png")
-            crop_image(image_path, (x1, y1), (x2, y2), output_path)
-            top_colors = get_top_colors(output_path)
-            print(f"Top colors for {output_path}: {top_colors}")
+            top_colors = [color for color, count in counts]
+            if save_crops:
+                output_path = os.path.join("test", f"{mode_name.lower()}_leaf_node_{i}.png")
+                crop_image(image, (x1, y1), (x2, y2), output_path)
+                print(f"Top colors for {output_path}: {top_colors}")
             node_colors[bounds] = {
                 "class_name": node.get_class_name(),
                 "view_id": node.get_view_id(),
                 "layout_bounds": node.get_layout_bounds(),
+                "path": paths.get(id(node)),
                 "top_colors": top_colors
             }
     return node_colors
 
 
-def color_distance(c1, c2):
-    return np.sqrt(np.sum((np.array(c1) - np.array(c2)) ** 2))
+def color_distance(c1, c2, metric='rgb'):
+    return color_utils.color_distances(c1, c2, metric)
+
+
+# 以标准差为单位的 MAD（正态分布下 1.4826 * MAD ≈ 标准差）
+MAD_SCALE = 1.4826
+
+
+def _group_median(values, groups, n_groups):
+    # 每组的中位数：按 (组, 值) 排序后取每组中间的一个或两个值
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    lower = starts + np.maximum(counts - 1, 0) // 2
+    upper = starts + counts // 2
+    with np.errstate(invalid='ignore'):
+        return np.where(counts > 0, (sorted_values[np.minimum(lower, len(values) - 1)] +
+                                     sorted_values[np.minimum(upper, len(values) - 1)]) / 2, np.nan)
+
+
+def find_outliers(color_changes, threshold=2, method='zscore', groups=None):
+    """
+    :param color_changes: 每个节点的颜色变化距离
+    :param threshold: 以标准差为单位的阈值
+    :param method: 'zscore'（均值/标准差）或 'mad'（中位数/MAD，不易被离群值本身拉偏）
+    :param groups: 可选，每个节点所属的屏幕编号；给出时在每个屏幕内分别统计（多个屏幕一次计算）
+    :return: 离群节点的下标
+    """
+    changes = np.asarray(color_changes, dtype=np.float64)
+    if changes.size == 0:
+        return []
+    if groups is None:
+        if method == 'mad':
+            center = np.median(changes)
+            spread = MAD_SCALE * np.median(np.abs(changes - center))
+        else:
+            center = np.mean(changes)
+            spread = np.std(changes)
+        return np.flatnonzero(np.abs(changes - center) > threshold * spread).tolist()
 
+    groups = np.asarray(groups)
+    n_groups = int(groups.max()) + 1
+    if method == 'mad':
+        center = _group_median(changes, groups, n_groups)
+        spread = MAD_SCALE * _group_median(np.abs(changes - center[groups]), groups, n_groups)
+    else:
+        counts = np.maximum(np.bincount(groups, minlength=n_groups), 1)
+        center = np.bincount(groups, weights=changes, minlength=n_groups) / counts
+        spread = np.sqrt(np.bincount(groups, weights=(changes - center[groups]) ** 2, minlength=n_groups) / counts)
+    return np.flatnonzero(np.abs(changes - center[groups]) > threshold * spread[groups]).tolist()
 
-def find_outliers(color_changes, threshold=2):
-    changes = np.array(color_changes)
-    mean = np.mean(changes)
-    std_dev = np.std(changes)
-    outliers = []
-    for i, change in enumerate(changes):
-        if np.abs(change - mean) > threshold * std_dev:
-            outliers.append(i)
-    return outliers
 
+def _describe(info):
+    return f"UI Component: {info['class_name']} (id: {info['view_id']}, bounds: {info['layout_bounds']})"
 
-def compare_modes(day_colors, night_colors):
-    print("\nComparison of Day Mode and Night Mode:")
-    color_changes = []
-    node_info = []
 
-    for bounds, day_info in day_colors.items():
-        night_info = night_colors.get(bounds)
+def match_modes(day_colors, night_colors, **kwargs):
+    # 按 view id、层级路径和归一化坐标下的 IoU 一一配对日间和夜间的节点（见 node_matcher.match_nodes），
+    # 偏移了几个像素或没有 id 的节点也能配上
+    return node_matcher.match_infos(day_colors.values(), night_colors.values(), **kwargs)
+
+
+def color_changes(matched, metric='rgb'):
+    """
+    一次性计算所有配对节点最主要颜色的变化距离。
+
+    :param matched: [(day_info, night_info)]
+    :param metric: 'rgb' 或 'lab'（CIE76 ΔE，更接近人眼感知的差异）
+    """
+    day_stack, _ = color_utils.stack_colors([day_info['top_colors'] for day_info, _ in matched], 1)
+    night_stack, _ = color_utils.stack_colors([night_info['top_colors'] for _, night_info in matched], 1)
+    return color_distance(day_stack, night_stack, metric)[:, 0]
+
+
+def _print_comparison(day_colors, night_colors, matched):
+    night_of = {id(day_info): night_info for day_info, night_info in matched}
+    print("\nComparison of Day Mode and Night Mode:")
+    for day_info in day_colors.values():
+        night_info = night_of.get(id(day_info))
         if night_info:
-            change = color_distance(day_info['top_colors'][0], night_info['top_colors'][0])
-            color_changes.append(change)
-            node_info.append((day_info, night_info, change))
-            print(f"UI Component: {day_info['class_name']} (id: {day_info['view_id']}, bounds: {day_info['layout_bounds']})")
+            print(_describe(day_info))
             print(f"  Day Mode Colors: {day_info['top_colors']}")
             print(f"  Night Mode Colors: {night_info['top_colors']}")
             if day_info['top_colors'] != night_info['top_colors']:
                 print(f"  Change Detected: {day_info['top_colors']} -> {night_info['top_colors']}")
         else:
-            print(f"UI Component: {day_info['class_name']} (id: {day_info['view_id']}, bounds: {day_info['layout_bounds']}) only found in Day Mode")
+            print(f"{_describe(day_info)} only found in Day Mode")
+
+    matched_night = {id(night_info) for _, night_info in matched}
+    for night_info in night_colors.values():
+        if id(night_info) not in matched_night:
+            print(f"{_describe(night_info)} only found in Night Mode")
 
-    for bounds, night_info in night_colors.items():
-        if bounds not in day_colors:
-            print(f"UI Component: {night_info['class_name']} (id: {night_info['view_id']}, bounds: {night_info['layout_bounds']}) only found in Night Mode")
 
-    outliers = find_outliers(color_changes)
+def _print_outliers(outliers):
     print("\nOutlier Color Changes:")
-    for index in outliers:
-        day_info, night_info, change = node_info[index]
-        print(f"UI Component: {day_info['class_name']} (id: {day_info['view_id']}, bounds: {day_info['layout_bounds']})")
+    for day_info, night_info, change in outliers:
+        print(_describe(day_info))
         print(f"  Day Mode Colors: {day_info['top_colors']}")
         print(f"  Night Mode Colors: {night_info['top_colors']}")
         print(f"  Change Detected: {day_info['top_colors']} -> {night_info['top_colors']} with distance {change}")
 
 
-def main():
+def compare_modes(day_colors, night_colors, metric='rgb', outlier_method='zscore', threshold=2, verbose=True):
+    """
+    :return: 离群的颜色变化 [(day_info, night_info, change)]
+    """
+    matched = match_modes(day_colors, night_colors)
+    changes = color_changes(matched, metric)
+    outliers = [matched[i] + (changes[i],) for i in find_outliers(changes, threshold, outlier_method)]
+    if verbose:
+        _print_comparison(day_colors, night_colors, matched)
+        _print_outliers(outliers)
+    return outliers
+
+
+def compare_corpus(screen_pairs, metric='rgb', outlier_method='zscore', threshold=2, verbose=False):
+    """
+    批量比较多个屏幕：所有屏幕的颜色距离一次算完，离群值在每个屏幕内分别统计。
+
+    :param screen_pairs: [(day_colors, night_colors)]，process_mode 的结果
+    :return: 每个屏幕的离群颜色变化列表
+    """
+    matched = [match_modes(day_colors, night_colors) for day_colors, night_colors in screen_pairs]
+    flat = [pair for screen in matched for pair in screen]
+    groups = np.repeat(np.arange(len(matched)), [len(screen) for screen in matched])
+    changes = color_changes(flat, metric)
+    results = [[] for _ in matched]
+    for i in find_outliers(changes, threshold, outlier_method, groups):
+        results[groups[i]].append(flat[i] + (changes[i],))
+    if verbose:
+        for index, (day_colors, night_colors) in enumerate(screen_pairs):
+            _print_comparison(day_colors, night_colors, matched[index])
+            _print_outliers(results[index])
+    return results
+
+
+# main 中一次比较的屏幕数，限制同时保存在内存中的结果
+CORPUS_WINDOW = 256
+
+
+def analyze_pair(pair):
+    """
+    :param pair: (day_view_tree_file, night_view_tree_file, day_image_path, night_image_path)
+    :return: (day_node_colors, night_node_colors)
+    """
+    day_view_tree_file, night_view_tree_file, day_image_path, night_image_path = pair
+    day_view_tree = load_view_tree(day_view_tree_file, Node)  # 解析结果缓存在 .npz 中
+    night_view_tree = load_view_tree(night_view_tree_file, Node)
+    day_node_colors = process_mode(day_view_tree, day_image_path, "Day Mode")
+    night_node_colors = process_mode(night_view_tree, night_image_path, "Night Mode")
+    return day_node_colors, night_node_colors
+
+
+def main(pairs_manifest=None, processes=1):
+    """
+    :param pairs_manifest: 可选，apk_utils/paired_executor.py 写出的 pairs.jsonl（baseline 为日间，variant 为夜间），
+                           给出时逐对比较其中的截图，否则比较 test/ 下的示例文件。
+    :param processes: 并行处理各对截图的进程数（None 为 CPU 核数）；结果按配对顺序合并
+    :return: 分析失败的配对数
+    """
     os.makedirs("test", exist_ok=True)
-    day_view_tree_file = os.path.join("test", "ltr_view_tree.txt")
-    night_view_tree_file = os.path.join("test", "night_view_tree.txt")
-    day_image_path = os.path.join("test", "ltr_screenshot.png")
-    night_image_path = os.path.join("test", "night_screenshot.png")
-    day_view_tree_lines = read_view_tree_from_file(day_view_tree_file)
-    night_view_tree_lines = read_view_tree_from_file(night_view_tree_file)
-    day_node_colors = process_mode(day_view_tree_lines, day_image_path, "Day Mode")
-    night_node_colors = process_mode(night_view_tree_lines, night_image_path, "Night Mode")
-    compare_modes(day_node_colors, night_node_colors)
+    if pairs_manifest:
+        pairs = [(day['view_tree.txt'], night['view_tree.txt'], day['screenshot.png'], night['screenshot.png'])
+                 for _, day, night in capture.read_pairs(pairs_manifest)]
+    else:
+        pairs = [(os.path.join("test", "ltr_view_tree.txt"), os.path.join("test", "night_view_tree.txt"),
+                  os.path.join("test", "ltr_screenshot.png"), os.path.join("test", "night_screenshot.png"))]
+
+    # 结果按窗口流式比较：离群值本来就在每个屏幕内统计，每个窗口内的距离仍一次算完，内存只与窗口大小有关
+    failures = []
+    window = []
+    for pair, colors, error in batch_runner.run_batch(analyze_pair, pairs, processes):
+        if error:
+            failures.append((pair, error))
+            continue
+        window.append(colors)
+        if len(window) == CORPUS_WINDOW:
+            compare_corpus(window, verbose=True)
+            window = []
+    if window:
+        compare_corpus(window, verbose=True)
+    return batch_runner.report_failures(failures, len(pairs))
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Compare the colors of day and night mode screenshots.")
+    parser.add_argument('-pairs', default=None, help="pairs.jsonl written by apk_utils/paired_executor.py")
+    parser.add_argument('-processes', type=int, default=None, help="worker processes, default the CPU count")
+    args = parser.parse_args()
+    sys.exit(1 if main(args.pairs, args.processes) else 0)
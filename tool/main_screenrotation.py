@@ -1,102 +1,19 @@
-import re
+import argparse
 import os
+import sys
 from math import sqrt
 
+import numpy as np
 
-class Node:
-    def __init__(self, line, indent):
-        self.parse_line(line)
-        self.children = []
-        self.indent = indent
-
-    def parse_line(self, line):
-        # 匹配并解析行
-        match = re.match(r'(!*)([^{]+){([^}]+)}', line)
-        self.indent = len(match.group(1))
-        self.className = match.group(2).strip()
-        details = match.group(3).split(' ')
-        # 解析 view id 和 layout bounds
-        self.view_id = None
-        self.layout_bounds = None
-        for detail in details:
-            if len(detail) == 7:
-                self.view_id = detail
-        # 提取最后四个数字作为 layout_bounds
-        match_final_numbers = re.findall(r'\d+', line)
-        if len(match_final_numbers) >= 4:
-            self.layout_bounds = ' '.join(match_final_numbers[-4:])
-            self.x1 = int(self.layout_bounds.split(' ')[0])
-            self.y1 = int(self.layout_bounds.split(' ')[1])
-            self.x2 = int(self.layout_bounds.split(' ')[2])
-            self.y2 = int(self.layout_bounds.split(' ')[3])
-
-    def __repr__(self):
-        return f"{'  ' * self.indent}{self.className} (id: {self.view_id}, bounds: {self.layout_bounds})"
-
-    def get_class_name(self):
-        return self.className
-
-    def get_view_id(self):
-        return self.view_id
-
-    def get_layout_bounds(self):
-        return self.layout_bounds
-
-
-def build_tree(lines):
-    if not lines:
-        return None
-
-    def compute_indent(line):
-        return line.count('!')
-
-    root_line = lines[0]
-    root_indent = compute_indent(root_line)
-    root_value = root_line.replace('!', '').strip()
-    root = Node(root_value, root_indent)
-    stack = [root]
-
-    for line in lines[1:]:
-        indent = compute_indent(line)
-        value = line.replace('!', '').strip()
-        node = Node(value, indent)
-        while len(stack) > 1 and stack[-1].indent >= node.indent:
-            stack.pop()
-        if stack[-1].indent < node.indent:
-            stack[-1].children.append(node)
-            stack.append(node)
-        else:
-            raise ValueError("Invalid tree structure: indentation error.")
-
-    return root
-
-
-def print_tree(node, level=0):
-    print(f"{'  ' * level}{node}")
-    for child in node.children:
-        print_tree(child, level + 1)
-
-
-def find_leaf_nodes(node):
-    leaf_nodes = []
-    if not node.children:
-        if node.x1 != node.x2 and node.y1 != node.y2:
-            leaf_nodes.append(node)
-    for child in node.children:
-        leaf_nodes.extend(find_leaf_nodes(child))
-    return leaf_nodes
-
-
-def read_view_tree_from_file(file_path):
-    """
-    Read the view tree lines from a file.
+import batch_runner
+import capture
+import cv_utils
+import node_matcher
+from leaf_table import LeafTable
+from view_tree import Node, build_tree, find_leaf_nodes, load_view_tree, print_tree, read_view_tree_from_file
 
-    :param file_path: Path to the file containing the view tree lines.
-    :return: List of view tree lines.
-    """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = [line.strip() for line in file.readlines()]
-    return lines
+# 既没有截图也没有根节点尺寸时使用
+DEFAULT_SCREEN_WIDTH = 1080
 
 
 def distance(node1, node2):
@@ -110,24 +27,51 @@ def distance(node1, node2):
     return sqrt((center_x1 - center_x2) ** 2 + (center_y1 - center_y2) ** 2)
 
 
-def find_close_nodes(base_nodes, all_nodes, threshold):
+def find_close_nodes(base_nodes, all_nodes, threshold, transitive=False):
     """
     Find nodes that are close to the base nodes within a given threshold.
+
+    :param all_nodes: Leaf nodes or a LeafTable; the centers are indexed in a grid, so each base node only
+                      measures the nodes in the cells around it.
+    :param transitive: Also take the nodes close to nodes already taken (the whole cluster).
+    :return: The base nodes and the close nodes, in table order.
+    """
+    table = all_nodes if isinstance(all_nodes, LeafTable) else LeafTable(all_nodes)
+    base_ids = {id(node) for node in base_nodes}
+    table_ids = {id(node) for node in table.nodes}
+    seeds = np.array([id(node) in base_ids for node in table.nodes], dtype=bool)
+    close = table.center_grid(threshold).within(seeds, threshold, transitive)
+    # Base nodes that are not among all_nodes are kept as they are
+    extra = [node for node in base_nodes if id(node) not in table_ids]
+    return table.select(close).nodes + extra
+
+
+def screen_width_of(root, image_path=None):
     """
-    close_nodes = set(base_nodes)
-    for base_node in base_nodes:
-        for node in all_nodes:
-            if node not in close_nodes and distance(base_node, node) <= threshold:
-                close_nodes.add(node)
-    return list(close_nodes)
+    Width of the screen from the screenshot if given, else from the bounds of the view tree root.
+    """
+    if image_path is not None:
+        if isinstance(image_path, np.ndarray):
+            return image_path.shape[1]
+        return cv_utils.open_image(image_path).size[0]
+    size = node_matcher.screen_size(root)
+    return size[0] if size else DEFAULT_SCREEN_WIDTH
 
 
-def process_mode(view_tree_lines, mode_name, screen_width):
+def process_mode(view_tree_lines, mode_name, screen_width=None, image_path=None, transitive=False):
+    """
+    :param screen_width: 屏幕宽度；不给时取截图宽度，没有截图时取根节点的宽度，竖屏和横屏都适用
+    :param image_path: 可选，截图路径或内存中的截图，只用来确定屏幕宽度
+    :param transitive: 是否把与已选节点接近的节点也继续并入（整簇）
+    """
     # 构建视图树
     root = build_tree(view_tree_lines)
+    if screen_width is None:
+        screen_width = screen_width_of(root, image_path)
 
     # 查找所有的叶节点
-    leaf_nodes = find_leaf_nodes(root)
+    table = LeafTable.from_tree(root)
+    leaf_nodes = table.nodes
     print(f"\n{mode_name} Leaf Nodes:")
     for node in leaf_nodes:
         print(node)
@@ -136,13 +80,14 @@ def process_mode(view_tree_lines, mode_name, screen_width):
     edge_threshold = 200
     close_threshold = 100  # 定义非常接近的距离阈值
 
-    # 查找靠近左边缘和右边缘的叶节点
-    left_edge_nodes = [node for node in leaf_nodes if node.x1 <= edge_threshold]
-    right_edge_nodes = [node for node in leaf_nodes if node.x2 >= screen_width - edge_threshold]
+    # 所有叶节点的中心点建一次网格，左右边缘的邻近查询共用
+    grid = table.center_grid(close_threshold)
 
-    # 找到与这些节点非常接近的结点
-    left_edge_and_close_nodes = find_close_nodes(left_edge_nodes, leaf_nodes, close_threshold)
-    right_edge_and_close_nodes = find_close_nodes(right_edge_nodes, leaf_nodes, close_threshold)
+    # 查找靠近左边缘和右边缘的叶节点，以及与这些节点非常接近的结点
+    left_edge_and_close_nodes = table.select(
+        grid.within(table.near_left(edge_threshold), close_threshold, transitive)).nodes
+    right_edge_and_close_nodes = table.select(
+        grid.within(table.near_right(screen_width, edge_threshold), close_threshold, transitive)).nodes
 
     print(f"\n{mode_name} Left Edge and Close Nodes (within {close_threshold} pixels):")
     for node in left_edge_and_close_nodes:
@@ -155,43 +100,80 @@ def process_mode(view_tree_lines, mode_name, screen_width):
     return left_edge_and_close_nodes, right_edge_and_close_nodes
 
 
-def compare_nodes(before_nodes, after_nodes, edge):
-    before_ids = {node.get_view_id() for node in before_nodes}
-    after_ids = {node.get_view_id() for node in after_nodes}
+def compare_nodes(before_nodes, after_nodes, edge, before_root=None, after_root=None):
+    """
+    :param before_root: 可选，旋转前的根节点；给出时用它的层级路径和屏幕尺寸配对节点（after_root 同理）
+    """
+    # 按资源 id 和层级路径一一配对；旋转后归一化坐标不再对应，不按位置配对
+    before_index = node_matcher.NodeIndex.from_nodes(before_nodes, node_matcher.node_paths(before_root),
+                                                     node_matcher.screen_size(before_root))
+    after_index = node_matcher.NodeIndex.from_nodes(after_nodes, node_matcher.node_paths(after_root),
+                                                    node_matcher.screen_size(after_root))
+    matched = {i for i, _ in node_matcher.match_nodes(before_index, after_index, spatial=False)}
 
-    still_on_edge = before_ids.intersection(after_ids)
-    moved_off_edge = before_ids.difference(after_ids)
+    still_on_edge = [node for i, node in enumerate(before_nodes) if i in matched]
+    moved_off_edge = [node for i, node in enumerate(before_nodes) if i not in matched]
 
+    # 输出与之前一样按 view id 列出（每个 id 一次）
     print(f"\nNodes still on {edge} edge after rotation:")
-    for view_id in still_on_edge:
+    for view_id in dict.fromkeys(node.get_view_id() for node in still_on_edge):
         print(view_id)
 
     print(f"\nNodes moved off the {edge} edge after rotation:")
-    for view_id in moved_off_edge:
+    for view_id in dict.fromkeys(node.get_view_id() for node in moved_off_edge):
         print(view_id)
 
+    return still_on_edge, moved_off_edge
 
-def main():
-    # 确保test文件夹存在
-    os.makedirs("test", exist_ok=True)
-
-    # 白天模式视图树文件路径
-    day_view_tree_file = os.path.join("test", "day_view_tree.txt")
-    rotated_view_tree_file = os.path.join("test", "night_view_tree.txt")
 
-    # 从文件中读取白天模式视图树
-    day_view_tree_lines = read_view_tree_from_file(day_view_tree_file)
-    rotated_view_tree_lines = read_view_tree_from_file(rotated_view_tree_file)
+def analyze_pair(pair):
+    """
+    :param pair: (day_view_tree_file, rotated_view_tree_file, day_image_path, rotated_image_path)；截图可以为 None
+    :return: {edge: (still_on_edge, moved_off_edge)}
+    """
+    day_view_tree_file, rotated_view_tree_file, day_image_path, rotated_image_path = pair
+    day_view_tree = load_view_tree(day_view_tree_file, Node)  # 解析结果缓存在 .npz 中
+    rotated_view_tree = load_view_tree(rotated_view_tree_file, Node)
 
-    # 处理普通模式
-    screen_width = 1080  # 假设屏幕宽度为1080像素
-    day_left_nodes, day_right_nodes = process_mode(day_view_tree_lines, "Default", screen_width)
-    rotated_left_nodes, rotated_right_nodes = process_mode(rotated_view_tree_lines, "Rotated", screen_width)
+    # 处理普通模式；屏幕宽度取自截图或各自的根节点，竖屏和横屏各用自己的宽度
+    day_left_nodes, day_right_nodes = process_mode(day_view_tree, "Default", image_path=day_image_path)
+    rotated_left_nodes, rotated_right_nodes = process_mode(rotated_view_tree, "Rotated",
+                                                           image_path=rotated_image_path)
 
     # 比较旋转前后的节点位置
-    compare_nodes(day_left_nodes, rotated_left_nodes, "left")
-    compare_nodes(day_right_nodes, rotated_right_nodes, "right")
+    return {
+        "left": compare_nodes(day_left_nodes, rotated_left_nodes, "left", day_view_tree, rotated_view_tree),
+        "right": compare_nodes(day_right_nodes, rotated_right_nodes, "right", day_view_tree, rotated_view_tree),
+    }
+
+
+def main(pairs_manifest=None, processes=1):
+    """
+    :param pairs_manifest: 可选，apk_utils/paired_executor.py 写出的 pairs.jsonl（baseline 为旋转前，variant 为旋转后），
+                           给出时逐对比较，否则比较 test/ 下的示例文件。
+    :param processes: 并行处理各对的进程数（None 为 CPU 核数）；输出按配对顺序合并
+    :return: 分析失败的配对数
+    """
+    # 确保test文件夹存在
+    os.makedirs("test", exist_ok=True)
+
+    if pairs_manifest:
+        pairs = [(day['view_tree.txt'], rotated['view_tree.txt'], day.get('screenshot.png'), rotated.get('screenshot.png'))
+                 for _, day, rotated in capture.read_pairs(pairs_manifest)]
+    else:
+        # 白天模式视图树文件路径
+        pairs = [(os.path.join("test", "day_view_tree.txt"), os.path.join("test", "night_view_tree.txt"), None, None)]
+
+    failures = []
+    for pair, _, error in batch_runner.run_batch(analyze_pair, pairs, processes):
+        if error:
+            failures.append((pair, error))
+    return batch_runner.report_failures(failures, len(pairs))
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Compare the edge nodes of a screen before and after rotation.")
+    parser.add_argument('-pairs', default=None, help="pairs.jsonl written by apk_utils/paired_executor.py")
+    parser.add_argument('-processes', type=int, default=None, help="worker processes, default the CPU count")
+    args = parser.parse_args()
+    sys.exit(1 if main(args.pairs, args.processes) else 0)
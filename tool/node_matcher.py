@@ -0,0 +1,259 @@
+from collections import deque
+
+import numpy as np
+
+# Resource ids ("app:id/title", "android:id/text1") name the same view in every launch; the bare 7-character
+# detail of other nodes (e.g. 6fd7b9b) is the identity hash of the view object and differs between dumps.
+RESOURCE_ID_MARK = ':id/'
+
+
+def resource_id(view_id):
+    # The view id if it is a resource id, else None
+    return view_id if view_id is not None and RESOURCE_ID_MARK in view_id else None
+
+
+def node_paths(root):
+    """
+    Hierarchy path of every node of a tree, e.g. "FrameLayout[0]/LinearLayout[1]/TextView[0]", where the
+    index counts the preceding siblings of the same class. Paths survive layout changes between
+    configuration modes as long as the structure of the tree stays the same.
+
+    :return: {id(node): path}; keyed by identity, since some Node subclasses compare by view id.
+    """
+    paths = {}
+    if root is None:
+        return paths
+    stack = [(root, f"{root.className}[0]")]
+    while stack:
+        node, path = stack.pop()
+        paths[id(node)] = path
+        seen = {}
+        for child in node.children:
+            index = seen[child.className] = seen.get(child.className, -1) + 1
+            stack.append((child, f"{path}/{child.className}[{index}]"))
+    return paths
+
+
+def screen_size(root):
+    """
+    (width, height) of the screen from the bounds of the root node, None when the root has no bounds.
+    """
+    if root is None or root.x1 is None:
+        return None
+    return root.x2, root.y2
+
+
+class NodeIndex:
+    """
+    The nodes of one screen indexed for cross-mode matching: by view id, by hierarchy path and by a
+    uniform grid over their bounds in normalized coordinates (the screen scaled to 1 x 1), so a node of
+    another mode finds its candidates without scanning the whole screen.
+    """
+
+    def __init__(self, boxes, view_ids=None, paths=None, class_names=None, size=None, cells=16, max_candidates=32):
+        """
+        :param boxes: Sequence of (x1, y1, x2, y2), one per node.
+        :param view_ids: Optional view id per node (None for nodes without one); only resource ids are
+                         used, other ids are treated as missing.
+        :param paths: Optional hierarchy path per node (see node_paths).
+        :param class_names: Optional class name per node; nodes of different classes never match.
+        :param size: (width, height) of the screen; defaults to the extent of the boxes.
+        :param cells: Number of grid cells per axis.
+        :param max_candidates: Spatial candidates kept per query, the ones with the closest centers.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        count = len(boxes)
+        self.view_ids = [resource_id(view_id) for view_id in view_ids] if view_ids is not None else [None] * count
+        self.paths = list(paths) if paths is not None else [None] * count
+        self.class_names = list(class_names) if class_names is not None else [None] * count
+        if size is None:
+            size = (boxes[:, [0, 2]].max(initial=1), boxes[:, [1, 3]].max(initial=1))
+        width, height = max(size[0], 1), max(size[1], 1)
+        self.size = (width, height)
+        self.boxes = np.column_stack((np.minimum(boxes[:, 0], boxes[:, 2]) / width,
+                                      np.minimum(boxes[:, 1], boxes[:, 3]) / height,
+                                      np.maximum(boxes[:, 0], boxes[:, 2]) / width,
+                                      np.maximum(boxes[:, 1], boxes[:, 3]) / height))
+        self.cells = cells
+        self.max_candidates = max_candidates
+
+        # Keys keep the rows in document order
+        self.by_view_id = {}
+        self.by_path = {}
+        for i, (view_id, path) in enumerate(zip(self.view_ids, self.paths)):
+            if view_id is not None:
+                self.by_view_id.setdefault(view_id, []).append(i)
+            if path is not None:
+                self.by_path.setdefault(path, []).append(i)
+
+        self.grid = {}
+        for i, cell_range in enumerate(self._cell_ranges(self.boxes)):
+            for cell in cell_range:
+                self.grid.setdefault(cell, []).append(i)
+
+    @classmethod
+    def from_nodes(cls, nodes, paths=None, size=None, **kwargs):
+        """
+        :param nodes: Nodes with bounds, e.g. a LeafTable.
+        :param paths: Optional {id(node): path} from node_paths.
+        """
+        nodes = list(nodes)
+        return cls([(node.x1, node.y1, node.x2, node.y2) for node in nodes],
+                   view_ids=[node.view_id for node in nodes],
+                   paths=[paths.get(id(node)) for node in nodes] if paths is not None else None,
+                   class_names=[node.className for node in nodes], size=size, **kwargs)
+
+    @classmethod
+    def from_infos(cls, infos, size=None, **kwargs):
+        """
+        :param infos: Dicts with 'layout_bounds' ("x1 y1 x2 y2"), 'view_id', 'class_name' and optionally 'path',
+                      as built by the process_mode functions.
+        """
+        infos = list(infos)
+        return cls([tuple(map(int, info['layout_bounds'].split())) for info in infos],
+                   view_ids=[info.get('view_id') for info in infos],
+                   paths=[info.get('path') for info in infos],
+                   class_names=[info.get('class_name') for info in infos], size=size, **kwargs)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _cell_ranges(self, boxes, margin=0.0):
+        last = self.cells - 1
+        lo = np.clip(np.floor((boxes[:, :2] - margin) * self.cells), 0, last).astype(np.int64).tolist()
+        hi = np.clip(np.floor((boxes[:, 2:] + margin) * self.cells), 0, last).astype(np.int64).tolist()
+        for (cx1, cy1), (cx2, cy2) in zip(lo, hi):
+            yield [(cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)]
+
+    def candidates(self, boxes, margin=0.0):
+        """
+        Rows whose grid cells touch each of the given normalized boxes, widened by margin. At most
+        max_candidates rows are kept per box, those whose centers are closest to the center of the box, so
+        a full-width row of a dense list does not pair with every node of its band.
+
+        :return: One sorted list of rows per box.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        centers = (self.boxes[:, :2] + self.boxes[:, 2:]) / 2
+        result = []
+        for box, cell_range in zip(boxes, self._cell_ranges(boxes, margin)):
+            rows = set()
+            for cell in cell_range:
+                rows.update(self.grid.get(cell, ()))
+            rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+            if len(rows) > self.max_candidates:
+                dist = ((centers[rows] - (box[:2] + box[2:]) / 2) ** 2).sum(axis=1)
+                rows = rows[np.argpartition(dist, self.max_candidates - 1)[:self.max_candidates]]
+            result.append(np.sort(rows).tolist())
+        return result
+
+    def compatible(self, i, other, j):
+        # Nodes of different classes or with different resource ids are never the same node
+        for mine, theirs in ((self.class_names[i], other.class_names[j]), (self.view_ids[i], other.view_ids[j])):
+            if mine is not None and theirs is not None and mine != theirs:
+                return False
+        return True
+
+
+def _pair_keys(before, after, before_rows, after_rows, matched_before, matched_after, pairs):
+    # Each unmatched node of a key goes with the first unmatched node of that key and class on the other side
+    for key, rows in before_rows.items():
+        by_class = {}
+        for j in after_rows.get(key, ()):
+            if j not in matched_after:
+                by_class.setdefault(after.class_names[j], deque()).append(j)
+        for i in rows:
+            if i in matched_before:
+                continue
+            class_name = before.class_names[i]
+            # A missing class name matches any class
+            queues = [by_class.get(class_name), by_class.get(None)] if class_name is not None else list(by_class.values())
+            queue = min((q for q in queues if q), key=lambda q: q[0], default=None)
+            if queue is not None:
+                j = queue.popleft()
+                pairs.append((i, j))
+                matched_before.add(i)
+                matched_after.add(j)
+
+
+def match_nodes(before, after, min_iou=0.5, tolerance=0.02, spatial=True):
+    """
+    One-to-one correspondence between the nodes of two modes of the same screen.
+
+    Nodes are paired first when both their resource id and hierarchy path agree, then by resource id. The rest
+    are paired spatially: candidates come from the grid of the other side, and pairs are taken greedily
+    by decreasing IoU of the normalized bounds, then by increasing center distance. A spatial pair is
+    kept when its IoU is at least min_iou or its centers are within tolerance (in normalized units).
+    Nodes still left over (e.g. after a rotation moved them) are finally paired by hierarchy path.
+
+    Normalized bounds are only comparable between modes that keep the layout, e.g. day and night. Across a
+    rotation a different view of the same class can land in a similar box, so there spatial=False pairs
+    nodes by resource id and hierarchy path alone.
+
+    With a fixed grid and candidate cap every node is compared with a bounded number of nodes of the
+    other side, so the work is dominated by sorting the candidate pairs: O(n log n).
+
+    :param before: NodeIndex of the first mode.
+    :param after: NodeIndex of the second mode.
+    :return: [(i, j)] rows of matched nodes, sorted by i.
+    """
+    pairs = []
+    matched_before, matched_after = set(), set()
+
+    def by_id_and_path(index):
+        rows = {}
+        for i, (view_id, path) in enumerate(zip(index.view_ids, index.paths)):
+            if view_id is not None and path is not None:
+                rows.setdefault((view_id, path), []).append(i)
+        return rows
+
+    for before_rows, after_rows in ((by_id_and_path(before), by_id_and_path(after)),
+                                    (before.by_view_id, after.by_view_id)):
+        _pair_keys(before, after, before_rows, after_rows, matched_before, matched_after, pairs)
+
+    rest = [i for i in range(len(before)) if i not in matched_before] if spatial else []
+    if rest and len(after) > len(matched_after):
+        rows_i, rows_j = [], []
+        for i, candidates in zip(rest, after.candidates(before.boxes[rest], tolerance)):
+            for j in candidates:
+                if j not in matched_after and before.compatible(i, after, j):
+                    rows_i.append(i)
+                    rows_j.append(j)
+        if rows_i:
+            a = before.boxes[rows_i]
+            b = after.boxes[rows_j]
+            width = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+            height = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+            inter = width * height
+            union = ((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+                     - inter)
+            iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+            dist = np.hypot((a[:, 0] + a[:, 2] - b[:, 0] - b[:, 2]) / 2, (a[:, 1] + a[:, 3] - b[:, 1] - b[:, 3]) / 2)
+            keep = (iou >= min_iou) | (dist <= tolerance)
+            order = np.lexsort((rows_j, rows_i, dist, -iou))
+            for k in order[keep[order]].tolist():
+                i, j = rows_i[k], rows_j[k]
+                if i not in matched_before and j not in matched_after:
+                    pairs.append((i, j))
+                    matched_before.add(i)
+                    matched_after.add(j)
+
+    _pair_keys(before, after, before.by_path, after.by_path, matched_before, matched_after, pairs)
+    pairs.sort()
+    return pairs
+
+
+def match_infos(before_infos, after_infos, size=None, **kwargs):
+    """
+    match_nodes over two lists of info dicts (see NodeIndex.from_infos).
+
+    :param size: (width, height) shared by both modes; defaults to the extent of the bounds of both,
+                 so a node that only moved stays in place relative to the screen.
+    :return: [(before_info, after_info)] in the order of before_infos.
+    """
+    before_infos, after_infos = list(before_infos), list(after_infos)
+    if size is None:
+        bounds = [tuple(map(int, info['layout_bounds'].split())) for info in before_infos + after_infos]
+        size = (max((max(b[0], b[2]) for b in bounds), default=1), max((max(b[1], b[3]) for b in bounds), default=1))
+    pairs = match_nodes(NodeIndex.from_infos(before_infos, size), NodeIndex.from_infos(after_infos, size), **kwargs)
+    return [(before_infos[i], after_infos[j]) for i, j in pairs]
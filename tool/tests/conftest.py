@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The tool modules import each other by bare name, as when run from tool/
+TOOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOOL_DIR)
+# apk_utils modules import each other by bare name too, as when run from apk_utils/
+sys.path.insert(0, os.path.join(TOOL_DIR, 'apk_utils'))
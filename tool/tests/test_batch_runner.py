@@ -0,0 +1,81 @@
+import json
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import batch_runner
+import main_language
+import main_nightmode
+import main_screenrotation
+
+
+def write_corpus(directory, pairs=12):
+    """
+    A paired_executor manifest of synthetic screens: text rows at a few anchors on a 400 x 800 screen.
+    """
+    rng = random.Random(1)
+    manifest = directory / "pairs.jsonl"
+    with open(manifest, "w") as f:
+        for k in range(pairs):
+            record = {"capture": f"c{k}"}
+            for side in ("baseline", "variant"):
+                lines = ["android.widget.FrameLayout{1a2b3c4 V.E...... ........ 0,0-400,800}"]
+                image = np.full((800, 400, 3), 255, dtype=np.uint8)
+                for i in range(15):
+                    x, y, w = rng.choice([0, 20, 100, 200]), i * 50, rng.randint(40, 180)
+                    lines.append(f"!android.widget.TextView{{{k:03x}{i:04x} V.ED..... ........ "
+                                 f"{x},{y}-{x + w},{y + 40} app:id/v{i % 7}}}")
+                    image[y + 10:y + 30, x + 5:x + w - rng.randint(5, 30)] = rng.randint(0, 120)
+                view_tree = directory / f"{k}_{side}_view_tree.txt"
+                screenshot = directory / f"{k}_{side}_screenshot.png"
+                view_tree.write_text("\n".join(lines))
+                Image.fromarray(image).save(screenshot)
+                record[side] = {"view_tree.txt": str(view_tree), "screenshot.png": str(screenshot)}
+            f.write(json.dumps(record) + "\n")
+    return manifest
+
+
+@pytest.mark.parametrize("module", [main_language, main_nightmode, main_screenrotation])
+def test_process_pool_output_matches_sequential(module, tmp_path, monkeypatch, capsys):
+    manifest = write_corpus(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    outputs = []
+    for processes in (1, 4):
+        assert module.main(pairs_manifest=str(manifest), processes=processes) == 0
+        reports = (tmp_path / "bug_reports.txt").read_text() if module is main_language else None
+        outputs.append((capsys.readouterr().out, reports))
+    assert outputs[0] == outputs[1]
+    assert outputs[0][0]
+
+
+def fail_on_odd(item):
+    if item % 2:
+        raise ValueError(f"odd {item}")
+    print(f"item {item}")
+    return item * 10
+
+
+@pytest.mark.parametrize("processes", [1, 3])
+def test_results_in_order_and_failures_reported(processes, capsys):
+    results = list(batch_runner.run_batch(fail_on_odd, range(10), processes, chunksize=2, max_pending=2))
+    assert [item for item, _, _ in results] == list(range(10))
+    assert [result for _, result, error in results if error is None] == [0, 20, 40, 60, 80]
+    failures = [(item, error) for item, _, error in results if error]
+    assert failures == [(i, f"ValueError: odd {i}") for i in (1, 3, 5, 7, 9)]
+    out = capsys.readouterr().out
+    assert [line for line in out.splitlines() if line.startswith("item")] == [f"item {i}" for i in range(0, 10, 2)]
+    assert batch_runner.report_failures(failures, 10) == 5
+    assert "Analysis failed for 5 of 10 pairs" in capsys.readouterr().out
+
+
+def test_failed_pair_sets_exit_count(tmp_path, monkeypatch, capsys):
+    manifest = write_corpus(tmp_path, pairs=2)
+    lines = manifest.read_text().splitlines()
+    broken = json.loads(lines[1])
+    broken["variant"]["screenshot.png"] = str(tmp_path / "missing.png")
+    manifest.write_text(lines[0] + "\n" + json.dumps(broken) + "\n")
+    monkeypatch.chdir(tmp_path)
+    assert main_nightmode.main(pairs_manifest=str(manifest), processes=2) == 1
+    assert "Analysis failed for 1 of 2 pairs" in capsys.readouterr().out
@@ -0,0 +1,46 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import color_utils
+import label_features
+
+# The reference is the Counter(getdata()) path the engine replaced
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+def screenshot():
+    # Few colors, so ties and repeated counts are common
+    rng = np.random.default_rng(3)
+    palette = np.array([[255, 255, 255], [0, 0, 0], [200, 30, 30], [30, 200, 30], [31, 200, 30]], dtype=np.uint8)
+    return palette[rng.integers(0, len(palette), size=(120, 90))]
+
+
+def counter_top(image, num_colors=2):
+    return Counter(image.convert("RGB").getdata()).most_common(num_colors)
+
+
+def test_top_colors_matches_counter():
+    rgb = screenshot()
+    image = Image.fromarray(rgb)
+    for num_colors in (1, 2, 5):
+        assert color_utils.top_colors(rgb, num_colors) == counter_top(image, num_colors)
+    for mode in ("RGBA", "L", "P"):
+        converted = image.convert(mode)
+        assert color_utils.top_colors(converted, 3) == counter_top(converted, 3)
+
+
+def test_label_map_and_batch_match_per_crop():
+    rgb = screenshot()
+    image = Image.fromarray(rgb)
+    # Exclusive boxes use the label map, overlapping and out-of-frame ones the per-crop fallback
+    boxes = [(0, 0, 40, 30), (50, 0, 90, 30), (0, 40, 90, 60), (10, 50, 30, 80), (60, 100, 120, 140), (5, 90, 5, 95)]
+    expected = [counter_top(image.crop(box), 2) for box in boxes]
+    assert color_utils.top_colors_batch(rgb, boxes) == expected
+
+    label_map = label_features.LabelMap(rgb.shape, boxes)
+    for top, exclusive, want in zip(label_map.top_colors(rgb), label_map.exclusive.tolist(), expected):
+        assert top == (want if exclusive else None)
+    assert label_map.exclusive.tolist()[:2] == [True, True]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+import cv_utils
+
+# The reference takes the mean of empty (zero-area) crops
+pytestmark = pytest.mark.filterwarnings("ignore::RuntimeWarning")
+
+
+def reference_alignment(image):
+    # detect_text_alignment before the batch rewrite, on a cropped PIL image
+    image = image.convert("L")
+    is_light_background = np.mean(image) > 128
+    binary_image = image.point(lambda p: p > 128 and 255)
+    if is_light_background:
+        binary_image = ImageOps.invert(binary_image)
+    binary_array = np.array(binary_image)
+    text_rows = np.where(np.sum(binary_array, axis=1) > 0)[0]
+    left_margins, right_margins = [], []
+    for row in text_rows:
+        cols = np.where(binary_array[row] > 0)[0]
+        if len(cols) > 0:
+            left_margins.append(cols[0])
+            right_margins.append(binary_array.shape[1] - 1 - cols[-1])
+    avg_left_margin = np.mean(left_margins) if left_margins else 0
+    avg_right_margin = np.mean(right_margins) if right_margins else 0
+    width = binary_array.shape[1]
+    if avg_left_margin < width * 0.1 and avg_right_margin < width * 0.1:
+        return "justify"
+    if abs(avg_left_margin - avg_right_margin) < width * 0.1:
+        return "center"
+    if avg_left_margin < avg_right_margin * 0.5:
+        return "left"
+    if avg_right_margin < avg_left_margin * 0.5:
+        return "right"
+    return "other"
+
+
+def corpus():
+    """
+    A 600 x 400 screen: a light half and a dark half, each with left, right, centered, justified and
+    empty text rows; the boxes include overlapping, zero-area and out-of-frame regions.
+    """
+    rng = np.random.default_rng(7)
+    gray = np.full((600, 400), 235, dtype=np.uint8)
+    gray[300:] = 30
+    boxes = []
+    for half, (background, ink) in enumerate(((235, 20), (30, 220))):
+        for i, (x1, x2) in enumerate(((10, 150), (250, 390), (120, 280), (5, 395), (None, None))):
+            y = half * 300 + i * 55
+            if x2 is not None:
+                gray[y + 10:y + 40, x1:x2] = np.where(rng.random((30, x2 - x1)) < 0.4, ink, background)
+            boxes.append((0, y, 400, y + 50))
+    boxes += [(0, 0, 400, 600), (100, 100, 100, 150), (300, 550, 500, 700), (350, 0, 450, 60), (0, 280, 400, 330)]
+    # Same-size regions are stacked together; repeat some to exercise that path
+    boxes += boxes[:4]
+    return gray, boxes
+
+
+def test_batch_matches_per_crop_reference():
+    gray, boxes = corpus()
+    image = Image.fromarray(gray)
+    expected = [reference_alignment(image.crop(box)) for box in boxes]
+    assert cv_utils.detect_text_alignment_batch(gray, boxes) == expected
+    assert {"left", "right", "center", "justify", "other"} <= set(expected)
+
+
+def test_batch_matches_reference_in_small_chunks(monkeypatch):
+    monkeypatch.setattr(cv_utils, "BATCH_PIXELS", 1)
+    gray, boxes = corpus()
+    image = Image.fromarray(gray)
+    assert cv_utils.detect_text_alignment_batch(gray, boxes) == [reference_alignment(image.crop(box)) for box in boxes]
+
+
+def test_single_region_matches_reference():
+    gray, boxes = corpus()
+    image = Image.fromarray(gray)
+    for box in boxes[:10]:
+        crop = image.crop(box)
+        assert cv_utils.detect_text_alignment(np.asarray(crop)) == reference_alignment(crop)
+
+
+def test_empty_batch():
+    assert cv_utils.detect_text_alignment_batch(np.zeros((10, 10), dtype=np.uint8), []) == []
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+import main_language
+from main_language import Node
+
+
+def reference_compare_groups(ltr_vertical_groups_left, rtl_vertical_groups_left, ltr_vertical_groups_right,
+                             rtl_vertical_groups_right, ltr_vertical_groups_center, rtl_vertical_groups_center,
+                             ltr_filename, rtl_filename):
+    # compare_groups before the inverted-index rewrite, returning the reports instead of writing them
+    def collect_items(group_dict):
+        items = []
+        for key, nodes in group_dict.items():
+            items.append(set(nodes))
+        return items
+
+    # Collect items from each group
+    ltr_left_items = collect_items(ltr_vertical_groups_left)
+    rtl_left_items = collect_items(rtl_vertical_groups_left)
+    ltr_right_items = collect_items(ltr_vertical_groups_right)
+    rtl_right_items = collect_items(rtl_vertical_groups_right)
+    ltr_center_items = collect_items(ltr_vertical_groups_center)
+    rtl_center_items = collect_items(rtl_vertical_groups_center)
+
+    # Initialize a list to collect bug reports
+    bug_reports = []
+
+    # Check for bug: if any item in ltr_left_items is found in rtl_right_items or rtl_center_items
+    for ltr_group in ltr_left_items:
+        for item in ltr_group:
+            if any(item in rtl_group for rtl_group in rtl_right_items):
+                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR left group found in RTL right group.)"
+                print(bug_message)
+                bug_reports.append(bug_message)
+            if any(item in rtl_group for rtl_group in rtl_center_items):
+                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR left group found in RTL center group. "
+                print(bug_message)
+                bug_reports.append(bug_message)
+
+    # Check for bug: if any item in ltr_right_items is found in rtl_left_items or rtl_center_items
+    for ltr_group in ltr_right_items:
+        for item in ltr_group:
+            if any(item in rtl_group for rtl_group in rtl_left_items):
+                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR right group found in RTL left group. (LTR: {ltr_filename}, RTL: {rtl_filename})"
+                print(bug_message)
+                bug_reports.append(bug_message)
+            if any(item in rtl_group for rtl_group in rtl_center_items):
+                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR right group found in RTL center group. (LTR: {ltr_filename}, RTL: {rtl_filename})"
+                print(bug_message)
+                bug_reports.append(bug_message)
+
+    # Check for bug: if any item in ltr_center_items is found in rtl_left_items or rtl_right_items
+    for ltr_group in ltr_center_items:
+        for item in ltr_group:
+            if any(item in rtl_group for rtl_group in rtl_left_items):
+                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR center group found in RTL left group. (LTR: {ltr_filename}, RTL: {rtl_filename})"
+                print(bug_message)
+                bug_reports.append(bug_message)
+            if any(item in rtl_group for rtl_group in rtl_right_items):
+                bug_message = f"Bug detected: {ltr_filename.split('/')[-1]} Item '{item}' from LTR center group found in RTL right group. (LTR: {ltr_filename}, RTL: {rtl_filename})"
+                print(bug_message)
+                bug_reports.append(bug_message)
+
+    if not bug_reports:
+        print("No bugs detected.")
+        bug_reports.append("No bugs detected.")
+
+    return bug_reports
+
+
+def random_groups(rng):
+    # Groups drawn from a small id pool, so nodes recur across groups, alignments and modes (Node compares by id)
+    ids = [None] + [f"app:id/v{i}" for i in range(25)]
+    nodes = [Node(f"!!android.widget.TextView{{{i:07x} V.ED..... ........ {rng.randint(0, 3) * 100},{i * 10}-"
+                  f"{rng.randint(4, 9) * 100},{i * 10 + 5} {rng.choice(ids)}}}") for i in range(60)]
+    return {rng.randint(0, 8) * 50: nodes[i:i + rng.randint(1, 6)] for i in range(0, 60, 4)}
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_compare_groups_matches_reference(seed, tmp_path, monkeypatch, capsys):
+    rng = random.Random(seed)
+    groups = [random_groups(rng) if rng.random() > 0.1 else {} for _ in range(6)]
+    args = groups + ["generated_data/1_app{x}_view_tree.txt", "generated_data/2.5_app{x}_view_tree.txt"]
+    expected = reference_compare_groups(*args)
+    expected_out = capsys.readouterr().out
+
+    monkeypatch.chdir(tmp_path)
+    assert main_language.compare_groups(*args) == expected
+    assert capsys.readouterr().out == expected_out
+    assert (tmp_path / "bug_reports.txt").read_text() == "".join(report + "\n" for report in expected)
+
+
+def test_alignment_index_follows_node_equality():
+    a = Node("android.widget.TextView{0000001 V.ED..... ........ 0,0-10,10 app:id/a}")
+    same_id = Node("android.widget.TextView{0000002 V.ED..... ........ 50,0-60,10 app:id/a}")
+    index = main_language.alignment_index({'left': [a], 'justify': [same_id], 'center': []})
+    assert index == {a: {'left', 'justify'}}
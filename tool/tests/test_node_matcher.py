@@ -0,0 +1,88 @@
+import node_matcher
+from leaf_table import LeafTable
+from view_tree import build_tree
+
+DAY = [
+    "android.widget.FrameLayout{1a2b3c4 V.E...... ........ 0,0-1080,1920}",
+    "!android.widget.LinearLayout{5d6e7f8 V.E...... ........ 0,0-1080,600}",
+    "!!android.widget.TextView{6fd7b9b V.ED..... ........ 0,0-1080,100 app:id/title}",
+    "!!android.widget.TextView{0a0b0c0 V.ED..... ........ 0,100-1080,200}",
+    "!!android.widget.ImageView{1111111 V.ED..... ........ 40,200-140,300}",
+]
+
+
+def rehash(lines):
+    # The same screen from another launch: every identity hash differs
+    return [line.replace(line[line.index('{') + 1:line.index('{') + 8], f"{i:07x}".replace('0', 'f'))
+            for i, line in enumerate(lines)]
+
+
+def index(lines):
+    root = build_tree(lines)
+    return node_matcher.NodeIndex.from_nodes(LeafTable.from_tree(root), node_matcher.node_paths(root),
+                                             node_matcher.screen_size(root))
+
+
+def infos(lines):
+    root = build_tree(lines)
+    paths = node_matcher.node_paths(root)
+    return [{"class_name": node.className, "view_id": node.view_id, "layout_bounds": node.layout_bounds,
+             "path": paths[id(node)]} for node in LeafTable.from_tree(root)]
+
+
+def test_identity_hashes_do_not_veto_matches():
+    night = rehash(DAY)
+    assert [node.view_id for node in LeafTable.from_tree(build_tree(night))] != \
+           [node.view_id for node in LeafTable.from_tree(build_tree(DAY))]
+    assert node_matcher.match_nodes(index(DAY), index(night)) == [(0, 0), (1, 1), (2, 2)]
+    day_infos, night_infos = infos(DAY), infos(night)
+    assert node_matcher.match_infos(day_infos, night_infos) == list(zip(day_infos, night_infos))
+
+
+def test_single_info_with_different_hash():
+    day = {"class_name": "TextView", "view_id": "6fd7b9b", "layout_bounds": "0 0 100 50", "path": "F[0]/TextView[0]"}
+    night = dict(day, view_id="a1b2c3d")
+    assert node_matcher.match_infos([day], [night]) == [(day, night)]
+
+
+def test_shifted_nodes_match_spatially():
+    night = [line.replace("40,200-140,300", "41,201-141,301") for line in rehash(DAY)]
+    # Reordering the siblings changes the paths, the bounds still pair the nodes
+    night[2], night[3] = night[3], night[2]
+    assert node_matcher.match_nodes(index(DAY), index(night)) == [(0, 1), (1, 0), (2, 2)]
+
+
+def test_resource_ids_veto():
+    assert node_matcher.resource_id("app:id/title") == "app:id/title"
+    assert node_matcher.resource_id("android:id/text1") == "android:id/text1"
+    assert node_matcher.resource_id("6fd7b9b") is None
+    day = {"class_name": "TextView", "view_id": "app:id/title", "layout_bounds": "0 0 100 50"}
+    assert node_matcher.match_infos([day], [dict(day, view_id="app:id/subtitle")]) == []
+    assert node_matcher.match_infos([day], [dict(day, view_id="6fd7b9b")]) == [(day, dict(day, view_id="6fd7b9b"))]
+
+
+def test_dense_list_candidates_are_capped():
+    rows = ["android.widget.FrameLayout{1a2b3c4 V.E...... ........ 0,0-1080,1920}"]
+    rows += [f"!android.widget.TextView{{{i:07x} V.ED..... ........ 0,{i * 4}-1080,{i * 4 + 4}}}" for i in range(400)]
+    before = index(rows)
+    assert max(len(c) for c in before.candidates(before.boxes)) <= before.max_candidates
+    assert node_matcher.match_nodes(before, index(rehash(rows))) == [(i, i) for i in range(400)]
+
+
+def test_rotation_does_not_pair_distinct_views_by_position():
+    import main_screenrotation
+    portrait = ["android.widget.FrameLayout{1a2b3c4 V.E...... ........ 0,0-1080,1920}",
+                "!android.widget.TextView{6fd7b9b V.ED..... ........ 0,0-100,192}",
+                "!android.widget.TextView{0a0b0c0 V.ED..... ........ 500,960-600,1152}"]
+    # After the rotation the first view left the edge and the second one sits in its normalized box
+    landscape = ["android.widget.FrameLayout{1a2b3c4 V.E...... ........ 0,0-1920,1080}",
+                 "!android.widget.TextView{6fd7b9b V.ED..... ........ 900,500-1100,600}",
+                 "!android.widget.TextView{0a0b0c0 V.ED..... ........ 0,0-178,108}"]
+    before_root, after_root = build_tree(portrait), build_tree(landscape)
+    before = [node for node in LeafTable.from_tree(before_root) if node.x1 == 0]
+    after = [node for node in LeafTable.from_tree(after_root) if node.x1 == 0]
+    # Spatially the first view pairs with the second one; by path each view keeps its own
+    assert node_matcher.match_nodes(index(portrait), index(landscape)) == [(0, 1)]
+    assert node_matcher.match_nodes(index(portrait), index(landscape), spatial=False) == [(0, 0), (1, 1)]
+    still, moved = main_screenrotation.compare_nodes(before, after, "left", before_root, after_root)
+    assert still == [] and moved == before
@@ -0,0 +1,55 @@
+from run_ledger import RunLedger
+
+ARTIFACTS = ['view_tree.txt', 'font.txt', 'screenshot.png']
+
+
+def write_capture(directory, prefix, names=ARTIFACTS):
+    for name in names:
+        (directory / f"{prefix}_{name}").write_text(prefix)
+
+
+def test_seed_matches_exact_capture_names(tmp_path):
+    # A capture of layout item_list must not count as a capture of layout item
+    write_capture(tmp_path, "ara_proj_item_list_emulator-5554")
+    ledger = RunLedger(str(tmp_path / ".sud_ledger.sqlite"), ARTIFACTS)
+    assert ledger.is_done("ara", "proj_item_list")
+    assert not ledger.is_done("ara", "proj_item")
+    assert not ledger.is_done("ara", "proj")
+    assert not ledger.is_done("1", "proj_item_list")
+    ledger.close()
+
+
+def test_seed_skips_partial_captures_and_records_checksums(tmp_path):
+    write_capture(tmp_path, "1_app_emulator-5554")
+    write_capture(tmp_path, "1_partial_emulator-5554", ARTIFACTS[:1])
+    ledger = RunLedger(str(tmp_path / ".sud_ledger.sqlite"), ARTIFACTS)
+    assert ledger.is_done("1", "app") and not ledger.is_done("1", "partial")
+    assert sorted(ledger.artifacts("1", "app")) == sorted(ARTIFACTS)
+    ledger.close()
+
+
+def test_seed_only_runs_on_an_empty_ledger(tmp_path):
+    path = str(tmp_path / ".sud_ledger.sqlite")
+    ledger = RunLedger(path, ARTIFACTS)
+    ledger.start("1", "other", "emulator-5554")
+    ledger.close()
+    write_capture(tmp_path, "1_app_emulator-5554")
+    ledger = RunLedger(path, ARTIFACTS)
+    assert not ledger.is_done("1", "app")
+    ledger.close()
+
+
+def test_optional_artifacts_do_not_block_done(tmp_path):
+    # Layouts that write no font.txt are done once the view tree and screenshot are recorded
+    required = ['view_tree.txt', 'screenshot.png']
+    write_capture(tmp_path, "1_nofont_emulator-5554", required)
+    write_capture(tmp_path, "1_font_emulator-5554")
+    ledger = RunLedger(str(tmp_path / ".sud_ledger.sqlite"), ARTIFACTS, required_names=required)
+    assert ledger.is_done("1", "nofont") and ledger.is_done("1", "font")
+    assert sorted(ledger.artifacts("1", "font")) == sorted(ARTIFACTS)
+
+    ledger.start("2.5", "nofont", "emulator-5554")
+    assert ledger.finish("2.5", "nofont", "emulator-5554", {name: (name, "0" * 64) for name in required})
+    ledger.start("2.5", "broken", "emulator-5554")
+    assert not ledger.finish("2.5", "broken", "emulator-5554", {"font.txt": ("font.txt", "0" * 64)})
+    ledger.close()
@@ -0,0 +1,256 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+
+# !!android.widget.TextView{6fd7b9b V.ED..... ........ 265,829-755,864 app:id/title}
+LINE_PATTERN = re.compile(r'(!*)([^{]+){([^}]+)}')
+NUMBER_PATTERN = re.compile(r'\d+')
+
+
+class Node:
+    """
+    One line of a view tree dump. The bounds are the last four numbers of the line, kept as ints
+    (None when the line has fewer than four numbers).
+    """
+
+    __slots__ = ('indent', 'className', 'view_id', 'x1', 'y1', 'x2', 'y2', 'children', 'imagePath')
+
+    # Details that are taken as the view id in addition to 7-character ones (e.g. "app:id/")
+    RESOURCE_ID_PREFIXES = ()
+
+    def __init__(self, line):
+        match = LINE_PATTERN.match(line)
+        if match is None:
+            raise ValueError(f"Invalid view tree line: {line!r}")
+        marks, class_name, details = match.groups()
+        self.indent = len(marks)
+        self.className = class_name.strip()
+        # The last matching detail wins
+        self.view_id = None
+        prefixes = self.RESOURCE_ID_PREFIXES
+        for detail in reversed(details.split(' ')):
+            if len(detail) == 7 or (prefixes and detail.startswith(prefixes)):
+                self.view_id = detail
+                break
+        numbers = NUMBER_PATTERN.findall(line)
+        if len(numbers) >= 4:
+            self.x1, self.y1, self.x2, self.y2 = map(int, numbers[-4:])
+        else:
+            self.x1 = self.y1 = self.x2 = self.y2 = None
+        self.children = []
+        self.imagePath = None
+
+    @classmethod
+    def from_fields(cls, indent, className, view_id, bounds):
+        """
+        Build a node from already parsed fields (see load_view_tree) without going through the regexes.
+        """
+        node = cls.__new__(cls)
+        node.indent = indent
+        node.className = className
+        node.view_id = view_id
+        node.x1, node.y1, node.x2, node.y2 = bounds if bounds is not None else (None, None, None, None)
+        node.children = []
+        node.imagePath = None
+        return node
+
+    @property
+    def layout_bounds(self):
+        if self.x1 is None:
+            return None
+        return f"{self.x1} {self.y1} {self.x2} {self.y2}"
+
+    def __repr__(self):
+        return f"{'  ' * self.indent}{self.className} (id: {self.view_id}, bounds: {self.layout_bounds})"
+
+    def get_class_name(self):
+        return self.className
+
+    def get_view_id(self):
+        return self.view_id
+
+    def get_layout_bounds(self):
+        return self.layout_bounds
+
+
+def build_tree(lines, node_class=Node):
+    """
+    Build the tree in one pass. Each node's parent is the closest preceding node with a smaller indent.
+
+    :param lines: Any iterable of lines, e.g. a list or an open file; blank lines are skipped.
+                  An already built root node (e.g. from load_view_tree) is returned as is.
+    :param node_class: Node or a subclass of it.
+    :return: The root node, None for an empty dump.
+    """
+    if isinstance(lines, Node):
+        return lines
+    stack = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        node = node_class(line)
+        if not stack:
+            stack.append(node)
+            continue
+        while len(stack) > 1 and stack[-1].indent >= node.indent:
+            stack.pop()
+        if stack[-1].indent < node.indent:
+            stack[-1].children.append(node)
+            stack.append(node)
+        else:
+            raise ValueError("Invalid tree structure: indentation error.")
+    return stack[0] if stack else None
+
+
+def iter_leaves(root):
+    """
+    Yield the leaves of the tree in document order, without recursion.
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.children:
+            stack.extend(reversed(node.children))
+        else:
+            yield node
+
+
+def find_leaf_nodes(root):
+    # Leaves with a non-empty area
+    return [node for node in iter_leaves(root) if node.x1 != node.x2 and node.y1 != node.y2]
+
+
+def print_tree(node, level=0):
+    print(f"{'  ' * level}{node}")
+    for child in node.children:
+        print_tree(child, level + 1)
+
+
+def read_view_tree_from_file(file_path):
+    """
+    Read the view tree lines from a file.
+
+    :param file_path: Path to the file containing the view tree lines.
+    :return: List of view tree lines.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file]
+
+
+def parse_view_tree_file(file_path, node_class=Node):
+    """
+    Build the tree straight from the file iterator, without holding all lines in memory.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return build_tree(file, node_class)
+
+
+# Parsed trees are cached next to the dump as {file}.tree[-{tag}].npz; bump when the layout changes
+TREE_CACHE_VERSION = 1
+
+
+def tree_cache_path(file_path, node_class=Node):
+    # The id rule of the node class decides the view ids, so each rule gets its own cache file
+    prefixes = node_class.RESOURCE_ID_PREFIXES
+    tag = '-' + hashlib.sha1(repr(prefixes).encode()).hexdigest()[:8] if prefixes else ''
+    return f"{file_path}.tree{tag}.npz"
+
+
+def _flatten(root):
+    # Pre-order rows with the index of each node's parent (-1 for the root)
+    nodes, parents = [], []
+    stack = [(root, -1)]
+    while stack:
+        node, parent = stack.pop()
+        index = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+        stack.extend((child, index) for child in reversed(node.children))
+    return nodes, parents
+
+
+def _save_tree(cache_path, root, size, mtime_ns, digest):
+    nodes, parents = _flatten(root) if root is not None else ([], [])
+    classes, view_ids = {}, {}
+    has_bounds = np.array([node.x1 is not None for node in nodes], dtype=bool)
+    bounds = np.array([(node.x1, node.y1, node.x2, node.y2) if node.x1 is not None else (0, 0, 0, 0)
+                       for node in nodes], dtype=np.int64).reshape(-1, 4)
+    arrays = {
+        'meta': np.array([TREE_CACHE_VERSION, size, mtime_ns], dtype=np.int64),
+        'sha256': np.array(digest),
+        'parent': np.array(parents, dtype=np.int32),
+        'indent': np.array([node.indent for node in nodes], dtype=np.int32),
+        'bounds': bounds,
+        'has_bounds': has_bounds,
+        'class_id': np.array([classes.setdefault(node.className, len(classes)) for node in nodes], dtype=np.int32),
+        # -1 for nodes without a view id
+        'view_index': np.array([-1 if node.view_id is None else view_ids.setdefault(node.view_id, len(view_ids))
+                                for node in nodes], dtype=np.int32),
+        'class_names': np.array(list(classes), dtype=str),
+        'view_ids': np.array(list(view_ids), dtype=str),
+    }
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, cache_path)
+
+
+def _load_tree(data, node_class):
+    class_names = data['class_names'].tolist()
+    view_ids = data['view_ids'].tolist()
+    has_bounds = data['has_bounds'].tolist()
+    bounds = data['bounds'].tolist()
+    nodes = []
+    for i, (parent, indent, class_id, view_index) in enumerate(zip(
+            data['parent'].tolist(), data['indent'].tolist(), data['class_id'].tolist(),
+            data['view_index'].tolist())):
+        node = node_class.from_fields(indent, class_names[class_id], view_ids[view_index] if view_index >= 0 else None,
+                                      bounds[i] if has_bounds[i] else None)
+        if parent >= 0:
+            nodes[parent].children.append(node)
+        nodes.append(node)
+    return nodes[0] if nodes else None
+
+
+def load_view_tree(file_path, node_class=Node, use_cache=True):
+    """
+    Parse a view tree dump, going through the binary cache next to it.
+
+    The cache is used without reading the dump when its size and mtime are unchanged, and after
+    comparing the SHA-256 of the content when only the mtime changed (e.g. a copy or a touch).
+    Otherwise the dump is parsed and the cache rewritten.
+
+    :return: The root node, None for an empty dump.
+    """
+    if not use_cache:
+        return parse_view_tree_file(file_path, node_class)
+
+    cache_path = tree_cache_path(file_path, node_class)
+    st = os.stat(file_path)
+    data = None
+    try:
+        with np.load(cache_path, allow_pickle=False) as npz:
+            data = {name: npz[name] for name in npz.files}
+        version, size, mtime_ns = data['meta'].tolist()
+        if version != TREE_CACHE_VERSION or size != st.st_size:
+            data = None
+        elif mtime_ns == st.st_mtime_ns:
+            return _load_tree(data, node_class)
+    except (OSError, ValueError, KeyError):
+        data = None
+
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if data is not None and str(data['sha256']) == digest:
+        root = _load_tree(data, node_class)
+    else:
+        root = build_tree(content.decode('utf-8').splitlines(), node_class)
+    try:
+        _save_tree(cache_path, root, st.st_size, st.st_mtime_ns, digest)
+    except OSError as e:
+        print(f"Could not write the view tree cache {cache_path}: {e}")
+    return root